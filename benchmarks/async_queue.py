@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# Copyright (C) 2008 LibreSoft
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+
+"""
+Moves N items from a producer thread to a consumer through an
+AsyncQueue, the way LogReader does: one item at a time with the
+consumer polling the producer thread, and in batches with put_many,
+get_many and close(). Bounded and unbounded queues are tried.
+
+Usage: async_queue.py [N]
+"""
+
+import os
+import sys
+import time
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..",
+                                "pycvsanaly2"))
+
+from AsyncQueue import AsyncQueue, TimeOut
+
+BATCH_SIZE = 1024
+
+
+def produce_items(queue, n):
+    for i in xrange(n):
+        queue.put("line %d\n" % i)
+
+
+def consume_items(queue, thread):
+    n = 0
+    while thread.isAlive():
+        try:
+            queue.get(1)
+        except TimeOut:
+            continue
+        n += 1
+
+    while not queue.empty_unlocked():
+        queue.get_unlocked()
+        n += 1
+
+    return n
+
+
+def produce_batches(queue, n):
+    items = []
+    for i in xrange(n):
+        items.append("line %d\n" % i)
+        if len(items) >= BATCH_SIZE:
+            queue.put_many(items)
+            del items[:]
+
+    queue.put_many(items)
+    queue.close()
+
+
+def consume_batches(queue, thread):
+    n = 0
+    items = queue.get_many(BATCH_SIZE)
+    while items:
+        n += len(items)
+        items = queue.get_many(BATCH_SIZE)
+
+    thread.join()
+
+    return n
+
+
+def run(produce, consume, n, maxsize):
+    queue = AsyncQueue(maxsize)
+    start = time.time()
+    thread = threading.Thread(target=produce, args=(queue, n))
+    thread.setDaemon(True)
+    thread.start()
+    assert consume(queue, thread) == n
+
+    return time.time() - start
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2:
+        print __doc__
+        sys.exit(1)
+
+    n = 1000000
+    if len(sys.argv) == 2:
+        n = int(sys.argv[1])
+
+    print "%-8s %-10s %8s %12s" % ("", "queue", "time", "items/s")
+    for name, produce, consume in \
+            (("items", produce_items, consume_items),
+             ("batches", produce_batches, consume_batches)):
+        for maxsize in (0, 64 * 1024):
+            elapsed = run(produce, consume, n, maxsize)
+            print "%-8s %-10s %7.2fs %12.0f" % \
+                (name, maxsize or "unbounded", elapsed, n / elapsed)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# Copyright (C) 2008 LibreSoft
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+
+"""
+Streams SIZE megabytes of synthetic git log like output through
+Command.run, collecting it in memory and handing it line by line to
+parser_out_func, with 1KB reads and with the default read size.
+The output is collected only when it's smaller than 1GB.
+
+Usage: command_output.py [SIZE]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..",
+                                "pycvsanaly2"))
+
+from Command import Command
+
+# Writes about SIZE megabytes of lines of different lengths
+GENERATOR = """
+import sys
+block = "".join(["commit %040x\\n" % i +
+                 "Author: Some One <some.one@example.com>\\n" +
+                 "    " + "x" * (i * 37 % 300) + "\\n" +
+                 "M\\tsrc/module%d/file%d.c\\n" % (i % 50, i)
+                 for i in xrange(2000)])
+size = int(sys.argv[1]) * 1024 * 1024
+while size > 0:
+    sys.stdout.write(block)
+    size -= len(block)
+"""
+
+
+def run(size, read_size, lines):
+    cmd = Command([sys.executable, "-c", GENERATOR, str(size)],
+                  read_size=read_size)
+    start = time.time()
+    if lines:
+        n = [0]
+
+        def new_line(line):
+            n[0] += 1
+        cmd.run(parser_out_func=new_line)
+    else:
+        cmd.run()
+
+    return time.time() - start
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2:
+        print __doc__
+        sys.exit(1)
+
+    size = 2048
+    if len(sys.argv) == 2:
+        size = int(sys.argv[1])
+
+    print "%-8s %-10s %8s %10s" % ("", "read size", "time", "MB/s")
+    for lines in (False, True):
+        if not lines and size >= 1024:
+            continue
+
+        for read_size in (1024, Command.READ_SIZE):
+            elapsed = run(size, read_size, lines)
+            print "%-8s %-10d %7.2fs %10.1f" % \
+                (lines and "lines" or "collect", read_size, elapsed,
+                 size / elapsed)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# Copyright (C) 2008 LibreSoft
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+
+
+"""
+Compares pickle and CommitCodec for N synthetic commits with a few
+actions each: size of the records and time to encode and decode them.
+
+Usage: commit_codec.py [N]
+"""
+
+import os
+import sys
+import time
+import hashlib
+import datetime
+from cPickle import dumps, loads
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..",
+                                "pycvsanaly2"))
+
+from Repository import Commit, Action, Person
+from CommitCodec import encode_commit, decode_commit
+
+
+def make_commits(n):
+    people = []
+    for i in xrange(20):
+        person = Person()
+        person.name = "Developer %d" % (i)
+        person.email = "dev%d@example.org" % (i)
+        people.append(person)
+
+    date = datetime.datetime(2008, 1, 1)
+    commits = []
+    for i in xrange(n):
+        commit = Commit()
+        commit.revision = hashlib.sha1(str(i)).hexdigest()
+        commit.committer = people[i % len(people)]
+        commit.author = people[(i * 7) % len(people)]
+        commit.date = date + datetime.timedelta(minutes=i)
+        commit.message = "Fix bug #%d in module %d\n\nDetails." % (i, i % 30)
+        for j in xrange(i % 5 + 1):
+            action = Action()
+            action.type = "AMD"[j % 3]
+            action.f1 = "src/module%d/file%d.c" % (i % 30, j)
+            action.branch_f1 = "master"
+            action.rev = commit.revision
+            action.added = j * 3
+            action.removed = j
+            commit.actions.append(action)
+        commits.append(commit)
+
+    return commits
+
+
+def run(encode, decode, commits):
+    start = time.time()
+    records = [encode(commit) for commit in commits]
+    encode_time = time.time() - start
+
+    start = time.time()
+    for record in records:
+        decode(record)
+    decode_time = time.time() - start
+
+    return sum([len(record) for record in records]), encode_time, decode_time
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2:
+        print __doc__
+        sys.exit(1)
+
+    n = 200000
+    if len(sys.argv) == 2:
+        n = int(sys.argv[1])
+
+    commits = make_commits(n)
+
+    print "%-12s %10s %10s %10s %10s" % \
+        ("", "size", "per commit", "encode", "decode")
+    for name, encode, decode in \
+            (("pickle", lambda commit: dumps(commit, -1), loads),
+             ("CommitCodec", encode_commit, decode_commit)):
+        size, encode_time, decode_time = run(encode, decode, commits)
+        print "%-12s %8.1fMB %9dB %8d/s %8d/s" % \
+            (name, size / 1048576.0, size / n, n / encode_time,
+             n / decode_time)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# Copyright (C) 2008 LibreSoft
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+
+"""
+Measures how many log lines per second are fed to the parser when
+reading a saved log file line by line (LogReader.start + Parser.feed)
+and in big buffers (LogReader.start_buffered + Parser.feed_buffer).
+
+Usage: feed_log.py LOGFILE
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from pycvsanaly2.Log import LogReader
+from pycvsanaly2.ParserFactory import create_parser_from_logfile
+
+
+def run(logfile, buffered):
+    parser = create_parser_from_logfile(logfile)
+    reader = LogReader()
+    reader.set_logfile(logfile)
+
+    start = time.time()
+    if buffered:
+        def new_buffer(data, parser):
+            parser.feed_buffer(data)
+
+        reader.start_buffered(new_buffer, parser)
+    else:
+        def new_line(line, parser):
+            parser.feed(line)
+
+        reader.start(new_line, parser)
+    parser.end()
+
+    return parser.n_line, time.time() - start
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print __doc__
+        sys.exit(1)
+
+    for name, buffered in (("line by line", False), ("buffered", True)):
+        n_lines, elapsed = run(sys.argv[1], buffered)
+        print "%-14s %10d lines %8.2f s %12.0f lines/s" % \
+            (name, n_lines, elapsed, n_lines / elapsed)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# Copyright (C) 2008 LibreSoft
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+
+"""
+Compares a dict and a RevisionIndex mapping N revisions to commit ids:
+memory used, size of the pickle and time to build, look up and load.
+Git hashes, svn revision numbers and cvs composed revisions are tried.
+
+Usage: revision_index.py [N]
+"""
+
+import os
+import sys
+import time
+import hashlib
+from cPickle import dumps, loads
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..",
+                                "pycvsanaly2"))
+
+from RevisionIndex import RevisionIndex
+
+
+def git_revs(n):
+    return [hashlib.sha1(str(i)).hexdigest() for i in xrange(n)]
+
+
+def svn_revs(n):
+    return [str(i) for i in xrange(1, n + 1)]
+
+
+def cvs_revs(n):
+    return ["1.%d|src/module%d/file%d.c" % (i % 50 + 1, i % 100, i)
+            for i in xrange(n)]
+
+
+def dict_size(d):
+    size = sys.getsizeof(d)
+    for key, value in d.iteritems():
+        size += sys.getsizeof(key) + sys.getsizeof(value)
+
+    return size
+
+
+def index_size(index):
+    return sum([sys.getsizeof(index.data), sys.getsizeof(index.offsets),
+                sys.getsizeof(index.values), sys.getsizeof(index.slots)])
+
+
+def run(cls, revs):
+    start = time.time()
+    cache = cls()
+    for commit_id, rev in enumerate(revs):
+        cache[rev] = commit_id + 1000
+    build = time.time() - start
+
+    start = time.time()
+    for rev in revs:
+        cache[rev]
+    lookup = time.time() - start
+
+    data = dumps(cache, -1)
+    start = time.time()
+    loads(data)
+    load = time.time() - start
+
+    if cls is dict:
+        size = dict_size(cache)
+    else:
+        size = index_size(cache)
+
+    return size, len(data), build, lookup, load
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2:
+        print __doc__
+        sys.exit(1)
+
+    n = 1000000
+    if len(sys.argv) == 2:
+        n = int(sys.argv[1])
+
+    print "%-4s %-13s %10s %10s %8s %8s %8s" % \
+        ("", "", "memory", "pickle", "build", "lookup", "load")
+    for name, revs in (("git", git_revs(n)), ("svn", svn_revs(n)),
+                       ("cvs", cvs_revs(n))):
+        for cls in (dict, RevisionIndex):
+            size, pickled, build, lookup, load = run(cls, revs)
+            print "%-4s %-13s %8.1fMB %8.1fMB %7.2fs %7.2fs %7.2fs" % \
+                (name, cls.__name__, size / 1048576.0, pickled / 1048576.0,
+                 build, lookup, load)
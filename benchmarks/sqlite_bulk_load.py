@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# Copyright (C) 2008 LibreSoft
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+
+
+"""
+Time to store the log of a new repository with N synthetic commits
+in a new SQLite database, with and without the bulk load mode. The
+database is created in the given directory, the current one by
+default, since the cost of syncing depends on the file system.
+
+Usage: sqlite_bulk_load.py [N] [directory]
+"""
+
+import os
+import sys
+import time
+import glob
+import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..",
+                                "pycvsanaly2"))
+
+from Repository import Commit, Action, Person
+from Database import (create_database, DBRepository, statement,
+                      initialize_ids, release_ids)
+from DBContentHandler import DBContentHandler
+from utils import cvsanaly_cache_dir
+
+URI = "svn://bench.example.org/repo"
+
+
+def make_commits(n):
+    people = []
+    for i in xrange(20):
+        person = Person()
+        person.name = "developer%d" % (i)
+        people.append(person)
+
+    date = datetime.datetime(2008, 1, 1)
+    n_files = 0
+    for i in xrange(n):
+        commit = Commit()
+        commit.revision = str(i + 1)
+        commit.committer = people[i % len(people)]
+        commit.date = date + datetime.timedelta(minutes=i)
+        commit.message = "Change %d" % (i)
+        commit.branch = "trunk"
+
+        # A new file every other commit, the rest modify existing ones
+        for j in xrange(i % 4 + 1):
+            action = Action()
+            if j == 0 and i % 2 == 0:
+                action.type = 'A'
+                action.f1 = "/trunk/module%d/file%d.c" % (n_files % 50,
+                                                          n_files)
+                n_files += 1
+            else:
+                action.type = 'M'
+                k = (i * 7 + j * 13) % n_files
+                action.f1 = "/trunk/module%d/file%d.c" % (k % 50, k)
+            action.branch_f1 = "trunk"
+            commit.actions.append(action)
+
+        yield commit
+
+
+def run(filename, n, bulk_load):
+    for path in glob.glob(filename + "*"):
+        os.remove(path)
+    for path in glob.glob(os.path.join(cvsanaly_cache_dir(), "*bench*")):
+        os.remove(path)
+
+    start = time.time()
+
+    db = create_database('sqlite', filename)
+    cnn = db.connect()
+    cursor = cnn.cursor()
+    if bulk_load:
+        db.begin_bulk_load()
+    db.create_tables(cursor)
+    cnn.commit()
+
+    initialize_ids(db)
+    rep = DBRepository(None, URI, "repo", "svn")
+    cursor.execute(statement(DBRepository.__insert__, db.place_holder),
+                   (rep.id, rep.uri, rep.name, rep.type))
+    cnn.commit()
+    cursor.close()
+    cnn.close()
+
+    ch = DBContentHandler(db)
+    ch.begin()
+    ch.repository(URI)
+    for commit in make_commits(n):
+        ch.commit(commit)
+    ch.end()
+    release_ids()
+    parse = time.time() - start
+
+    if bulk_load:
+        db.end_bulk_load()
+    total = time.time() - start
+
+    return parse, total
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 3:
+        print __doc__
+        sys.exit(1)
+
+    n = 50000
+    if len(sys.argv) > 1:
+        n = int(sys.argv[1])
+    directory = "."
+    if len(sys.argv) > 2:
+        directory = sys.argv[2]
+
+    filename = os.path.join(directory, "sqlite_bulk_load.db")
+
+    print "%-10s %10s %10s %12s" % ("", "parse", "total", "commits/s")
+    for name, bulk_load in (("default", False), ("bulk load", True)):
+        parse, total = run(filename, n, bulk_load)
+        print "%-10s %9.2fs %9.2fs %12d" % (name, parse, total, n / total)
+
+    for path in glob.glob(filename + "*"):
+        os.remove(path)
@@ -26,6 +26,14 @@ class TimeOut(Exception):
 
 
 class AsyncQueue(object):
+    """A thread safe queue, bounded to maxsize items if given.
+
+    Items can be moved in batches with put_many and get_many, which
+    take the lock once per batch instead of once per item. When the
+    producer is over it calls close(), get_many then returns the items
+    left and an empty list after them, so consumers don't need to poll
+    the producer thread.
+    """
 
     def __init__(self, maxsize=0):
         self._init(maxsize)
@@ -35,6 +43,7 @@ class AsyncQueue(object):
         self.finish = threading.Condition(self.mutex)
 
         self.pending_items = 0
+        self.closed = False
 
     def done(self):
         self.finish.acquire()
@@ -91,6 +100,35 @@ class AsyncQueue(object):
     def put_unlocked(self, item):
         self._put(item)
 
+    def put_many(self, items):
+        """Puts all the items, waiting for room as needed"""
+        self.full_cond.acquire()
+        try:
+            i = 0
+            n_items = len(items)
+            while i < n_items:
+                while self._full():
+                    self.full_cond.wait()
+
+                n = n_items - i
+                if self.maxsize > 0:
+                    n = min(n, self.maxsize - len(self.queue))
+                self._put_many(items[i:i + n])
+                self.pending_items += n
+                self.empty_cond.notify(n)
+                i += n
+        finally:
+            self.full_cond.release()
+
+    def close(self):
+        """Tells the consumers no more items will be put"""
+        self.mutex.acquire()
+        try:
+            self.closed = True
+            self.empty_cond.notifyAll()
+        finally:
+            self.mutex.release()
+
     def get(self, timeout=None):
         self.empty_cond.acquire()
         try:
@@ -116,6 +154,32 @@ class AsyncQueue(object):
     def get_unlocked(self):
         return self._get()
 
+    def get_many(self, max_items, timeout=None):
+        """Returns a list with up to max_items items, waiting for at
+        least one. Once the queue is closed and there are no items
+        left, an empty list is returned"""
+        self.empty_cond.acquire()
+        try:
+            if timeout is None:
+                while self._empty() and not self.closed:
+                    self.empty_cond.wait()
+            else:
+                if timeout < 0:
+                    raise ValueError("'timeout' must be a positive number")
+                endtime = _time() + timeout
+                while self._empty() and not self.closed:
+                    remaining = endtime - _time()
+                    if remaining <= 0.0:
+                        raise TimeOut
+                    self.empty_cond.wait(remaining)
+
+            items = self._get_many(max_items)
+            if items:
+                self.full_cond.notify(len(items))
+            return items
+        finally:
+            self.empty_cond.release()
+
     # Queue implementation
     def _init(self, maxsize):
         self.maxsize = maxsize
@@ -133,6 +197,19 @@ class AsyncQueue(object):
     def _get(self):
         return self.queue.popleft()
 
+    def _put_many(self, items):
+        self.queue.extend(items)
+
+    def _get_many(self, max_items):
+        queue = self.queue
+        if len(queue) <= max_items:
+            items = list(queue)
+            queue.clear()
+            return items
+
+        popleft = queue.popleft
+        return [popleft() for i in xrange(max_items)]
+
 if __name__ == '__main__':
     def worker(q):
         while True:
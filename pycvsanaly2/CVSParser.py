@@ -21,10 +21,15 @@
 
 import re
 import datetime
+from collections import deque
+from multiprocessing import Pool
 
 from Parser import Parser
 from ContentHandler import ContentHandler
 from Repository import Commit, Action, Person
+from CommitCodec import encode_commit, decode_commit
+from Config import Config
+from utils import printdbg
 
 
 class CVSParser(Parser):
@@ -43,6 +48,10 @@ class CVSParser(Parser):
     """
 
     CONTENT_ORDER = ContentHandler.ORDER_FILE
+
+    # Number of RCS files in every chunk of the log
+    # handed to a worker process when parsing in parallel
+    PARALLEL_CHUNK_SIZE = 500
     
     patterns = {}
     patterns['file'] = re.compile("^RCS file: (.*)$")
@@ -58,11 +67,22 @@ class CVSParser(Parser):
     patterns['rev-separator'] = re.compile("^[-]+$")
     patterns['file-separator'] = re.compile("^[=]+$")
     
-    def __init__(self):
+    def __init__(self, jobs=None):
         Parser.__init__(self)
 
         self.root_path = ""
         self.lines = {}
+
+        # Every RCS file section of the log is independent, so they
+        # can be parsed in worker processes. Commits are sorted by
+        # date afterwards anyway (ORDER_FILE)
+        if jobs is None:
+            jobs = Config().parse_jobs
+        self.jobs = jobs
+        self.pool = None
+        self.pending = deque()
+        self.chunk = []
+        self.n_files = 0
         
         # Parser context
         self.file = None
@@ -91,7 +111,60 @@ class CVSParser(Parser):
             self.handler.commit(self.commit)
             self.commit = None
             
+    def __dispatch_chunk(self):
+        if not self.chunk:
+            return
+
+        if self.pool is None:
+            printdbg("CVSParser: parsing the log with %d processes", 
+                     (self.jobs,))
+            self.pool = Pool(self.jobs)
+
+        self.pending.append(self.pool.apply_async(
+            _parse_log_chunk, ((self.root_path, "\n".join(self.chunk)),)))
+        self.chunk = []
+        self.n_files = 0
+
+        # Don't let the log reader get too far ahead of the workers
+        while self.pending and \
+              (self.pending[0].ready() or len(self.pending) > 2 * self.jobs):
+            self.__handle_chunk_result(self.pending.popleft())
+
+    def __handle_chunk_result(self, result):
+        commits, lines = result.get()
+        for data in commits:
+            self.handler.commit(decode_commit(data))
+        self.lines.update(lines)
+
+    def feed_lines(self, lines):
+        if self.jobs <= 1:
+            Parser.feed_lines(self, lines)
+            return
+
+        if self.n_line == 0:
+            self._begin()
+
+        for line in lines:
+            self.n_line += 1
+            if line.startswith("RCS file: "):
+                self.n_files += 1
+                if self.n_files > self.PARALLEL_CHUNK_SIZE:
+                    self.__dispatch_chunk()
+                    self.n_files = 1
+            self.chunk.append(line)
+
     def flush(self):
+        if self.jobs > 1:
+            self.__dispatch_chunk()
+            while self.pending:
+                self.__handle_chunk_result(self.pending.popleft())
+
+            if self.pool is not None:
+                self.pool.close()
+                self.pool.join()
+                self.pool = None
+            return
+
         self._handle_commit()
         if self.file is not None:
             self.handler.file(self.file)
@@ -285,3 +358,28 @@ class CVSParser(Parser):
                 self.commit.message += self.file_separator + '\n'
                 self.file_separator = None
             self.commit.message += line + '\n'
+
+
+class _CommitCollector(ContentHandler):
+    """Collects the commits of a chunk encoded by CommitCodec, ready
+    to be sent back to the parent process"""
+
+    def __init__(self):
+        ContentHandler.__init__(self)
+        self.commits = []
+
+    def commit(self, commit):
+        self.commits.append(encode_commit(commit))
+
+
+def _parse_log_chunk(args):
+    root_path, data = args
+
+    parser = CVSParser(jobs=1)
+    parser.root_path = root_path
+    handler = _CommitCollector()
+    parser.set_content_handler(handler)
+    parser.feed(data)
+    parser.flush()
+
+    return handler.commits, parser.lines
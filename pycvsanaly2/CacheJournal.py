@@ -0,0 +1,253 @@
+# Copyright (C) 2008 LibreSoft
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors :
+#       Carlos Garcia Campos <carlosgc@gsyc.escet.urjc.es>
+
+import os
+import struct
+import zlib
+from cPickle import dumps, loads, dump, load
+
+from utils import printdbg, printout
+
+
+class WatchedDict(dict):
+    """A dict that reports its changes to the watch callback"""
+
+    def __init__(self, *args):
+        dict.__init__(self, *args)
+        self.watch = None
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        if self.watch is not None:
+            self.watch('set', key, value)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        if self.watch is not None:
+            self.watch('del', key, None)
+
+    def __reduce__(self):
+        # The callback is not part of the contents
+        return (WatchedDict, (), None, None, self.iteritems())
+
+
+class CacheJournal(object):
+    """Crash safe storage for a list of caches.
+
+    The caches are stored as a checkpoint, a pickle of all of them,
+    plus an append-only journal with the changes made after the
+    checkpoint. Changes are recorded as they happen and written to the
+    journal in batches tagged with an increasing number, the id of the
+    last commit of the batch. Every batch is framed by its length and a
+    checksum, so a batch partially written when the process died is
+    detected and thrown away. Batches with a tag greater than the given
+    one on load are thrown away too, they weren't committed to the
+    database. Once the database transaction including the batches is
+    committed, maybe_checkpoint() writes a new checkpoint if the journal
+    grew over CHECKPOINT_SIZE bytes, and the journal starts again from
+    scratch. A checkpoint with a tag greater than the given one on load
+    has changes the database doesn't have, so it's thrown away with the
+    journal and the caches are rebuilt from scratch.
+
+    This makes the caches crash safe, it doesn't make them smaller: they
+    are held in memory, and load() unpickles the whole checkpoint, so
+    resuming takes as long as loading the caches always did.
+
+    The caches must be WatchedDict, PathCache or RevisionIndex objects.
+    """
+
+    CHECKPOINT_SIZE = 64 * 1024 * 1024
+
+    HEADER = struct.Struct("<Ii")
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.journal_filename = filename + ".journal"
+
+        self.caches = None
+        self.tag = 0
+        self.pending = []
+        self.fd = None
+        self.size = 0
+
+    def exists(self):
+        return os.path.isfile(self.filename) or \
+            os.path.isfile(self.journal_filename)
+
+    def __record(self, index, op, key, value):
+        self.pending.append((index, op, key, value))
+
+    def __watch(self, caches):
+        def watch_cache(index):
+            def watch(op, key, value):
+                self.__record(index, op, key, value)
+            return watch
+
+        for i, cache in enumerate(caches):
+            cache.watch = watch_cache(i)
+
+        self.caches = caches
+
+    def __apply(self, ops):
+        for index, op, key, value in ops:
+            cache = self.caches[index]
+            if op == 'set':
+                cache[key] = value
+            elif op == 'del':
+                del cache[key]
+            elif op == 'pop_subtree':
+                cache.pop_subtree(key)
+
+    def __read_journal(self, max_tag):
+        """Replays the batches of the journal, and returns the offset
+        where the valid batches end"""
+        f = open(self.journal_filename, "rb")
+        offset = 0
+        size = self.HEADER.size
+        while True:
+            header = f.read(size)
+            if len(header) < size:
+                break
+
+            length, checksum = self.HEADER.unpack(header)
+            data = f.read(length)
+            if len(data) < length or zlib.crc32(data) != checksum:
+                printdbg("CacheJournal: discarding broken batch at %d",
+                         (offset,))
+                break
+
+            tag, ops = loads(data)
+            if tag <= self.tag:
+                # Already in the checkpoint
+                offset += size + length
+                continue
+            if max_tag is None or tag > max_tag:
+                printdbg("CacheJournal: discarding uncommitted batch %d",
+                         (tag,))
+                break
+
+            self.__apply(ops)
+            self.tag = tag
+            offset += size + length
+
+        f.close()
+
+        return offset
+
+    def load(self, templates, max_tag=None):
+        """Loads the caches from disk and returns them. templates is
+        the list of empty caches to use when there's nothing on disk,
+        the loaded caches are of the same types. The returned caches
+        are watched from now on. Batches with a tag greater than
+        max_tag are discarded.
+        """
+        caches = templates
+        self.tag = 0
+        if os.path.isfile(self.filename):
+            printdbg("CacheJournal: loading checkpoint %s", (self.filename,))
+            f = open(self.filename, "rb")
+            obj = load(f)
+            f.close()
+
+            if isinstance(obj, tuple):
+                self.tag, caches = obj
+            else:
+                # Plain list of caches saved before the journal existed
+                caches = obj
+
+            if self.tag > (max_tag or 0):
+                printout("Cache file %s is ahead of the database " + \
+                         "(%d > %s), discarding it",
+                         (self.filename, self.tag, max_tag))
+                self.remove()
+                caches = templates
+                self.tag = 0
+
+        self.caches = []
+        for cache, template in zip(caches, templates):
+            if not isinstance(cache, type(template)):
+                # Caches saved as plain dicts
+                cache = type(template)(cache)
+            self.caches.append(cache)
+
+        offset = 0
+        if os.path.isfile(self.journal_filename):
+            printdbg("CacheJournal: replaying journal %s",
+                     (self.journal_filename,))
+            offset = self.__read_journal(max_tag)
+
+        self.__watch(self.caches)
+
+        self.fd = open(self.journal_filename, "ab")
+        self.fd.truncate(offset)
+        self.size = offset
+
+        return self.caches
+
+    def commit(self, tag):
+        """Writes the changes recorded so far as a batch with the
+        given tag"""
+        if not self.pending:
+            return
+
+        data = dumps((tag, self.pending), -1)
+        self.fd.write(self.HEADER.pack(len(data), zlib.crc32(data)))
+        self.fd.write(data)
+        self.fd.flush()
+
+        self.tag = tag
+        self.pending = []
+        self.size += self.HEADER.size + len(data)
+
+    def maybe_checkpoint(self):
+        """Writes a checkpoint if the journal is too big. It must be
+        called only once the batches written are committed to the
+        database, a checkpoint can't be partially discarded"""
+        if self.size >= self.CHECKPOINT_SIZE:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Writes all the caches to the checkpoint and empties the
+        journal"""
+        printdbg("CacheJournal: writing checkpoint %s (tag %d)",
+                 (self.filename, self.tag))
+        tmp_filename = self.filename + ".tmp"
+        f = open(tmp_filename, "wb")
+        dump((self.tag, self.caches), f, -1)
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+        os.rename(tmp_filename, self.filename)
+
+        # Batches left in the journal if we die right here
+        # are skipped on load, they are older than the checkpoint
+        self.fd.truncate(0)
+        self.size = 0
+
+    def close(self):
+        if self.fd is not None:
+            self.fd.close()
+            self.fd = None
+
+    def remove(self):
+        self.close()
+
+        for filename in (self.filename, self.journal_filename):
+            if os.path.isfile(filename):
+                os.remove(filename)
@@ -52,12 +52,21 @@ class CommandTimeOut(Exception):
 class Command(object):
 
     SELECT_TIMEOUT = 2
+
+    # Bytes read from the pipes at once
+    READ_SIZE = 64 * 1024
+    # Bytes written to stdin at once, writing at most PIPE_BUF
+    # bytes to a pipe ready for writing never blocks
+    WRITE_SIZE = getattr(select, 'PIPE_BUF', 512)
     
-    def __init__(self, command, cwd=None, env=None, error_handler_func=None):
+    def __init__(self, command, cwd=None, env=None, error_handler_func=None,
+                 read_size=None):
         self.cmd = command
         self.cwd = cwd
         self.env = env
         self.error_handler_func = error_handler_func
+        if read_size is not None:
+            self.READ_SIZE = read_size
 
         self.process = None
 
@@ -84,6 +93,30 @@ class Command(object):
                 else:
                     raise
 
+    def _wait_for_pipes(self, poller, read_set, write_set):
+        """Waits up to SELECT_TIMEOUT seconds for the pipes, returns
+        the lists of pipes ready to be read and written. poll is used
+        when available, select otherwise"""
+        if poller is None:
+            rlist, wlist, xlist = select.select(read_set, write_set, [],
+                                                self.SELECT_TIMEOUT)
+            return rlist, wlist
+
+        pipes = dict([(pipe.fileno(), pipe) for pipe in read_set + write_set])
+        rlist = []
+        wlist = []
+        for fd, event in poller.poll(self.SELECT_TIMEOUT * 1000):
+            pipe = pipes.get(fd)
+            if pipe is None:
+                continue
+            # Errors and hang ups are found when reading or writing
+            if pipe in write_set:
+                wlist.append(pipe)
+            else:
+                rlist.append(pipe)
+
+        return rlist, wlist
+
     def _read_from_pipes(self, stdin=None, out_data_cb=None, err_data_cb=None, 
                          timeout=None):
         p = self.process
@@ -95,15 +128,18 @@ class Command(object):
         if stdin is not None:
             write_set.append(p.stdin)
 
-        if out_data_cb is None:
-            out_data = ""
-        else:
-            out_data = None
+        poller = None
+        if hasattr(select, 'poll'):
+            poller = select.poll()
+            for pipe in read_set:
+                poller.register(pipe, select.POLLIN | select.POLLPRI)
+            for pipe in write_set:
+                poller.register(pipe, select.POLLOUT)
 
-        if err_data_cb is None:
-            err_data = ""
-        else:
-            err_data = None
+        # Output is collected in lists of chunks
+        # and joined once the command is over
+        out_data = []
+        err_data = []
 
         if timeout is not None:
             elapsed = 0.0
@@ -112,8 +148,8 @@ class Command(object):
         try:
             while read_set or write_set:
                 try:
-                    rlist, wlist, xlist = select.select(read_set, write_set, 
-                                            [], self.SELECT_TIMEOUT)
+                    rlist, wlist = self._wait_for_pipes(poller, read_set,
+                                                        write_set)
                 except select.error, e:
                     # Ignore interrupted system call, reraise anything else
                     if e.args[0] == errno.EINTR:
@@ -124,9 +160,11 @@ class Command(object):
                     if err_data:
                         handled = False
                         if self.error_handler_func is not None:
-                            handled = self.error_handler_func(self, err_data)
+                            handled = self.error_handler_func(self, 
+                                                          "".join(err_data))
                         if not handled:
-                            raise CommandRunningError(self.cmd, err_data)
+                            raise CommandRunningError(self.cmd, 
+                                                      "".join(err_data))
                     if timeout is not None:
                         elapsed += self.SELECT_TIMEOUT
                         if elapsed >= timeout:
@@ -141,32 +179,35 @@ class Command(object):
                 if p.stdin in wlist:
                     bytes_written = self._write(p.stdin.fileno(), 
                                                 buffer(stdin, input_offset, 
-                                                       512))
+                                                       self.WRITE_SIZE))
                     input_offset += bytes_written
                     if input_offset >= len(stdin):
+                        if poller is not None:
+                            poller.unregister(p.stdin)
                         p.stdin.close()
                         write_set.remove(p.stdin)
                 
                 if p.stdout in rlist:
-                    out_chunk = self._read(p.stdout.fileno(), 1024)
+                    out_chunk = self._read(p.stdout.fileno(), self.READ_SIZE)
                     if out_chunk == "":
+                        if poller is not None:
+                            poller.unregister(p.stdout)
                         p.stdout.close()
                         read_set.remove(p.stdout)
-
-                    if out_data_cb is None:
-                        out_data += out_chunk
+                    elif out_data_cb is None:
+                        out_data.append(out_chunk)
                     else:
                         out_data_cb[0](out_chunk, out_data_cb[1])
                     
                 if p.stderr in rlist:
-                    err_chunk = self._read(p.stderr.fileno(), 1024)
-                    
+                    err_chunk = self._read(p.stderr.fileno(), self.READ_SIZE)
                     if err_chunk == "":
+                        if poller is not None:
+                            poller.unregister(p.stderr)
                         p.stderr.close()
                         read_set.remove(p.stderr)
-
-                    if err_data_cb is None:
-                        err_data += err_chunk
+                    elif err_data_cb is None:
+                        err_data.append(err_chunk)
                     else:
                         err_data_cb[0](err_chunk, err_data_cb[1])
                     
@@ -178,40 +219,78 @@ class Command(object):
 
         ret = p.wait()
         self.process = None
+
+        if out_data_cb is None:
+            out_data = "".join(out_data)
+        else:
+            out_data = None
+
+        if err_data_cb is None:
+            err_data = "".join(err_data)
+        else:
+            err_data = None
         
         return out_data, err_data, ret
 
+    def _split_lines(self, line_func):
+        """Returns a callback for _read_from_pipes handing the data to
+        line_func one line at a time, and a function handing it the
+        data left once the output is over"""
+        pending = []
+
+        def data_cb(chunk, user_data=None):
+            pos = chunk.find('\n')
+            if pos < 0:
+                # Long lines are joined only once they're complete
+                pending.append(chunk)
+                return
+
+            if pending:
+                pending.append(chunk[:pos + 1])
+                line_func("".join(pending))
+                del pending[:]
+            else:
+                line_func(chunk[:pos + 1])
+
+            start = pos + 1
+            pos = chunk.find('\n', start)
+            while pos >= 0:
+                line_func(chunk[start:pos + 1])
+                start = pos + 1
+                pos = chunk.find('\n', start)
+
+            if start < len(chunk):
+                pending.append(chunk[start:])
+
+        def flush():
+            # Output not terminated by a new line
+            if pending:
+                line_func("".join(pending))
+                del pending[:]
+
+        return data_cb, flush
+
     def _run_with_callbacks(self, stdin=None, parser_out_func=None, 
                             parser_error_func=None, timeout=None):
         out_func = err_func = None
-        
-        def out_cb(out_chunk, out_data_l):
-            out_data = out_data_l[0]
-            out_data += out_chunk
-            while '\n' in out_data:
-                pos = out_data.find('\n')
-                parser_out_func(out_data[:pos + 1])
-                out_data = out_data[pos + 1:]
-            out_data_l[0] = out_data
-
-        def err_cb(err_chunk, err_data_l):
-            err_data = err_data_l[0]
-            err_data += err_chunk
-            while '\n' in err_data:
-                pos = err_data.find('\n')
-                parser_error_func(err_data[:pos + 1])
-                err_data = err_data[pos + 1:]
-            err_data_l[0] = err_data
+        out_flush = err_flush = None
 
         if parser_out_func is not None:
-            out_data = [""]
-            out_func = (out_cb, out_data)
+            out_cb, out_flush = self._split_lines(parser_out_func)
+            out_func = (out_cb, None)
 
         if parser_error_func is not None:
-            err_data = [""]
-            err_func = (err_cb, err_data)
+            err_cb, err_flush = self._split_lines(parser_error_func)
+            err_func = (err_cb, None)
         
-        return self._read_from_pipes(stdin, out_func, err_func, timeout)
+        retval = self._read_from_pipes(stdin, out_func, err_func, timeout)
+
+        if out_flush is not None:
+            out_flush()
+        if err_flush is not None:
+            err_flush()
+
+        return retval
 
     def _get_process(self):
         if self.process is not None:
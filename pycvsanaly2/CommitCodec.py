@@ -0,0 +1,113 @@
+# Copyright (C) 2008 LibreSoft
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors :
+#       Carlos Garcia Campos <carlosgc@gsyc.escet.urjc.es>
+
+
+import marshal
+import datetime
+from cPickle import loads
+
+from Repository import Commit, Action, Person
+
+# Bumped whenever the layout of the records changes
+VERSION = 1
+_VERSION_TAG = chr(VERSION)
+
+# marshal format version, fixed so that records don't depend
+# on the python version
+_MARSHAL_VERSION = 2
+
+_PICKLE_TAG = '\x80'
+
+
+def _encode_person(person):
+    if person is None:
+        return None
+
+    return person.name, person.email
+
+
+def _decode_person(data):
+    if data is None:
+        return None
+
+    person = Person()
+    person.name, person.email = data
+
+    return person
+
+
+def encode_commit(commit):
+    """Returns commit encoded as a string.
+
+    The record is a version byte followed by a marshal dump of the
+    commit fields as plain tuples, which is much smaller and faster to
+    build and read than a pickle of the objects.
+
+    >>> commit = Commit()
+    >>> commit.revision = '25'
+    >>> commit.date = datetime.datetime(2008, 5, 12, 11, 32, 5)
+    >>> action = Action()
+    >>> action.type, action.f1, action.branch_f1 = 'M', '/trunk/foo', 'trunk'
+    >>> commit.actions.append(action)
+    >>> copy = decode_commit(encode_commit(commit))
+    >>> copy == commit, copy.date, copy.actions == commit.actions
+    (True, datetime.datetime(2008, 5, 12, 11, 32, 5), True)
+    """
+    date = commit.date
+    if date is not None:
+        date = (date.year, date.month, date.day, date.hour, date.minute,
+                date.second, date.microsecond)
+
+    actions = [(action.type, action.branch_f1, action.branch_f2,
+                action.f1, action.f2, action.rev, action.added,
+                action.removed) for action in commit.actions]
+
+    return _VERSION_TAG + marshal.dumps(
+        (commit.revision, _encode_person(commit.committer),
+         _encode_person(commit.author), date, actions, commit.branch,
+         commit.tags, commit.message, commit.composed_rev),
+        _MARSHAL_VERSION)
+
+
+def decode_commit(data):
+    """Returns the commit encoded in data by encode_commit. Commits
+    pickled by older versions are accepted too."""
+    tag = data[0]
+    if tag == _PICKLE_TAG:
+        return loads(data)
+    if tag != _VERSION_TAG:
+        raise ValueError("Unknown commit record version %d" % (ord(tag),))
+
+    commit = Commit()
+    (commit.revision, committer, author, date, actions, commit.branch,
+     commit.tags, commit.message, commit.composed_rev) = \
+        marshal.loads(data[1:])
+
+    commit.committer = _decode_person(committer)
+    commit.author = _decode_person(author)
+    if date is not None:
+        commit.date = datetime.datetime(*date)
+
+    for fields in actions:
+        action = Action()
+        (action.type, action.branch_f1, action.branch_f2, action.f1,
+         action.f2, action.rev, action.added, action.removed) = fields
+        commit.actions.append(action)
+
+    return commit
@@ -48,6 +48,15 @@ class Config(object):
                       'metrics_noerr': False,
                       # Threading options
                       'max_threads': 10,
+                      # Number of processes used to parse the log
+                      'parse_jobs': 1,
+                      # Number of repositories analyzed at the same time
+                      'jobs': 1,
+                      # Worker processes for the jobs of every extension,
+                      # '*' for all of them. Jobs run in threads otherwise
+                      'job_processes': {},
+                      # Store lines added and removed by every action
+                      'action_lines': False,
                       # Content options
                       'no_content': False,
                       # File count extension options
@@ -161,6 +170,22 @@ class Config(object):
             self.max_threads = config.max_threads
         except:
             pass
+        try:
+            self.parse_jobs = config.parse_jobs
+        except:
+            pass
+        try:
+            self.jobs = config.jobs
+        except:
+            pass
+        try:
+            self.job_processes = config.job_processes
+        except:
+            pass
+        try:
+            self.action_lines = config.action_lines
+        except:
+            pass
         try:
             self.bug_fix_regexes = config.bug_fix_regexes
         except:
@@ -20,10 +20,15 @@
 
 class ContentHandler(object):
 
+    # ORDER_REVISION: commits come newest first
+    # ORDER_FILE: commits come grouped by file (CVS)
+    # ORDER_REVISION_ASC: commits come oldest first, so they
+    #   can be stored as they come without any reordering
     (
         ORDER_REVISION,
-        ORDER_FILE
-    ) = range(2)
+        ORDER_FILE,
+        ORDER_REVISION_ASC
+    ) = range(3)
 
     def __init__(self):
         pass
@@ -21,12 +21,15 @@ import os
 import re
 
 from ContentHandler import ContentHandler
+from PathCache import PathCache
+from RevisionIndex import RevisionIndex
+from CacheJournal import CacheJournal, WatchedDict
 from Database import (DBRepository, DBLog, DBFile, DBFileLink, DBFilePath,
-                      DBAction, DBFileCopy, DBBranch, DBPerson, DBTag,
-                      DBTagRev, statement)
+                      DBAction, DBActionLines, DBFileCopy, DBBranch,
+                      DBPerson, DBTag, DBTagRev, statement)
+from Config import Config
 from profile import profiler_start, profiler_stop
 from utils import printdbg, printout, to_utf8, cvsanaly_cache_dir
-from cPickle import dump, load
 
 
 class FileNotInCache(Exception):
@@ -37,9 +40,68 @@ class CacheFileMismatch(Exception):
     '''File cache doesn't match with the Database'''
 
 
+class BufferedWriter(object):
+    """Accumulates the rows to be inserted in the database, and inserts
+       them with one insert_many per table when flushed. Tables are
+       flushed in the order given. The number of statements issued is
+       kept in n_statements.
+    """
+
+    def __init__(self, db, tables):
+        self.db = db
+        self.tables = tables
+        self.rows = dict((table, []) for table in tables)
+        self.n_rows = 0
+        self.n_statements = 0
+
+    def __len__(self):
+        return self.n_rows
+
+    def add(self, table, row):
+        self.rows[table].append(row)
+        self.n_rows += 1
+
+    def discard(self, table, ids):
+        """Drops the rows of table whose id is in ids"""
+        rows = self.rows[table]
+        kept = [row for row in rows if row[0] not in ids]
+        self.n_rows -= len(rows) - len(kept)
+        self.rows[table] = kept
+
+    def replace(self, table, column, ids):
+        """Replaces the values of column in the rows of table that
+           are keys of ids by the value they map to"""
+        rows = self.rows[table]
+        for i, row in enumerate(rows):
+            if row[column] in ids:
+                row = list(row)
+                row[column] = ids[row[column]]
+                rows[i] = tuple(row)
+
+    def flush(self, cursor):
+        for table in self.tables:
+            rows = self.rows[table]
+            if not rows:
+                continue
+
+            profiler_start("Inserting %d rows (%s)",
+                           (len(rows), table.__name__))
+            self.n_statements += self.db.insert_many(cursor,
+                                                     table.__insert__, rows)
+            profiler_stop("Inserting %d rows (%s)",
+                          (len(rows), table.__name__), True)
+            self.rows[table] = []
+
+        self.n_rows = 0
+
+
 class DBContentHandler(ContentHandler):
 
-    MAX_ACTIONS = 100
+    MAX_ROWS = 1000
+
+    # Columns of the rows referring to the people and tags
+    NAME_REFS = {DBPerson: [(DBLog, 2), (DBLog, 3)],
+                 DBTag: [(DBTagRev, 1)]}
 
     def __init__(self, db):
         ContentHandler.__init__(self)
@@ -47,48 +109,76 @@ class DBContentHandler(ContentHandler):
         self.db = db
         self.cnn = None
         self.cursor = None
+        self.journal = None
 
         self.__init_caches()
 
     def __init_caches(self):
-        self.file_cache = {}
-        self.moves_cache = {}
-        self.deletes_cache = {}
-        self.revision_cache = {}
-        self.branch_cache = {}
-        self.tags_cache = {}
-        self.people_cache = {}
-
-    def __save_caches_to_disk(self):
-        printdbg("DBContentHandler: Saving caches to disk (%s)",
-                 (self.cache_file,))
-        cache = [self.file_cache, self.moves_cache, self.deletes_cache,
-                 self.revision_cache, self.branch_cache, self.tags_cache,
-                 self.people_cache]
-        f = open(self.cache_file, 'w')
-        dump(cache, f, -1)
-        f.close()
-
-    def __load_caches_from_disk(self):
+        self.file_cache = PathCache()
+        self.moves_cache = PathCache()
+        self.deletes_cache = PathCache()
+        self.revision_cache = RevisionIndex()
+        self.branch_cache = WatchedDict()
+        self.tags_cache = WatchedDict()
+        self.people_cache = WatchedDict()
+
+    def __load_caches_from_disk(self, last_commit):
         printdbg("DBContentHandler: Loading caches from disk (%s)",
                  (self.cache_file,))
-        f = open(self.cache_file, 'r')
+        caches = [self.file_cache, self.moves_cache, self.deletes_cache,
+                  self.revision_cache, self.branch_cache, self.tags_cache,
+                  self.people_cache]
         (self.file_cache, self.moves_cache, self.deletes_cache,
          self.revision_cache, self.branch_cache, self.tags_cache,
-         self.people_cache) = load(f)
-        f.close()
+         self.people_cache) = self.journal.load(caches, last_commit)
 
     def __del__(self):
         if self.cnn is not None:
             self.cnn.close()
+        if self.journal is not None:
+            self.journal.close()
 
     def begin(self, order=None):
         self.cnn = self.db.connect()
 
         self.cursor = self.cnn.cursor()
 
-        self.commits = []
-        self.actions = []
+        self.writer = BufferedWriter(self.db,
+                                     [DBPerson, DBBranch, DBTag, DBLog,
+                                      DBFile, DBFileLink, DBFilePath,
+                                      DBAction, DBActionLines, DBFileCopy,
+                                      DBTagRev])
+        self.last_commit = None
+        self.n_commits = 0
+
+        # Other processes might be adding names at the same time
+        self.shared_names = Config().jobs > 1
+        self.new_names = {DBPerson: {}, DBTag: {}}
+        self.__load_names()
+
+    def __load_names(self):
+        """Loads the ids of the people, branches and tags already in
+           the database, so that looking them up doesn't require a
+           query. These tables are shared by all the repositories, when
+           several of them are analyzed at the same time, new names are
+           claimed with db.claim_names() so only one process inserts them.
+        """
+        profiler_start("Loading people, branches and tags")
+        self.people_ids = {}
+        self.branch_ids = {}
+        self.tag_ids = {}
+
+        cursor = self.cursor
+        for table, ids in (("people", self.people_ids),
+                           ("branches", self.branch_ids),
+                           ("tags", self.tag_ids)):
+            # Names might be repeated, the first id wins
+            cursor.execute(statement(
+                "SELECT id, name from %s order by id desc" % (table),
+                self.db.place_holder))
+            for id, name in cursor.fetchall():
+                ids[to_utf8(name)] = id
+        profiler_stop("Loading people, branches and tags", delete=True)
 
     def repository(self, uri):
         cursor = self.cursor
@@ -107,10 +197,11 @@ class DBContentHandler(ContentHandler):
 
         filename = uri.replace('/', '_')
         self.cache_file = os.path.join(cvsanaly_cache_dir(), filename)
+        self.journal = CacheJournal(self.cache_file)
 
         # if there's a previous cache file, just use it
-        if os.path.isfile(self.cache_file):
-            self.__load_caches_from_disk()
+        if self.journal.exists():
+            self.__load_caches_from_disk(last_commit)
 
             if last_rev is not None:
                 try:
@@ -139,8 +230,9 @@ class DBContentHandler(ContentHandler):
                 # Database looks empty (or corrupt) and we have
                 # a cache file. We can just remove it and continue
                 # normally
+                self.journal.remove()
                 self.__init_caches()
-                os.remove(self.cache_file)
+                self.__load_caches_from_disk(None)
                 printout("Database looks empty, removing cache file %s",
                          (self.cache_file,))
         elif last_rev is not None:
@@ -153,67 +245,56 @@ class DBContentHandler(ContentHandler):
                 "It's not possible to continue, the database ",
                 "should be cleaned up"])
             raise CacheFileMismatch(msg)
+        else:
+            self.__load_caches_from_disk(None)
 
     def __insert_many(self):
-        if not self.actions and not self.commits:
+        if not self.writer:
             return
 
-        cursor = self.cursor
+        # Write the cache changes down before the rows they refer to,
+        # changes of commits missing in the database are discarded
+        # when loading the caches
+        if self.shared_names:
+            self.__claim_names()
+
+        if self.last_commit is not None:
+            self.journal.commit(self.last_commit)
 
-        if self.actions:
-            actions = [(a.id, a.type, a.file_id, a.commit_id, a.branch_id) \
-                       for a in self.actions]
-            profiler_start("Inserting actions for repository %d",
-                           (self.repo_id,))
-            cursor.executemany(statement(DBAction.__insert__,
-                                         self.db.place_holder), actions)
-            self.actions = []
-            profiler_stop("Inserting actions for repository %d",
-                          (self.repo_id,))
-        if self.commits:
-            commits = [(c.id, c.rev, c.committer, c.author, c.date, \
-                        to_utf8(c.message).decode("utf-8"), c.composed_rev, \
-                        c.repository_id) for c in self.commits]
-            profiler_start("Inserting commits for repository %d",
-                           (self.repo_id,))
-            cursor.executemany(statement(DBLog.__insert__,
-                                         self.db.place_holder), commits)
-            self.commits = []
-            profiler_stop("Inserting commits for repository %d",
-                          (self.repo_id,))
+        profiler_start("Inserting rows for repository %d", (self.repo_id,))
+        self.writer.flush(self.cursor)
+        profiler_stop("Inserting rows for repository %d", (self.repo_id,))
 
         profiler_start("Committing inserts for repository %d",
                        (self.repo_id,))
         self.cnn.commit()
+        self.writer.n_statements += 1
         profiler_stop("Committing inserts for repository %d",
                       (self.repo_id,))
 
+        # The rows are in the database now, the checkpoint can include them
+        self.journal.maybe_checkpoint()
+
     def __add_new_file_and_link(self, file_name, parent_id, commit_id):
         dbfile = DBFile(None, file_name)
         dbfile.repository_id = self.repo_id
-        self.cursor.execute(statement(DBFile.__insert__,
-                                      self.db.place_holder),
-                                      (dbfile.id, dbfile.file_name,
-                                       dbfile.repository_id))
+        self.writer.add(DBFile, (dbfile.id, dbfile.file_name,
+                                 dbfile.repository_id))
 
         dblink = DBFileLink(None, parent_id, dbfile.id)
         dblink.commit_id = commit_id
-        self.cursor.execute(statement(DBFileLink.__insert__,
-                                      self.db.place_holder),
-                                      (dblink.id, dblink.parent,
-                                       dblink.child, dblink.commit_id))
+        self.writer.add(DBFileLink, (dblink.id, dblink.parent, dblink.child,
+                                     dblink.commit_id))
 
         return dbfile.id
 
     def __add_new_copy(self, dbfilecopy):
-        self.cursor.execute(statement(DBFileCopy.__insert__,
-                                      self.db.place_holder),
-                             (dbfilecopy.id,
-                              dbfilecopy.to_id,
-                              dbfilecopy.from_id,
-                              dbfilecopy.from_commit,
-                              dbfilecopy.new_file_name,
-                              dbfilecopy.action_id))
+        self.writer.add(DBFileCopy, (dbfilecopy.id,
+                                     dbfilecopy.to_id,
+                                     dbfilecopy.from_id,
+                                     dbfilecopy.from_commit,
+                                     dbfilecopy.new_file_name,
+                                     dbfilecopy.action_id))
 
     def __add_file_path(self, commit_id, file_id, path):
         """Add the latest full path of a given file_id and commit_id
@@ -224,131 +305,133 @@ class DBContentHandler(ContentHandler):
             file_path = path
 
         db_file_path = DBFilePath(None, commit_id, file_id, file_path)
-        self.cursor.execute(statement(DBFilePath.__insert__,
-                                      self.db.place_holder),
-                            (db_file_path.id,
-                             db_file_path.commit_id,
-                             db_file_path.file_id,
-                             db_file_path.file_path))
+        self.writer.add(DBFilePath, (db_file_path.id,
+                                     db_file_path.commit_id,
+                                     db_file_path.file_id,
+                                     db_file_path.file_path))
+
+    def __claim_names(self):
+        """Claims the names of the people and tags added since the last
+           flush, in the transaction inserting them. The ids of the names
+           other processes claimed first replace the new ones in the rows
+           to be inserted, and the rows of those names are dropped.
+        """
+        for obj, ids, cache in ((DBPerson, self.people_ids,
+                                 self.people_cache),
+                                (DBTag, self.tag_ids, self.tags_cache)):
+            names = self.new_names[obj]
+            if not names:
+                continue
+
+            claimed = self.db.claim_names(self.cursor, obj.__table__,
+                                          [(name.decode("utf-8"), id)
+                                           for name, (id, key) in
+                                           names.iteritems()])
+            self.writer.n_statements += 2
+
+            replaced = {}
+            for name, (id, key) in names.iteritems():
+                claimed_id = claimed[name]
+                if claimed_id != id:
+                    printdbg("DBContentHandler: %s %s already added " + \
+                             "with id %d", (obj.__table__, name, claimed_id))
+                    replaced[id] = ids[name] = cache[key] = claimed_id
+            names.clear()
+
+            if replaced:
+                self.writer.discard(obj, replaced)
+                for table, column in self.NAME_REFS[obj]:
+                    self.writer.replace(table, column, replaced)
+
+    def __add_branch(self, b, name):
+        """Inserts the new branch b right away, in a transaction of its
+           own, unless another process added the same name first. Branch
+           ids are part of the paths in the file caches, so they can't be
+           replaced later like the ids of the people and tags. Returns
+           the id of the branch.
+        """
+        cursor = self.cursor
+        branch_id = self.db.claim_names(cursor, DBBranch.__table__,
+                                        [(name.decode("utf-8"), b.id)])[name]
+        if branch_id == b.id:
+            cursor.execute(statement(DBBranch.__insert__,
+                                     self.db.place_holder), (b.id, b.name))
+        self.cnn.commit()
+        self.writer.n_statements += 3
+
+        return branch_id
 
     def __get_person(self, person):
         """Get the person_id given a person struct
-           First, it tries to get it from cache and then from the database.
-           When a new person_id is gotten from the database, the cache must be
-           updated
+           First, it tries to get it from cache and then from the people
+           loaded from the database. New people get a new id and they are
+           inserted with the next batch of commits.
         """
-        def ensure_person(person):
-            profiler_start("Ensuring person %s for repository %d",
-                            (person.name, self.repo_id))
-            printdbg("DBContentHandler: ensure_person %s <%s>",
-                      (person.name, person.email))
-            cursor = self.cursor
-
-            name = to_utf8(person.name)
-            email = person.email
-
-            if email is not None:
-                email = to_utf8(email).decode("utf-8")
-
-            cursor.execute(statement(
-                "SELECT id from people where name = ?", self.db.place_holder),
-                (to_utf8(name).decode("utf-8"),))
-            rs = cursor.fetchone()
-            if not rs:
-                p = DBPerson(None, person)
-
-                cursor.execute(statement(DBPerson.__insert__,
-                                self.db.place_holder),
-                                (p.id, to_utf8(p.name).decode("utf-8"),
-                                 email))
-                person_id = p.id
-            else:
-                person_id = rs[0]
-
-            profiler_stop("Ensuring person %s for repository %d",
-                           (person.name, self.repo_id), True)
-
-            return person_id
-
         name = to_utf8(person.name)
-
         if name in self.people_cache:
-            person_id = self.people_cache[name]
-        else:
-            person_id = ensure_person(person)
-            self.people_cache[name] = person_id
+            return self.people_cache[name]
+
+        person_id = self.people_ids.get(name)
+        if person_id is None:
+            p = DBPerson(None, person)
+            printdbg("DBContentHandler: new person %s <%s>",
+                     (person.name, person.email))
+            self.writer.add(DBPerson,
+                            (p.id, to_utf8(p.name).decode("utf-8"),
+                             p.email and to_utf8(p.email).decode("utf-8")))
+            person_id = self.people_ids[name] = p.id
+            if self.shared_names:
+                self.new_names[DBPerson][name] = (p.id, name)
+
+        self.people_cache[name] = person_id
 
         return person_id
 
     def __get_branch(self, branch):
         """Get the branch_id given a branch name.
-           First, it tries to get it from cache and then from the database.
-           When a new branch_id is gotten from the database, the cache must be
-           updated
+           First, it tries to get it from cache and then from the branches
+           loaded from the database. New branches get a new id and they are
+           inserted with the next batch of commits.
         """
-        def ensure_branch(branch):
-            profiler_start("Ensuring branch %s for repository %d",
-                            (branch, self.repo_id))
-            printdbg("DBContentHandler: ensure_branch %s", (branch,))
-            cursor = self.cursor
-
-            cursor.execute(statement("SELECT id from branches where name = ?",
-                            self.db.place_holder), (branch,))
-            rs = cursor.fetchone()
-            if not rs:
-                b = DBBranch(None, branch)
-                cursor.execute(statement(DBBranch.__insert__,
-                                self.db.place_holder), (b.id, b.name))
-                branch_id = b.id
+        if branch in self.branch_cache:
+            return self.branch_cache[branch]
+
+        name = to_utf8(branch)
+        branch_id = self.branch_ids.get(name)
+        if branch_id is None:
+            b = DBBranch(None, branch)
+            printdbg("DBContentHandler: new branch %s", (branch,))
+            if self.shared_names:
+                branch_id = self.__add_branch(b, name)
             else:
-                branch_id = rs[0]
-
-            profiler_stop("Ensuring branch %s for repository %d",
-                          (branch, self.repo_id), True)
-
-            return branch_id
+                self.writer.add(DBBranch, (b.id, b.name))
+                branch_id = b.id
+            self.branch_ids[name] = branch_id
 
-        if branch in self.branch_cache:
-            branch_id = self.branch_cache[branch]
-        else:
-            branch_id = ensure_branch(branch)
-            self.branch_cache[branch] = branch_id
+        self.branch_cache[branch] = branch_id
 
         return branch_id
 
     def __get_tag(self, tag):
         """Get the tag_id given a tag name.
-           First, it tries to get it from cache and then from the database.
-           When a new tag_id is gotten from the database, the cache must be
-           updated
+           First, it tries to get it from cache and then from the tags
+           loaded from the database. New tags get a new id and they are
+           inserted with the next batch of commits.
         """
-        def ensure_tag(tag):
-            profiler_start("Ensuring tag %s for repository %d",
-                           (tag, self.repo_id))
-            printdbg("DBContentHandler: ensure_tag %s", (tag,))
-            cursor = self.cursor
-
-            cursor.execute(statement("SELECT id from tags where name = ?",
-                            self.db.place_holder), (tag,))
-            rs = cursor.fetchone()
-            if not rs:
-                t = DBTag(None, tag)
-                cursor.execute(statement(DBTag.__insert__,
-                                self.db.place_holder), (t.id, t.name))
-                tag_id = t.id
-            else:
-                tag_id = rs[0]
-
-            profiler_stop("Ensuring tag %s for repository %d",
-                          (tag, self.repo_id), True)
+        if tag in self.tags_cache:
+            return self.tags_cache[tag]
 
-            return tag_id
+        name = to_utf8(tag)
+        tag_id = self.tag_ids.get(name)
+        if tag_id is None:
+            t = DBTag(None, tag)
+            printdbg("DBContentHandler: new tag %s", (tag,))
+            self.writer.add(DBTag, (t.id, t.name))
+            tag_id = self.tag_ids[name] = t.id
+            if self.shared_names:
+                self.new_names[DBTag][name] = (t.id, tag)
 
-        if tag in self.tags_cache:
-            tag_id = self.tags_cache[tag]
-        else:
-            tag_id = ensure_tag(tag)
-            self.tags_cache[tag] = tag_id
+        self.tags_cache[tag] = tag_id
 
         return tag_id
 
@@ -362,23 +445,18 @@ class DBContentHandler(ContentHandler):
         printdbg("DBContentHandler: looking for path %s in moves cache",
                  (path,))
         current_path = path
-        replaces = []
+        replaces = set()
         while current_path not in self.file_cache:
-            found = False
-            for new_path in self.moves_cache.keys():
-                if not current_path.startswith(new_path) or \
-                new_path in replaces:
-                    continue
-
-                current_path = current_path.replace(new_path,
-                                                    self.moves_cache[new_path],
-                                                    1)
-                replaces.append(new_path)
-                found = True
-
-            if not found:
+            # The deepest moved directory first
+            for new_path, old_path in self.moves_cache.ancestors(current_path):
+                if new_path not in replaces:
+                    break
+            else:
                 raise FileNotInCache
 
+            current_path = old_path + current_path[len(new_path):]
+            replaces.add(new_path)
+
         return self.file_cache[current_path]
 
     def __get_file_for_path(self, path, commit_id, old=False):
@@ -486,10 +564,8 @@ class DBContentHandler(ContentHandler):
         file_id = self.__get_file_for_path(path, log.id)[0]
 
         # Remove the old references
-        dirpath = path.rstrip("/") + "/"
-        for cpath in self.file_cache.keys():
-            if cpath.startswith(dirpath):
-                self.__move_path_to_deletes_cache(cpath)
+        for cpath, value in self.file_cache.pop_subtree(path.rstrip("/")):
+            self.deletes_cache[cpath] = value
         self.__move_path_to_deletes_cache(path)
 
         return file_id
@@ -524,10 +600,8 @@ class DBContentHandler(ContentHandler):
             parent_id = new_parent_id
             dblink = DBFileLink(None, parent_id, file_id)
             dblink.commit_id = log.id
-            self.cursor.execute(statement(DBFileLink.__insert__,
-                                 self.db.place_holder),
-                                (dblink.id, dblink.parent, dblink.child,
-                                 dblink.commit_id))
+            self.writer.add(DBFileLink, (dblink.id, dblink.parent,
+                                         dblink.child, dblink.commit_id))
             self.moves_cache[path] = old_path
 
         self.file_cache[path] = (file_id, parent_id)
@@ -630,10 +704,8 @@ class DBContentHandler(ContentHandler):
 
         self.__move_path_to_deletes_cache(path)
         # Remove the old references
-        dirpath = path.rstrip("/") + "/"
-        for cpath in self.file_cache.keys():
-            if cpath.startswith(dirpath):
-                self.__move_path_to_deletes_cache(cpath)
+        for cpath, value in self.file_cache.pop_subtree(path.rstrip("/")):
+            self.deletes_cache[cpath] = value
 
         # Add the new path
         new_file_id = self.__add_new_file_and_link(file_name, parent_id,
@@ -671,7 +743,12 @@ class DBContentHandler(ContentHandler):
         elif commit.author is not None:
             log.author = self.__get_person(commit.author)
 
-        self.commits.append(log)
+        self.writer.add(DBLog, (log.id, log.rev, log.committer, log.author,
+                                log.date,
+                                to_utf8(log.message).decode("utf-8"),
+                                log.composed_rev, log.repository_id))
+        self.last_commit = log.id
+        self.n_commits += 1
 
         printdbg("DBContentHandler: commit: %d rev: %s", (log.id, log.rev))
 
@@ -715,22 +792,24 @@ class DBContentHandler(ContentHandler):
                 assert "Unknown action type %s" % (action.type)
 
             dbaction.file_id = file_id
-            self.actions.append(dbaction)
+            self.writer.add(DBAction, (dbaction.id, dbaction.type,
+                                       dbaction.file_id, dbaction.commit_id,
+                                       dbaction.branch_id))
+
+            if action.added is not None or action.removed is not None:
+                self.writer.add(DBActionLines, (dbaction.id, action.added,
+                                                action.removed))
 
         # Tags
         if commit.tags is not None:
-            tag_revs = []
             for tag in commit.tags:
                 tag_id = self.__get_tag(tag)
                 db_tagrev = DBTagRev(None)
-                tag_revs.append((db_tagrev.id, tag_id, log.id))
-
-            self.cursor.executemany(statement(DBTagRev.__insert__,
-                                              self.db.place_holder), tag_revs)
+                self.writer.add(DBTagRev, (db_tagrev.id, tag_id, log.id))
 
-        if len(self.actions) >= self.MAX_ACTIONS:
-            printdbg("DBContentHandler: %d actions inserting",
-                     (len(self.actions),))
+        if len(self.writer) >= self.MAX_ROWS:
+            printdbg("DBContentHandler: %d rows inserting",
+                     (len(self.writer),))
             self.__insert_many()
 
         profiler_stop("New commit %s for repository %d", (commit.revision,
@@ -741,9 +820,16 @@ class DBContentHandler(ContentHandler):
         printdbg("DBContentHandler: flushing pending inserts")
         self.__insert_many()
 
+        if self.n_commits > 0:
+            printdbg("DBContentHandler: %d statements for %d commits " + \
+                     "(%.2f per commit)",
+                     (self.writer.n_statements, self.n_commits,
+                      float(self.writer.n_statements) / self.n_commits))
+
         # Save the caches to disk
         profiler_start("Saving caches to disk")
-        self.__save_caches_to_disk()
+        self.journal.checkpoint()
+        self.journal.close()
         profiler_stop("Saving caches to disk", delete=True)
 
         self.cursor.close()
@@ -752,8 +838,8 @@ class DBContentHandler(ContentHandler):
 
 if __name__ == '__main__':
     import sys
-    from io import BytesIO
-    from Database import create_database, ICursor
+    from Database import create_database
+    from CommitCodec import decode_commit
 
     uri = "http://svn.test-cvsanaly.org/svn/test"
 
@@ -784,17 +870,13 @@ if __name__ == '__main__':
     ch.repository(uri)
 
     # We need to split the query to save memory
-    icursor = ICursor(cnn.cursor(), 100)
+    icursor = db.icursor(cnn, 100)
     icursor.execute(statement("SELECT object from _temp_log order by id desc",
-                                self.db.place_holder))
+                                db.place_holder))
     rs = icursor.fetchmany()
     while rs:
         for t in rs:
-            obj = t[0]
-            io = BytesIO(obj)
-            commit = load(io)
-            io.close()
-            ch.commit(commit)
+            ch.commit(decode_commit(str(t[0])))
 
         rs = icursor.fetchmany()
 
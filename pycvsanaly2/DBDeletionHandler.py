@@ -79,6 +79,12 @@ class DBDeletionHandler(object):
                                         WHERE a.commit_id = s.id
                                         AND s.repository_id = ?)
                         """),
+            ("action_lines", """DELETE FROM action_lines
+                               WHERE action_id IN (SELECT a.id
+                                                   FROM actions a, scmlog s
+                                                   WHERE a.commit_id = s.id
+                                                   AND s.repository_id = ?)
+                            """),
             ("actions", """DELETE FROM actions
                           WHERE commit_id IN (SELECT s.id
                                               FROM scmlog s
@@ -19,13 +19,26 @@
 
 from ContentHandler import ContentHandler
 from DBContentHandler import DBContentHandler
-from DBTempLog import DBTempLog
-from AsyncQueue import AsyncQueue, TimeOut
+from FileTempLog import FileTempLog
+from AsyncQueue import AsyncQueue
 from utils import printdbg
 import threading
 
 
 class DBProxyContentHandler(ContentHandler):
+    """Content handler that reorders the commits emitted by the parser
+    before passing them to DBContentHandler.
+
+    Commits are spilled to a temporary file and read back in the right
+    order once parsing has finished. When the parser already emits
+    commits in the order they have to be stored (ORDER_REVISION_ASC),
+    they are streamed to DBContentHandler through a bounded queue
+    instead, so that database writes run in a thread of their own
+    while the log is still being parsed.
+    """
+
+    QUEUE_SIZE = 50
+    BATCH_SIZE = 50
 
     def __init__(self, db):
         ContentHandler.__init__(self)
@@ -35,29 +48,107 @@ class DBProxyContentHandler(ContentHandler):
         self.order = ContentHandler.ORDER_REVISION
         self.repo_uri = None
 
+        self.queue = None
+        self.writer_thread = None
+        self.writer_error = None
+        self.reader_error = None
+
         self.db_handler = DBContentHandler(db)
 
     def begin(self, order=None):
-        self.templog = DBTempLog(self.db)
         if order is not None:
             self.order = order
 
+        if self.order == ContentHandler.ORDER_REVISION_ASC:
+            printdbg("DBProxyContentHandler: streaming commits to database")
+            self.queue = AsyncQueue(self.QUEUE_SIZE)
+        else:
+            self.templog = FileTempLog()
+
     def repository(self, uri):
         self.repo_uri = uri
 
     def commit(self, commit):
-        self.templog.insert(commit)
+        if self.templog is not None:
+            self.templog.insert(commit)
+            return
+
+        if self.writer_thread is None:
+            self.writer_thread = threading.Thread(target=self.__writer,
+                                                  args=(self.queue,))
+            self.writer_thread.setDaemon(True)
+            self.writer_thread.start()
+
+        self.queue.put(commit)
+
+    def __writer(self, queue):
+        printdbg("DBProxyContentHandler: thread __writer started")
+        try:
+            self.db_handler.begin()
+            self.db_handler.repository(self.repo_uri)
+        except Exception, e:
+            self.writer_error = e
+
+        # The queue is closed when parsing is over
+        items = queue.get_many(self.BATCH_SIZE)
+        while items:
+            # Keep draining the queue after an error, otherwise
+            # the parser would block forever on a full queue
+            if self.writer_error is None:
+                try:
+                    for item in items:
+                        self.db_handler.commit(item)
+                except Exception, e:
+                    self.writer_error = e
+            del items
+            items = queue.get_many(self.BATCH_SIZE)
+
+        if self.writer_error is None:
+            try:
+                self.db_handler.end()
+            except Exception, e:
+                self.writer_error = e
+        printdbg("DBProxyContentHandler: thread __writer finished")
+
+    def __end_stream(self):
+        if self.writer_thread is None:
+            # No commits at all
+            self.db_handler.begin()
+            self.db_handler.repository(self.repo_uri)
+            self.db_handler.end()
+            return
+
+        self.queue.close()
+        self.writer_thread.join()
+        self.writer_thread = None
+
+        if self.writer_error is not None:
+            raise self.writer_error
 
     def __reader(self, templog, queue):
+        items = []
+
         def commit_cb(item):
-            queue.put(item)
+            items.append(item)
+            if len(items) >= self.BATCH_SIZE:
+                queue.put_many(items)
+                del items[:]
 
         printdbg("DBProxyContentHandler: thread __reader started")
-        templog.foreach(commit_cb, self.order)
+        try:
+            templog.foreach(commit_cb, self.order)
+            queue.put_many(items)
+        except Exception, e:
+            self.reader_error = e
+        queue.close()
         printdbg("DBProxyContentHandler: thread __reader finished")
 
     def end(self):
-        # The log is now in the temp table
+        if self.templog is None:
+            self.__end_stream()
+            return
+
+        # The log is now in the temp file
         # Retrieve the data now and pass it to
         # the real content handler
 
@@ -67,30 +158,28 @@ class DBProxyContentHandler(ContentHandler):
         self.db_handler.begin()
         self.db_handler.repository(self.repo_uri)
 
-        queue = AsyncQueue(50)
+        queue = AsyncQueue(self.QUEUE_SIZE)
         reader_thread = threading.Thread(target=self.__reader,
                                           args=(self.templog, queue))
         reader_thread.setDaemon(True)
         reader_thread.start()
 
-        # Use the queue with mutexes while the
-        # thread is alive
-        while reader_thread.isAlive():
-            try:
-                item = queue.get(1)
-            except TimeOut:
-                continue
-            printdbg("DBProxyContentHandler: commit: %s", (item.revision,))
-            self.db_handler.commit(item)
-            del item
-
-        # No threads now, we don't need locks
-        printdbg("DBProxyContentHandler: thread __reader is finished, " + \
-                 "continue without locks")
-        while not queue.empty_unlocked():
-            item = queue.get_unlocked()
-            self.db_handler.commit(item)
-            del item
+        # The queue is closed when the temp log is over
+        items = queue.get_many(self.BATCH_SIZE)
+        while items:
+            for item in items:
+                printdbg("DBProxyContentHandler: commit: %s",
+                         (item.revision,))
+                self.db_handler.commit(item)
+            del items
+            items = queue.get_many(self.BATCH_SIZE)
+
+        reader_thread.join()
+        printdbg("DBProxyContentHandler: thread __reader is finished")
+
+        # Don't store a partial history
+        if self.reader_error is not None:
+            raise self.reader_error
 
         self.db_handler.end()
         self.templog.clear()
@@ -19,18 +19,19 @@
 
 from ContentHandler import ContentHandler
 from Database import (SqliteDatabase, MysqlDatabase, TableAlreadyExists, 
-                      statement, ICursor)
+                      statement)
 from Repository import Commit
+from CommitCodec import encode_commit, decode_commit
 from AsyncQueue import AsyncQueue
 
 import threading
-from io import BytesIO
-from cPickle import dump, load
 
 
 class DBTempLog(object):
 
     INTERVAL_SIZE = 100
+
+    __insert__ = "INSERT into _temp_log (rev, date, object) values (?, ?, ?)"
     
     def __init__(self, db):
         self.db = db
@@ -122,10 +123,7 @@ class DBTempLog(object):
                 queue.done()
                 break
 
-            io = BytesIO()
-            dump(commit, io, -1)
-            obj = io.getvalue()
-            io.close()
+            obj = encode_commit(commit)
 
             commits.append((commit.revision, commit.date, 
                             self.db.to_binary(obj)))
@@ -133,9 +131,7 @@ class DBTempLog(object):
             del commit
 
             if n_commits == 50:
-                cursor.executemany(statement("INSERT into _temp_log " + \
-                    "(rev, date, object) values (?, ?, ?)", 
-                    self.db.place_holder), commits)
+                self.db.insert_many(cursor, self.__insert__, commits)
                 cnn.commit()
                 del commits
                 commits = []
@@ -144,9 +140,7 @@ class DBTempLog(object):
             queue.done()
 
         if commits:
-            cursor.executemany(statement("INSERT into _temp_log " + \
-                    "(rev, date, object) values (?, ?, ?)", 
-                    self.db.place_holder), commits)
+            self.db.insert_many(cursor, self.__insert__, commits)
             cnn.commit()
             del commits
             
@@ -167,16 +161,12 @@ class DBTempLog(object):
             query = "SELECT object from _temp_log order by date asc"
 
         # We need to split the query to save memory
-        icursor = ICursor(cnn.cursor(), self.INTERVAL_SIZE)
+        icursor = self.db.icursor(cnn, self.INTERVAL_SIZE)
         icursor.execute(statement(query, self.db.place_holder))
         rs = icursor.fetchmany()
         while rs:
             for t in rs:
-                obj = t[0]
-                io = BytesIO(obj)
-                commit = load(io)
-                io.close()
-                cb(commit)
+                cb(decode_commit(str(t[0])))
 
             rs = icursor.fetchmany()
 
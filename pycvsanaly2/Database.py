@@ -17,12 +17,17 @@
 # Authors :
 #       Carlos Garcia Campos <carlosgc@gsyc.escet.urjc.es>
 
+import re
+import time
+import threading
+
 from utils import to_utf8, printdbg, printerr
 
 
 class DBRepository(object):
 
     id_counter = 1
+    __table__ = "repositories"
 
     __insert__ = "INSERT INTO repositories (id, uri, name, type) " + \
         "values (?, ?, ?, ?)"
@@ -31,8 +36,7 @@ class DBRepository(object):
 
     def __init__(self, id, uri, name, type):
         if id is None:
-            self.id = DBRepository.id_counter
-            DBRepository.id_counter += 1
+            self.id = new_id(DBRepository)
         else:
             self.id = id
 
@@ -44,6 +48,7 @@ class DBRepository(object):
 class DBLog(object):
 
     id_counter = 1
+    __table__ = "scmlog"
 
     __insert__ = """INSERT INTO scmlog (id, rev, committer_id, author_id, 
                     date, message, composed_rev, repository_id) 
@@ -53,8 +58,7 @@ class DBLog(object):
     
     def __init__(self, id, commit):
         if id is None:
-            self.id = DBLog.id_counter
-            DBLog.id_counter += 1
+            self.id = new_id(DBLog)
         else:
             self.id = id
             
@@ -69,6 +73,7 @@ class DBLog(object):
 class DBFile(object):
 
     id_counter = 1
+    __table__ = "files"
 
     __insert__ = """INSERT INTO files (id, file_name, repository_id) 
                     values (?, ?, ?)"""
@@ -77,8 +82,7 @@ class DBFile(object):
     
     def __init__(self, id, file_name):
         if id is None:
-            self.id = DBFile.id_counter
-            DBFile.id_counter += 1
+            self.id = new_id(DBFile)
         else:
             self.id = id
             
@@ -89,6 +93,7 @@ class DBFile(object):
 class DBFileLink(object):
     
     id_counter = 1
+    __table__ = "file_links"
 
     __insert__ = """INSERT INTO file_links (id, parent_id, file_id, commit_id) 
                     values (?, ?, ?, ?)"""
@@ -97,8 +102,7 @@ class DBFileLink(object):
 
     def __init__(self, id, parent, child):
         if id is None:
-            self.id = DBFileLink.id_counter
-            DBFileLink.id_counter += 1
+            self.id = new_id(DBFileLink)
         else:
             self.id = id
             
@@ -110,6 +114,7 @@ class DBFileLink(object):
 class DBFilePath(object):
 
     id_counter = 1
+    __table__ = "file_paths"
 
     __insert__ = """INSERT INTO file_paths (id, commit_id, file_id, file_path) 
                     values (?, ?, ?, ?)"""
@@ -118,8 +123,7 @@ class DBFilePath(object):
 
     def __init__(self, id, commit_id, file_id, file_path):
         if id is None:
-            self.id = DBFilePath.id_counter
-            DBFilePath.id_counter += 1
+            self.id = new_id(DBFilePath)
         else:
             self.id = id
 
@@ -131,6 +135,7 @@ class DBFilePath(object):
 class DBPerson(object):
 
     id_counter = 1
+    __table__ = "people"
 
     __insert__ = """INSERT INTO people (id, name, email) 
                     values (?, ?, ?)"""
@@ -139,8 +144,7 @@ class DBPerson(object):
 
     def __init__(self, id, person):
         if id is None:
-            self.id = DBPerson.id_counter
-            DBPerson.id_counter += 1
+            self.id = new_id(DBPerson)
         else:
             self.id = id
             
@@ -151,6 +155,7 @@ class DBPerson(object):
 class DBBranch(object):
 
     id_counter = 1
+    __table__ = "branches"
 
     __insert__ = "INSERT INTO branches (id, name) values (?, ?)"
     
@@ -158,8 +163,7 @@ class DBBranch(object):
 
     def __init__(self, id, name):
         if id is None:
-            self.id = DBBranch.id_counter
-            DBBranch.id_counter += 1
+            self.id = new_id(DBBranch)
         else:
             self.id = id
             
@@ -169,6 +173,7 @@ class DBBranch(object):
 class DBAction(object):
 
     id_counter = 1
+    __table__ = "actions"
 
     __insert__ = """INSERT INTO actions (id, type, file_id, commit_id, 
                     branch_id) 
@@ -178,8 +183,7 @@ class DBAction(object):
     
     def __init__(self, id, type):
         if id is None:
-            self.id = DBAction.id_counter
-            DBAction.id_counter += 1
+            self.id = new_id(DBAction)
         else:
             self.id = id
             
@@ -189,9 +193,23 @@ class DBAction(object):
         self.branch_id = None
 
 
+class DBActionLines(object):
+
+    __insert__ = """INSERT INTO action_lines (action_id, added, removed) 
+                    values (?, ?, ?)"""
+
+    __delete__ = """DELETE FROM action_lines where action_id = ?"""
+
+    def __init__(self, action_id, added, removed):
+        self.action_id = action_id
+        self.added = added
+        self.removed = removed
+
+
 class DBFileCopy(object):
 
     id_counter = 1
+    __table__ = "file_copies"
 
     __insert__ = """INSERT INTO file_copies (id, to_id, from_id, 
                     from_commit_id, new_file_name, action_id) 
@@ -201,8 +219,7 @@ class DBFileCopy(object):
 
     def __init__(self, id, file_id):
         if id is None:
-            self.id = DBFileCopy.id_counter
-            DBFileCopy.id_counter += 1
+            self.id = new_id(DBFileCopy)
         else:
             self.id = id
 
@@ -217,6 +234,7 @@ class DBFileCopy(object):
 class DBTag(object):
 
     id_counter = 1
+    __table__ = "tags"
 
     __insert__ = "INSERT INTO tags (id, name) values (?, ?)"
     
@@ -224,8 +242,7 @@ class DBTag(object):
 
     def __init__(self, id, name):
         if id is None:
-            self.id = DBTag.id_counter
-            DBTag.id_counter += 1
+            self.id = new_id(DBTag)
         else:
             self.id = id
 
@@ -235,6 +252,7 @@ class DBTag(object):
 class DBTagRev(object):
 
     id_counter = 1
+    __table__ = "tag_revisions"
 
     __insert__ = """INSERT INTO tag_revisions (id, tag_id, commit_id) 
                     values (?, ?, ?)"""
@@ -243,8 +261,7 @@ class DBTagRev(object):
     
     def __init__(self, id):
         if id is None:
-            self.id = DBTagRev.id_counter
-            DBTagRev.id_counter += 1
+            self.id = new_id(DBTagRev)
         else:
             self.id = id
 
@@ -252,83 +269,148 @@ class DBTagRev(object):
         self.commit_id = None
 
  
-def initialize_ids(db, cursor):
-    # Repositories
-    cursor.execute(statement("SELECT max(id) from repositories", 
-                             db.place_holder))
-    id = cursor.fetchone()[0]
-    if id is not None:
-        DBRepository.id_counter = id + 1
-
-    # Log
-    cursor.execute(statement("SELECT max(id) from scmlog", 
-                             db.place_holder))
-    id = cursor.fetchone()[0]
-    if id is not None:
-        DBLog.id_counter = id + 1
-
-    # Actions
-    cursor.execute(statement("SELECT max(id) from actions", 
-                             db.place_holder))
-    id = cursor.fetchone()[0]
-    if id is not None:
-        DBAction.id_counter = id + 1
-
-    # Copies
-    cursor.execute(statement("SELECT max(id) from file_copies", 
-                             db.place_holder))
-    id = cursor.fetchone()[0]
-    if id is not None:
-        DBFileCopy.id_counter = id + 1
-
-    # Files
-    cursor.execute(statement("SELECT max(id) from files", 
-                             db.place_holder))
-    id = cursor.fetchone()[0]
-    if id is not None:
-        DBFile.id_counter = id + 1
-
-    # File Links
-    cursor.execute(statement("SELECT max(id) from file_links", 
-                             db.place_holder))
-    id = cursor.fetchone()[0]
-    if id is not None:
-        DBFileLink.id_counter = id + 1
-
-    # File Paths
-    cursor.execute(statement("SELECT max(id) from file_paths", 
-                             db.place_holder))
-    id = cursor.fetchone()[0]
-    if id is not None:
-        DBFilePath.id_counter = id + 1
-
-    # Branches
-    cursor.execute(statement("SELECT max(id) from branches", 
-                             db.place_holder))
-    id = cursor.fetchone()[0]
-    if id is not None:
-        DBBranch.id_counter = id + 1
-
-    # People
-    cursor.execute(statement("SELECT max(id) from people", 
-                             db.place_holder))
-    id = cursor.fetchone()[0]
-    if id is not None:
-        DBPerson.id_counter = id + 1
-
-    # Tags
-    cursor.execute(statement("SELECT max(id) from tags", 
-                             db.place_holder))
-    id = cursor.fetchone()[0]
-    if id is not None:
-        DBTag.id_counter = id + 1
-
-    # Tag revisions
-    cursor.execute(statement("SELECT max(id) from tag_revisions", 
-                             db.place_holder))
-    id = cursor.fetchone()[0]
-    if id is not None:
-        DBTagRev.id_counter = id + 1
+class IdAllocator(object):
+    """Hands out the ids of the new rows.
+
+    Ids are reserved in blocks from a table of sequences, one per table,
+    shared by all the processes writing to the same database. Blocks are
+    reserved atomically, so several processes can insert rows in the
+    same tables at the same time without getting the same ids. A
+    sequence starts after the greatest id in its table. The ids left in
+    the last blocks are given back on release() if nobody reserved more
+    ids after them. Ids can be asked for from any thread, they all share
+    the connection to the sequences.
+
+    >>> import os, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), "ids.db")
+    >>> db = SqliteDatabase(path)
+    >>> cnn = db.connect()
+    >>> db.create_tables(cnn.cursor())
+    >>> cnn.close()
+    >>> ids = IdAllocator(db)
+    >>> ids.BLOCK_SIZE = 10
+    >>> got = []
+    >>> def allocate():
+    ...     for i in xrange(25):
+    ...         got.append(ids.new_ids("scmlog"))
+    >>> threads = [threading.Thread(target=allocate) for i in xrange(2)]
+    >>> for thread in threads:
+    ...     thread.start()
+    >>> for thread in threads:
+    ...     thread.join()
+    >>> sorted(got) == range(1, 51)
+    True
+    >>> ids.release()
+    """
+
+    BLOCK_SIZE = 1000
+
+    def __init__(self, db):
+        self.db = db
+        self.cnn = None
+        self.blocks = {}
+        self.lock = threading.Lock()
+
+    def __connect(self):
+        if self.cnn is None:
+            self.cnn = self.db.connect_sequences()
+            cursor = self.cnn.cursor()
+            self.db.create_sequences_table(cursor)
+            cursor.close()
+            self.cnn.commit()
+
+        return self.cnn
+
+    def __get_max_id(self, table):
+        cnn = self.db.connect()
+        cursor = cnn.cursor()
+        cursor.execute("SELECT max(id) from %s" % (table))
+        max_id = cursor.fetchone()[0]
+        cursor.close()
+        cnn.close()
+
+        return max_id or 0
+
+    def __reserve(self, table, n):
+        # Called with the lock held
+        cnn = self.__connect()
+        first = self.db.reserve_ids(cnn, table, n)
+        if first is None:
+            # First time this table is used
+            self.db.create_sequence(cnn, table, self.__get_max_id(table) + 1)
+            first = self.db.reserve_ids(cnn, table, n)
+
+        printdbg("IdAllocator: ids %d-%d reserved for %s",
+                 (first, first + n - 1, table))
+
+        return first
+
+    def new_ids(self, table, n=1):
+        """Returns the first of n consecutive new ids for table"""
+        self.lock.acquire()
+        try:
+            block = self.blocks.get(table)
+            if block is None or block[1] - block[0] < n:
+                size = max(n, self.BLOCK_SIZE)
+                first = self.__reserve(table, size)
+                block = self.blocks[table] = [first, first + size]
+
+            id = block[0]
+            block[0] += n
+        finally:
+            self.lock.release()
+
+        return id
+
+    def release(self):
+        """Gives back the ids reserved but not used"""
+        self.lock.acquire()
+        try:
+            if self.cnn is None:
+                return
+
+            for table, (next_id, end) in self.blocks.iteritems():
+                if next_id < end:
+                    self.db.release_ids(self.cnn, table, next_id, end)
+            self.blocks = {}
+
+            self.cnn.close()
+            self.cnn = None
+        finally:
+            self.lock.release()
+
+
+_id_allocator = None
+
+
+def initialize_ids(db):
+    """New rows take their ids from an IdAllocator for db from now on"""
+    global _id_allocator
+
+    release_ids()
+    _id_allocator = IdAllocator(db)
+
+
+def release_ids():
+    global _id_allocator
+
+    if _id_allocator is not None:
+        _id_allocator.release()
+        _id_allocator = None
+
+
+def new_id(obj, n=1):
+    """Returns the first of n consecutive new ids for the rows of the
+    table obj.__table__. When initialize_ids() hasn't been called, ids
+    are taken from obj.id_counter.
+    """
+    if _id_allocator is not None:
+        return _id_allocator.new_ids(obj.__table__, n)
+
+    id = obj.id_counter
+    obj.id_counter += n
+
+    return id
         
         
 class DatabaseException(Exception):
@@ -371,46 +453,42 @@ def statement(str, ph_mark):
 
 
 class ICursor(object):
+    """Cursor to go through big result sets in chunks.
+
+    The query is executed only once and rows are fetched on demand,
+    interval_size rows at a time, so a full pass over the result set
+    is O(n). The given cursor must not buffer the whole result set on
+    the client, use Database.icursor() to get the right one for each
+    backend. If cnn is given, it's owned by the cursor and closed
+    along with it.
+    """
 
-    def __init__(self, cursor, size=100):
+    def __init__(self, cursor, size=100, cnn=None):
         self.cursor = cursor
+        self.cnn = cnn
         self.interval_size = size
-        self.i = 0
-        self.query = None
-        self.args = None
-        self.need_exec = True
-
-    def __execute(self):
-        q = "%s LIMIT %d OFFSET %d" % (self.query, self.interval_size, self.i)
-        self.i += self.interval_size
-
-        printdbg(q)
-        
-        if self.args:
-            self.cursor.execute(q, self.args)
-        else:
-            self.cursor.execute(q)
-
-        self.need_exec = False
 
     def execute(self, query, args=None):
-        self.i = 0
-        self.query = query
-        self.args = args
-
-        self.__execute()
+        if args:
+            self.cursor.execute(query, args)
+        else:
+            self.cursor.execute(query)
 
     def fetchmany(self):
-        if self.need_exec:
-            self.__execute()
-
-        rs = self.cursor.fetchall()
-        self.need_exec = rs is not None
+        return self.cursor.fetchmany(self.interval_size)
 
-        return rs
+    def __iter__(self):
+        rs = self.fetchmany()
+        while rs:
+            for row in rs:
+                yield row
+            rs = self.fetchmany()
 
     def close(self):
         self.cursor.close()
+        if self.cnn is not None:
+            self.cnn.close()
+            self.cnn = None
 
 
 class Database(object):
@@ -418,12 +496,212 @@ class Database(object):
 
     place_holder = "?"
 
+    # Connections kept by get_connection, one per thread
+    POOL_SIZE = 16
+    # Seconds a pooled connection can be idle before checking it
+    POOL_CHECK_INTERVAL = 60
+    # Names looked up at once by claim_names
+    CLAIMS_CHUNK = 500
+
     def __init__(self, database):
         self.database = database
+        self.bulk_load = False
+
+        # Connections opened so far
+        self.n_connections = 0
+        self.pool = {}
+        self.pool_lock = threading.Lock()
         
     def connect(self):
         raise NotImplementedError
 
+    def is_alive(self, cnn):
+        """Whether the connection cnn can still be used"""
+        try:
+            cursor = cnn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            cursor.close()
+        except Exception:
+            return False
+
+        return True
+
+    def get_connection(self):
+        """Returns a connection for the calling thread, the same one
+        every time while it's alive. It must be given back with
+        release_connection instead of closing it. When there are
+        already POOL_SIZE connections in the pool, a new connection
+        is returned, closed when released.
+        """
+        thread = threading.currentThread()
+
+        self.pool_lock.acquire()
+        try:
+            entry = self.pool.pop(thread, None)
+        finally:
+            self.pool_lock.release()
+
+        if entry is not None:
+            cnn, last_used = entry
+            if time.time() - last_used < self.POOL_CHECK_INTERVAL or \
+               self.is_alive(cnn):
+                entry[1] = time.time()
+                self.pool_lock.acquire()
+                try:
+                    self.pool[thread] = entry
+                finally:
+                    self.pool_lock.release()
+                return cnn
+            printdbg("Dropping broken pooled connection")
+
+        cnn = self.connect()
+
+        self.pool_lock.acquire()
+        try:
+            # Connections of finished threads are not used anymore
+            for t in [t for t in self.pool if not t.isAlive()]:
+                del self.pool[t]
+
+            if len(self.pool) < self.POOL_SIZE:
+                self.pool[thread] = [cnn, time.time()]
+        finally:
+            self.pool_lock.release()
+
+        return cnn
+
+    def release_connection(self, cnn):
+        """Gives back a connection returned by get_connection. Its
+        transaction is committed, so that it doesn't keep seeing an
+        old snapshot of the database the next time it's used."""
+        cnn.commit()
+
+        self.pool_lock.acquire()
+        try:
+            entry = self.pool.get(threading.currentThread())
+            if entry is not None and entry[0] is cnn:
+                entry[1] = time.time()
+                return
+        finally:
+            self.pool_lock.release()
+
+        cnn.close()
+
+    def close_connections(self):
+        """Closes the pooled connections"""
+        self.pool_lock.acquire()
+        try:
+            entries = self.pool.values()
+            self.pool = {}
+        finally:
+            self.pool_lock.release()
+
+        for cnn, last_used in entries:
+            try:
+                cnn.close()
+            except Exception:
+                # SQLite connections can only be closed by the thread
+                # that opened them, the others are closed when freed
+                pass
+
+    def begin_bulk_load(self):
+        """Switches to the bulk load mode, meant for filling a new
+        database: connections opened from now on trade durability for
+        speed, and create_tables doesn't create the indexes"""
+        self.bulk_load = True
+
+    def end_bulk_load(self):
+        """Leaves the bulk load mode, creating the indexes left out and
+        restoring the safe settings"""
+        self.bulk_load = False
+
+    def insert_many(self, cursor, query, rows):
+        """Inserts rows with query, an INSERT statement with ? place
+        holders for the values of a single row. Returns the number of
+        statements run"""
+        if not rows:
+            return 0
+
+        cursor.executemany(statement(query, self.place_holder), rows)
+        return 1
+
+    def execute_many(self, cursor, query, rows):
+        """Runs query, a statement with ? place holders, for every row.
+        The statement is prepared once with SQLite, MySQL still runs
+        it once per row."""
+        if rows:
+            cursor.executemany(statement(query, self.place_holder), rows)
+
+    def icursor(self, cnn, size=100):
+        """Returns an ICursor streaming the results over cnn"""
+        return ICursor(cnn.cursor(), size)
+
+    def create_action_lines_table(self, cursor):
+        """Creates the table for the lines added and removed by every
+        action, so that it can be added to databases created before it
+        existed. Raises TableAlreadyExists if it's already there.
+        """
+        raise NotImplementedError
+
+    def connect_sequences(self):
+        """Returns a connection to the database with the id sequences"""
+        return self.connect()
+
+    def create_sequences_table(self, cursor):
+        """Creates the id sequences table unless it already exists"""
+        raise NotImplementedError
+
+    def create_names_table(self, cursor):
+        """Creates the table of the names claimed by the processes
+        adding people, branches and tags at the same time, and empties
+        it. Claims only matter while those processes are running, the
+        rows claimed are in the database by the time they're done.
+        """
+        raise NotImplementedError
+
+    def claim_names(self, cursor, table, names):
+        """Adds the (name, id) pairs of names to the names claimed
+        for table, except the names other processes claimed first, and
+        returns a dict with the id claimed for every name, keyed by its
+        UTF-8 form. The claims are part of the transaction of cursor, so
+        they are committed along with the rows they refer to.
+        """
+        raise NotImplementedError
+
+    def _get_claimed_names(self, cursor, table, names):
+        claimed = {}
+        for i in xrange(0, len(names), self.CLAIMS_CHUNK):
+            chunk = names[i:i + self.CLAIMS_CHUNK]
+            query = "SELECT name, id from id_names " + \
+                    "where name_table = ? and name in (%s)" % \
+                    (",".join(["?"] * len(chunk)))
+            cursor.execute(statement(query, self.place_holder),
+                           [table] + chunk)
+            for name, id in cursor.fetchall():
+                claimed[to_utf8(name)] = id
+
+        return claimed
+
+    def create_sequence(self, cnn, name, next_id):
+        """Adds the sequence name starting at next_id, unless another
+        process added it first"""
+        raise NotImplementedError
+
+    def reserve_ids(self, cnn, name, n):
+        """Atomically reserves n ids from the sequence name and returns
+        the first one, or None if there's no such sequence"""
+        raise NotImplementedError
+
+    def release_ids(self, cnn, name, first, end):
+        """Gives back the ids from first to end, if they are the last
+        ones reserved from the sequence name"""
+        cursor = cnn.cursor()
+        cursor.execute(statement("UPDATE id_sequences SET next_id = ? " + \
+                                 "where name = ? and next_id = ?",
+                                 self.place_holder), (first, name, end))
+        cursor.close()
+        cnn.commit()
+
     def _create_views(self, cursor):
         view = """CREATE VIEW action_files AS
                   SELECT a.file_id as file_id, a.id as action_id,
@@ -444,13 +722,72 @@ class Database(object):
 
 class SqliteDatabase(Database):
 
+    # Page cache of every connection in bulk load mode, in KiB
+    BULK_CACHE_SIZE = 256 * 1024
+    # Bytes of the database file memory mapped in bulk load mode
+    BULK_MMAP_SIZE = 1024 * 1024 * 1024
+
+    INDEXES = [("files_file_name", "files(file_name)"),
+               ("scmlog_date", "scmlog(date)"),
+               ("scmlog_repo", "scmlog(repository_id)")]
+
     def __init__(self, database):
         Database.__init__(self, database)
+        # Whether the indexes are left for end_bulk_load
+        self.indexes_deferred = False
 
     def connect(self):
         import sqlite3.dbapi2 as db
 
-        return db.connect(self.database, 30)
+        cnn = db.connect(self.database, 30)
+        self.n_connections += 1
+        if self.bulk_load:
+            cursor = cnn.cursor()
+            cursor.execute("PRAGMA journal_mode = WAL")
+            cursor.execute("PRAGMA synchronous = OFF")
+            cursor.execute("PRAGMA cache_size = -%d" % (self.BULK_CACHE_SIZE))
+            cursor.execute("PRAGMA mmap_size = %d" % (self.BULK_MMAP_SIZE))
+            cursor.close()
+
+        return cnn
+
+    def create_indexes(self, cursor):
+        for name, columns in self.INDEXES:
+            cursor.execute("CREATE index IF NOT EXISTS %s on %s" % \
+                           (name, columns))
+
+    def missing_indexes(self, cursor):
+        cursor.execute("SELECT name from sqlite_master where type = 'index'")
+        names = set([row[0] for row in cursor.fetchall()])
+
+        return [name for name, columns in self.INDEXES if name not in names]
+
+    def end_bulk_load(self):
+        import sqlite3.dbapi2
+
+        Database.end_bulk_load(self)
+
+        if not self.indexes_deferred:
+            # The database already existed, nothing was bulk loaded
+            return
+
+        self.indexes_deferred = False
+
+        cnn = self.connect()
+        cursor = cnn.cursor()
+        printdbg("Creating indexes")
+        self.create_indexes(cursor)
+        cnn.commit()
+
+        # Back to the rollback journal, it fails while other
+        # processes are still using the database in WAL mode
+        try:
+            cursor.execute("PRAGMA journal_mode = DELETE")
+        except sqlite3.dbapi2.OperationalError, e:
+            printerr("Couldn't leave the WAL journal mode, the database " + \
+                     "%s stays in it: %s", (self.database, str(e)))
+        cursor.close()
+        cnn.close()
 
     def _create_views(self, cursor):
         Database._create_views(self, cursor)
@@ -531,16 +868,95 @@ class SqliteDatabase(Database):
                             tag_id integer,
                             commit_id integer
                             )""")
-            cursor.execute("CREATE index files_file_name on files(file_name)")
-            cursor.execute("CREATE index scmlog_date on scmlog(date)")
-            cursor.execute("CREATE index scmlog_repo on scmlog(repository_id)")
+            if self.bulk_load:
+                self.indexes_deferred = True
+            else:
+                self.create_indexes(cursor)
             self._create_views(cursor)
         except sqlite3.dbapi2.OperationalError as e:
             printdbg("Exception creating SQLite tables: " + str(e))
+            # A bulk load interrupted before creating the indexes
+            # is finished by end_bulk_load
+            if self.bulk_load and self.missing_indexes(cursor):
+                self.indexes_deferred = True
             raise TableAlreadyExists
         except:
             raise
 
+        self.create_action_lines_table(cursor)
+
+    def create_action_lines_table(self, cursor):
+        import sqlite3.dbapi2
+
+        try:
+            cursor.execute("""CREATE TABLE action_lines (
+                            action_id integer primary key,
+                            added integer,
+                            removed integer
+                            )""")
+        except sqlite3.dbapi2.OperationalError as e:
+            printdbg("Exception creating SQLite tables: " + str(e))
+            raise TableAlreadyExists
+
+    def connect_sequences(self):
+        # SQLite allows only one writer at a time, and the connection
+        # inserting rows might be in the middle of a transaction when
+        # new ids are needed, so the sequences live in a file of their own.
+        # The connection is shared by all the threads asking for ids,
+        # IdAllocator serializes its use.
+        import sqlite3.dbapi2 as db
+
+        return db.connect(self.database + ".ids", 30,
+                          check_same_thread=False)
+
+    def create_sequences_table(self, cursor):
+        cursor.execute("""CREATE TABLE IF NOT EXISTS id_sequences (
+                        name varchar primary key,
+                        next_id integer
+                        )""")
+
+    def create_names_table(self, cursor):
+        cursor.execute("""CREATE TABLE IF NOT EXISTS id_names (
+                        name_table varchar,
+                        name varchar,
+                        id integer,
+                        primary key (name_table, name)
+                        )""")
+        cursor.execute("DELETE FROM id_names")
+
+    def claim_names(self, cursor, table, names):
+        cursor.executemany("""INSERT OR IGNORE INTO id_names
+                            (name_table, name, id) values (?, ?, ?)""",
+                           [(table, name, id) for name, id in names])
+
+        return self._get_claimed_names(cursor, table,
+                                       [name for name, id in names])
+
+    def create_sequence(self, cnn, name, next_id):
+        cursor = cnn.cursor()
+        cursor.execute("""INSERT OR IGNORE INTO id_sequences (name, next_id)
+                        values (?, ?)""", (name, next_id))
+        cursor.close()
+        cnn.commit()
+
+    def reserve_ids(self, cnn, name, n):
+        # The update locks the database until the commit
+        cursor = cnn.cursor()
+        cursor.execute("""UPDATE id_sequences SET next_id = next_id + ?
+                        where name = ?""", (n, name))
+        if cursor.rowcount == 0:
+            cursor.close()
+            cnn.rollback()
+            return None
+
+        cursor.execute("SELECT next_id from id_sequences where name = ?",
+                       (name,))
+        next_id = cursor.fetchone()[0]
+        cursor.close()
+        cnn.commit()
+
+        return next_id - n
+
     def to_binary(self, data):
         import sqlite3.dbapi2
 
@@ -550,6 +966,13 @@ class SqliteDatabase(Database):
 class MysqlDatabase(Database):
 
     place_holder = "%s"
+
+    # Upper bound of the size of the multi-row INSERT statements, it
+    # must be lower than max_allowed_packet (1MB by default)
+    MAX_INSERT_SIZE = 512 * 1024
+
+    _values_re = re.compile(r"^(.*\bvalues)\s*(\(.*\))\s*$",
+                            re.IGNORECASE | re.DOTALL)
     
     def __init__(self, database, username, password, hostname):
         Database.__init__(self, database)
@@ -560,18 +983,50 @@ class MysqlDatabase(Database):
         
         self.db = None
 
+    def insert_many(self, cursor, query, rows):
+        """Inserts the rows with multi-row INSERT statements of up to
+        MAX_INSERT_SIZE bytes, so that every statement is a single
+        round trip to the server. Returns the number of statements
+        run"""
+        if not rows:
+            return 0
+
+        match = self._values_re.match(statement(query, self.place_holder))
+        head = match.group(1) + " "
+        template = match.group(2)
+
+        literal = cursor.connection.literal
+        values = []
+        size = len(head)
+        n_statements = 1
+        for row in rows:
+            value = template % literal(tuple(row))
+            if values and size + len(value) + 1 > self.MAX_INSERT_SIZE:
+                cursor.execute(head + ",".join(values))
+                n_statements += 1
+                values = []
+                size = len(head)
+            values.append(value)
+            size += len(value) + 1
+
+        cursor.execute(head + ",".join(values))
+
+        return n_statements
+
     def connect(self):
         import MySQLdb
         import _mysql_exceptions
 
         try:
             if self.password is not None:
-                return MySQLdb.connect(self.hostname, self.username, 
-                                       self.password, self.database, 
-                                       charset='utf8')
+                cnn = MySQLdb.connect(self.hostname, self.username, 
+                                      self.password, self.database, 
+                                      charset='utf8')
             else:
-                return MySQLdb.connect(self.hostname, self.username, 
-                                       db=self.database, charset='utf8')
+                cnn = MySQLdb.connect(self.hostname, self.username, 
+                                      db=self.database, charset='utf8')
+            self.n_connections += 1
+            return cnn
         except _mysql_exceptions.OperationalError, e:
             if e.args[0] == 1049:
                 raise DatabaseNotFound
@@ -582,6 +1037,29 @@ class MysqlDatabase(Database):
         except:
             raise
 
+    def is_alive(self, cnn):
+        try:
+            cnn.ping()
+        except Exception:
+            return False
+
+        return True
+
+    def icursor(self, cnn, size=100):
+        # MySQLdb stores the whole result set on the client unless a
+        # server side cursor is used, and a connection with a pending
+        # server side result can't run any other statement, so the
+        # results are streamed over a connection of their own.
+        import MySQLdb.cursors
+
+        stream_cnn = self.connect()
+        cursor = stream_cnn.cursor(MySQLdb.cursors.SSCursor)
+        # Rows are consumed at the pace of the caller, don't let the
+        # server drop us while we are busy with a chunk
+        cursor.execute("SET SESSION net_write_timeout = 3600")
+
+        return ICursor(cursor, size, stream_cnn)
+
     def _create_views(self, cursor):
         Database._create_views(self, cursor)
         view = """create view actions_file_names as
@@ -697,6 +1175,77 @@ class MysqlDatabase(Database):
         except:
             raise
 
+        self.create_action_lines_table(cursor)
+
+    def create_action_lines_table(self, cursor):
+        import _mysql_exceptions
+
+        try:
+            cursor.execute("""CREATE TABLE action_lines (
+                            action_id INT primary key,
+                            added INT,
+                            removed INT
+                            -- FOREIGN KEY (action_id) REFERENCES actions(id)
+                            ) CHARACTER SET=utf8 ENGINE=MyISAM""")
+        except _mysql_exceptions.OperationalError, e:
+            if e.args[0] == 1050:
+                raise TableAlreadyExists
+            else:
+                raise DatabaseException(str(e))
+
+    def create_sequences_table(self, cursor):
+        cursor.execute("""CREATE TABLE IF NOT EXISTS id_sequences (
+                        name varchar(64) primary key,
+                        next_id INT
+                        ) CHARACTER SET=utf8 ENGINE=MyISAM""")
+
+    def create_names_table(self, cursor):
+        # Names are compared byte by byte, like SQLite does, so names
+        # differing only in case aren't taken for the same one. MyISAM
+        # tables aren't transactional, a process dying between claiming
+        # a name and inserting its row leaves the claim behind until
+        # the next run.
+        cursor.execute("""CREATE TABLE IF NOT EXISTS id_names (
+                        name_table varchar(16),
+                        name varbinary(767),
+                        id INT,
+                        primary key (name_table, name)
+                        ) CHARACTER SET=utf8 ENGINE=MyISAM""")
+        cursor.execute("DELETE FROM id_names")
+
+    def claim_names(self, cursor, table, names):
+        cursor.executemany("""INSERT IGNORE INTO id_names
+                            (name_table, name, id) values (%s, %s, %s)""",
+                           [(table, name, id) for name, id in names])
+
+        return self._get_claimed_names(cursor, table,
+                                       [name for name, id in names])
+
+    def create_sequence(self, cnn, name, next_id):
+        cursor = cnn.cursor()
+        cursor.execute("""INSERT IGNORE INTO id_sequences (name, next_id)
+                        values (%s, %s)""", (name, next_id))
+        cursor.close()
+        cnn.commit()
+
+    def reserve_ids(self, cnn, name, n):
+        # LAST_INSERT_ID(expr) keeps the updated value for this
+        # connection, so the reservation is a single atomic statement
+        cursor = cnn.cursor()
+        cursor.execute("""UPDATE id_sequences
+                        SET next_id = LAST_INSERT_ID(next_id + %s)
+                        where name = %s""", (n, name))
+        if cursor.rowcount == 0:
+            cursor.close()
+            return None
+
+        cursor.execute("SELECT LAST_INSERT_ID()")
+        next_id = cursor.fetchone()[0]
+        cursor.close()
+        cnn.commit()
+
+        return next_id - n
+
 
 # TODO
 # class CAPostgresDatabase (CADatabase):
@@ -765,6 +1314,53 @@ def execute_statement(statement, parameters, cursor, db, error_message,
             raise exception(e)
 
 
+def _execute_batch(run, query, rows, cursor, db, error_message, exception):
+    if isinstance(db, SqliteDatabase):
+        import sqlite3.dbapi2 as module
+    elif isinstance(db, MysqlDatabase):
+        import _mysql_exceptions as module
+
+    try:
+        run(cursor, query, rows)
+        return
+    except module.OperationalError as e:
+        printerr(error_message + ": %s, trying the %d rows one by one",
+                 (e, len(rows)))
+    except Exception as e:
+        raise exception(e)
+
+    # Some of the rows might be in the database already
+    query = statement(query, db.place_holder)
+    for row in rows:
+        try:
+            cursor.execute(query, row)
+        except module.IntegrityError:
+            continue
+        except module.OperationalError as e:
+            printerr(error_message + ": %s, skipping the row " + \
+                     "starting with %r", (e, tuple(row[:2])))
+        except Exception as e:
+            raise exception(e)
+
+
+def execute_insert_many(query, rows, cursor, db, error_message,
+                        exception=Exception):
+    """Insert rows with db.insert_many, handling errors like
+    execute_statement does. If the batch fails, its rows are inserted
+    one by one, so that only the failing ones are skipped."""
+    _execute_batch(db.insert_many, query, rows, cursor, db, error_message,
+                   exception)
+
+
+def execute_many(query, rows, cursor, db, error_message,
+                 exception=Exception):
+    """Runs query, an UPDATE or DELETE statement with ? place holders,
+    once for every row with db.execute_many, handling errors like
+    execute_insert_many does"""
+    _execute_batch(db.execute_many, query, rows, cursor, db, error_message,
+                   exception)
+
+
 def get_repo_id(uri, cursor, db):
     execute_statement(statement("SELECT id from repositories where uri = ?",
                                 db.place_holder),
@@ -0,0 +1,162 @@
+# Copyright (C) 2008 LibreSoft
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors :
+#       Carlos Garcia Campos <carlosgc@gsyc.escet.urjc.es>
+
+import os
+import mmap
+import struct
+import heapq
+import calendar
+import tempfile
+
+from ContentHandler import ContentHandler
+from CommitCodec import encode_commit, decode_commit
+from utils import printdbg, cvsanaly_cache_dir
+
+
+class FileTempLog(object):
+    """Temporary storage for the commits while the log is parsed.
+
+    Commits are appended to a spill file in the cache directory as
+    CommitCodec records framed by their length on both ends, so the file
+    can be walked forwards and backwards. A (date, offset) index is kept
+    to replay the commits by date: it's sorted in memory in runs of
+    RUN_SIZE entries that are spilled to disk and merged when reading,
+    so memory stays bounded no matter how many commits are stored.
+    Records are read back through mmap.
+    """
+
+    RUN_SIZE = 500000
+
+    LENGTH = struct.Struct("<I")
+    INDEX_ENTRY = struct.Struct("<qQ")
+
+    def __init__(self):
+        fd, self.filename = tempfile.mkstemp(prefix="templog-",
+                                             dir=cvsanaly_cache_dir())
+        self.fd = os.fdopen(fd, "wb")
+        self.offset = 0
+
+        self.index = []
+        self.runs = []
+
+    def __spill_index(self):
+        self.index.sort()
+
+        fd, filename = tempfile.mkstemp(prefix="templog-run-",
+                                        dir=cvsanaly_cache_dir())
+        f = os.fdopen(fd, "wb")
+        pack = self.INDEX_ENTRY.pack
+        f.write("".join([pack(*entry) for entry in self.index]))
+        f.close()
+
+        printdbg("FileTempLog: spilled index run %s (%d entries)",
+                 (filename, len(self.index)))
+        self.runs.append(filename)
+        self.index = []
+
+    def __read_run(self, filename):
+        f = open(filename, "rb")
+        size = self.INDEX_ENTRY.size
+        unpack = self.INDEX_ENTRY.unpack
+        data = f.read(size * 4096)
+        while data:
+            for i in xrange(0, len(data), size):
+                yield unpack(data[i:i + size])
+            data = f.read(size * 4096)
+        f.close()
+
+    def insert(self, commit):
+        obj = encode_commit(commit)
+        length = self.LENGTH.pack(len(obj))
+        self.fd.write(length)
+        self.fd.write(obj)
+        self.fd.write(length)
+
+        if commit.date is not None:
+            date = calendar.timegm(commit.date.timetuple())
+        else:
+            date = 0
+        self.index.append((date, self.offset))
+        if len(self.index) >= self.RUN_SIZE:
+            self.__spill_index()
+
+        self.offset += len(obj) + 2 * self.LENGTH.size
+
+    def __offsets_by_revision(self, mm):
+        # Records are stored as parsed, newest revision first
+        size = self.LENGTH.size
+        unpack = self.LENGTH.unpack
+        end = len(mm)
+        while end > 0:
+            length = unpack(mm[end - size:end])[0]
+            end -= length + 2 * size
+            yield end
+
+    def __offsets_by_date(self):
+        self.index.sort()
+        runs = [self.__read_run(run) for run in self.runs]
+        runs.append(iter(self.index))
+
+        for date, offset in heapq.merge(*runs):
+            yield offset
+
+    def foreach(self, cb, order=None):
+        self.flush()
+
+        if self.offset == 0:
+            return
+
+        f = open(self.filename, "rb")
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if order is None or order == ContentHandler.ORDER_REVISION:
+            offsets = self.__offsets_by_revision(mm)
+        else:
+            offsets = self.__offsets_by_date()
+
+        size = self.LENGTH.size
+        unpack = self.LENGTH.unpack
+        for offset in offsets:
+            length = unpack(mm[offset:offset + size])[0]
+            start = offset + size
+            cb(decode_commit(mm[start:start + length]))
+
+        mm.close()
+        f.close()
+
+    def flush(self):
+        if not self.fd.closed:
+            self.fd.flush()
+
+    def clear(self):
+        if not self.fd.closed:
+            self.fd.close()
+
+        for filename in self.runs + [self.filename]:
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+        self.runs = []
+        self.index = []
+        self.offset = 0
+
+    def __del__(self):
+        self.clear()
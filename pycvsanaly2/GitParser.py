@@ -17,12 +17,18 @@
 # Authors :
 #       Carlos Garcia Campos <carlosgc@gsyc.escet.urjc.es>
 
+import os
 import re
 import time
 import datetime
+from itertools import imap
+from multiprocessing import Pool
 
 from Parser import Parser
+from ContentHandler import ContentHandler
 from Repository import Commit, Action, Person
+from CommitCodec import encode_commit, decode_commit
+from Command import Command
 from utils import printout, printdbg
 from Config import Config
 
@@ -102,6 +108,10 @@ class GitParser(Parser):
     patterns['svn-tag'] = re.compile("^svn path=/tags/(.*)/?; " +
                                      "revision=([0-9]+)$")
 
+    # Number of commits in every chunk of the log
+    # parsed by parse_repository_parallel()
+    PARALLEL_CHUNK_SIZE = 2000
+
     def __init__(self):
         Parser.__init__(self)
 
@@ -123,6 +133,165 @@ class GitParser(Parser):
             self.branch = None
             self.branches = None
 
+    def _add_commit(self, commit, parents, decorate):
+        if self.commit is not None:
+            # Skip commits on svn tags
+            if self.branch.tail.svn_tag is None:
+                self.handler.commit(self.branch.tail.commit)
+
+        self.commit = commit
+        git_commit = self.GitCommit(self.commit, parents)
+
+        # If a specific branch has been configured, there
+        # won't be any decoration, so a branch needs to be
+        # created
+        if Config().branch is not None:
+            self.branch = self.GitBranch(self.GitBranch.LOCAL, 
+                                         Config().branch, 
+                                         git_commit)
+
+        branch = None
+        if decorate:
+            # Remote branch
+            m = re.search(self.patterns['branch'], decorate)
+            if m:
+                branch = self.GitBranch(self.GitBranch.REMOTE, m.group(1), 
+                                        git_commit)
+                printdbg("Branch '%s' head at acommit %s", 
+                         (branch.name, self.commit.revision))
+            else:
+                # Local Branch
+                m = re.search(self.patterns['local-branch'], decorate)
+                if m:
+                    branch = self.GitBranch(self.GitBranch.LOCAL, 
+                                            m.group(1), git_commit)
+                    printdbg("Commit %s on local branch '%s'", 
+                             (self.commit.revision, branch.name))
+                    # If local branch was merged we just ignore this 
+                    # decoration
+                    if self.branch and \
+                    self.branch.is_my_parent(git_commit):
+                        printdbg("Local branch '%s' was merged", 
+                                 (branch.name,))
+                        branch = None
+                else:
+                    # Stash
+                    m = re.search(self.patterns['stash'], decorate)
+                    if m:
+                        branch = self.GitBranch(self.GitBranch.STASH, 
+                                                "stash", git_commit)
+                        printdbg("Commit %s on stash", 
+                                 (self.commit.revision,))
+            # Tag
+            m = re.search(self.patterns['tag'], decorate)
+            if m:
+                self.commit.tags = [m.group(1)]
+                printdbg("Commit %s tagged as '%s'", 
+                         (self.commit.revision, self.commit.tags[0]))
+
+        if branch is not None and self.branch is not None:
+            # Detect empty branches. Ideally, the head of a branch
+            # can't have children. When this happens is because the
+            # branch is empty, so we just ignore such branch
+            if self.branch.is_my_parent(git_commit):
+                printout("Warning: Detected empty branch '%s', " + \
+                         "it'll be ignored", (branch.name,))
+                branch = None
+
+        if len(self.branches) >= 2:
+            # If current commit is the start point of a new branch
+            # we have to look at all the current branches since
+            # we haven't inserted the new branch yet.
+            # If not, look at all other branches excluding the current one
+            for i, b in enumerate(self.branches):
+                if i == 0 and branch is None:
+                    continue
+
+                if b.is_my_parent(git_commit):
+                    # We assume current branch is always the last one
+                    # AFAIK there's no way to make sure this is right
+                    printdbg("Start point of branch '%s' at commit %s", 
+                             (self.branches[0].name, self.commit.revision))
+                    self.branches.pop(0)
+                    self.branch = b
+
+        if self.branch and self.branch.tail.svn_tag is not None and \
+        self.branch.is_my_parent(git_commit):
+            # There's a pending tag in previous commit
+            pending_tag = self.branch.tail.svn_tag
+            printdbg("Move pending tag '%s' from previous commit %s " + \
+                     "to current %s", (pending_tag, 
+                                       self.branch.tail.commit.revision,
+                                       self.commit.revision))
+            if self.commit.tags and pending_tag not in self.commit.tags:
+                self.commit.tags.append(pending_tag)
+            else:
+                self.commit.tags = [pending_tag]
+            self.branch.tail.svn_tag = None
+
+        if branch is not None:
+            self.branch = branch
+
+            # Insert master always at the end
+            if branch.is_remote() and branch.name == 'master':
+                self.branches.append(self.branch)
+            else:
+                self.branches.insert(0, self.branch)
+        else:
+            self.branch.set_tail(git_commit)
+            
+        if parents and len(parents) > 1:
+            #Skip merge commits
+            self.commit = None
+
+    def _add_chunks(self, results):
+        for n_lines, records in results:
+            if self.n_line == 0:
+                self._begin()
+            self.n_line += n_lines
+
+            for data, parents, decorate in records:
+                self._add_commit(decode_commit(data), parents, decorate)
+
+    def parse_repository_parallel(self, path, jobs, branch=None,
+                                  numstat=False):
+        """Parses the log of the git repository checked out in path
+        using jobs worker processes.
+
+        The topologically sorted list of revisions is split into
+        chunks of PARALLEL_CHUNK_SIZE commits, every worker runs its own
+        git log and parses the commits of a chunk, and the chunks are
+        merged back here in log order. Branches and tags are assigned
+        while merging, since they depend on the commits of the previous
+        chunks. With a single job the chunks are parsed in this process.
+        If numstat is True, the actions get the number of lines added
+        and removed too.
+        """
+        cmd = Command(['git', 'rev-list', '--topo-order', branch or '--all'],
+                      path)
+        revs = cmd.run().split()
+        size = self.PARALLEL_CHUNK_SIZE
+        chunks = [(path, revs[i:i + size], numstat) \
+                  for i in xrange(0, len(revs), size)]
+        del revs
+
+        printdbg("GitParser: parsing %d chunks with %d processes", 
+                 (len(chunks), jobs))
+        if jobs <= 1:
+            self._add_chunks(imap(_parse_log_chunk, chunks))
+            return
+
+        pool = Pool(jobs)
+        try:
+            self._add_chunks(pool.imap(_parse_log_chunk, chunks))
+        except:
+            pool.terminate()
+            raise
+        else:
+            pool.close()
+        finally:
+            pool.join()
+
     def _parse_line(self, line):
         if line is None or line == '':
             return
@@ -135,121 +304,14 @@ class GitParser(Parser):
         # Commit
         match = self.patterns['commit'].match(line)
         if match:
-            if self.commit is not None:
-                # Skip commits on svn tags
-                if self.branch.tail.svn_tag is None:
-                    self.handler.commit(self.branch.tail.commit)
-
-            self.commit = Commit()
-            self.commit.revision = match.group(1)
+            commit = Commit()
+            commit.revision = match.group(1)
 
             parents = match.group(3)
             if parents:
                 parents = parents.split()
-            git_commit = self.GitCommit(self.commit, parents)
-
-            # If a specific branch has been configured, there
-            # won't be any decoration, so a branch needs to be
-            # created
-            if Config().branch is not None:
-                self.branch = self.GitBranch(self.GitBranch.LOCAL, 
-                                             Config().branch, 
-                                             git_commit)
-
-            decorate = match.group(5)
-            branch = None
-            if decorate:
-                # Remote branch
-                m = re.search(self.patterns['branch'], decorate)
-                if m:
-                    branch = self.GitBranch(self.GitBranch.REMOTE, m.group(1), 
-                                            git_commit)
-                    printdbg("Branch '%s' head at acommit %s", 
-                             (branch.name, self.commit.revision))
-                else:
-                    # Local Branch
-                    m = re.search(self.patterns['local-branch'], decorate)
-                    if m:
-                        branch = self.GitBranch(self.GitBranch.LOCAL, 
-                                                m.group(1), git_commit)
-                        printdbg("Commit %s on local branch '%s'", 
-                                 (self.commit.revision, branch.name))
-                        # If local branch was merged we just ignore this 
-                        # decoration
-                        if self.branch and \
-                        self.branch.is_my_parent(git_commit):
-                            printdbg("Local branch '%s' was merged", 
-                                     (branch.name,))
-                            branch = None
-                    else:
-                        # Stash
-                        m = re.search(self.patterns['stash'], decorate)
-                        if m:
-                            branch = self.GitBranch(self.GitBranch.STASH, 
-                                                    "stash", git_commit)
-                            printdbg("Commit %s on stash", 
-                                     (self.commit.revision,))
-                # Tag
-                m = re.search(self.patterns['tag'], decorate)
-                if m:
-                    self.commit.tags = [m.group(1)]
-                    printdbg("Commit %s tagged as '%s'", 
-                             (self.commit.revision, self.commit.tags[0]))
-
-            if branch is not None and self.branch is not None:
-                # Detect empty branches. Ideally, the head of a branch
-                # can't have children. When this happens is because the
-                # branch is empty, so we just ignore such branch
-                if self.branch.is_my_parent(git_commit):
-                    printout("Warning: Detected empty branch '%s', " + \
-                             "it'll be ignored", (branch.name,))
-                    branch = None
-
-            if len(self.branches) >= 2:
-                # If current commit is the start point of a new branch
-                # we have to look at all the current branches since
-                # we haven't inserted the new branch yet.
-                # If not, look at all other branches excluding the current one
-                for i, b in enumerate(self.branches):
-                    if i == 0 and branch is None:
-                        continue
-
-                    if b.is_my_parent(git_commit):
-                        # We assume current branch is always the last one
-                        # AFAIK there's no way to make sure this is right
-                        printdbg("Start point of branch '%s' at commit %s", 
-                                 (self.branches[0].name, self.commit.revision))
-                        self.branches.pop(0)
-                        self.branch = b
-
-            if self.branch and self.branch.tail.svn_tag is not None and \
-            self.branch.is_my_parent(git_commit):
-                # There's a pending tag in previous commit
-                pending_tag = self.branch.tail.svn_tag
-                printdbg("Move pending tag '%s' from previous commit %s " + \
-                         "to current %s", (pending_tag, 
-                                           self.branch.tail.commit.revision,
-                                           self.commit.revision))
-                if self.commit.tags and pending_tag not in self.commit.tags:
-                    self.commit.tags.append(pending_tag)
-                else:
-                    self.commit.tags = [pending_tag]
-                self.branch.tail.svn_tag = None
 
-            if branch is not None:
-                self.branch = branch
-
-                # Insert master always at the end
-                if branch.is_remote() and branch.name == 'master':
-                    self.branches.append(self.branch)
-                else:
-                    self.branches.insert(0, self.branch)
-            else:
-                self.branch.set_tail(git_commit)
-            
-            if parents and len(parents) > 1:
-                #Skip merge commits
-                self.commit = None
+            self._add_commit(commit, parents, match.group(5))
             return
         elif self.commit is None:
             return
@@ -318,3 +380,325 @@ class GitParser(Parser):
         self.commit.message += line + '\n'
 
         assert True, "Not match for line %s" % (line)
+
+
+class GitMachineParser(GitParser):
+    """A parser for git log output in a NUL delimited machine format.
+
+    Every commit is a fixed list of NUL terminated fields followed by
+    its name-status entries, so it's split positionally without any
+    regex dispatch. Commits are the same GitParser builds out of the
+    --pretty=fuller output.
+
+    >>> p = GitMachineParser()
+    >>> p._message_from_body("Fix\\n\\n\\tdetails\\n")
+    '    Fix\\n    \\n            details\\n'
+    """
+
+    # Header fields: hash and parents, decorations, author name and
+    # email, committer name and email, author date and raw body
+    N_FIELDS = 8
+    LOG_FORMAT = "%x00".join(['%H %P', '%D', '%aN', '%aE', '%cN', '%cE',
+                              '%ai', '%B']) + "%x00"
+
+    # git log options producing the format understood by the parser
+    LOG_OPTIONS = ['-z', '--format=' + LOG_FORMAT, '--name-status',
+                   '--decorate=full', '-M', '-C']
+
+    # Same as LOG_OPTIONS, but every action also gets the number of
+    # lines added and removed. git doesn't combine --numstat with
+    # --name-status, the status letters are taken from --raw instead
+    NUMSTAT_LOG_OPTIONS = ['-z', '--format=' + LOG_FORMAT, '--raw',
+                           '--numstat', '--decorate=full', '-M', '-C']
+
+    def __init__(self):
+        GitParser.__init__(self)
+
+        self.fields = []
+        self.entry = None
+        self.entry_size = 0
+        self.entry_cb = None
+        self.incomplete_field = ""
+
+        # Actions of the current commit in diff order, to match the
+        # --numstat entries that come after all of them
+        self.file_actions = []
+        self.n_numstat = 0
+
+    def _message_from_body(self, body):
+        # Mimic the indentation and tab expansion of --pretty=fuller
+        return "".join(["    %s\n" % (line.expandtabs(8))
+                        for line in body.splitlines()])
+
+    def _add_commit_from_fields(self):
+        (revs, decorate, author_name, author_email, committer_name,
+         committer_email, date, body) = self.fields
+
+        self.file_actions = []
+        self.n_numstat = 0
+
+        revs = revs.split()
+        commit = Commit()
+        commit.revision = revs[0]
+        self._add_commit(commit, revs[1:] or None, decorate)
+        if self.commit is None:
+            return
+
+        commit.author = Person()
+        commit.author.name = author_name
+        commit.author.email = author_email
+        self.handler.author(commit.author)
+
+        commit.committer = Person()
+        commit.committer.name = committer_name
+        commit.committer.email = committer_email
+        self.handler.committer(commit.committer)
+
+        # Author date in the author's timezone: 2011-01-12 17:17:30 -0800
+        commit.date = datetime.datetime(*(time.strptime(
+            date[:19], "%Y-%m-%d %H:%M:%S")[0:6]))
+        commit.message = self._message_from_body(body)
+
+    def _add_action_from_entry(self):
+        status = self.entry[0][0]
+        if status in 'MAD':
+            action = Action()
+            action.type = status
+            action.f1 = self.entry[1]
+        elif status in 'RC':
+            action = Action()
+            if status == 'R':
+                action.type = 'V'
+            else:
+                action.type = status
+            action.f1 = self.entry[2]
+            action.f2 = self.entry[1]
+            action.rev = self.commit.revision
+        else:
+            self.file_actions.append(None)
+            return
+
+        self.commit.actions.append(action)
+        self.file_actions.append(action)
+        self.handler.file(action.f1)
+
+    def _add_lines_from_entry(self):
+        action = self.file_actions[self.n_numstat]
+        self.n_numstat += 1
+        if action is None:
+            return
+
+        # Binary files don't have lines: -\t-\tpath
+        added, removed = self.entry[0], self.entry[1]
+        if added != '-':
+            action.added = int(added)
+            action.removed = int(removed)
+
+    def _parse_field(self, field):
+        if len(self.fields) < self.N_FIELDS:
+            if not self.fields:
+                field = field.lstrip('\n')
+            self.fields.append(field)
+            if len(self.fields) == self.N_FIELDS:
+                self._add_commit_from_fields()
+            return
+
+        if self.entry is None:
+            field = field.lstrip('\n')
+            if not field:
+                # End of the commit header
+                return
+
+            if field[0] == ':':
+                # --raw: ":100644 100644 d119148 43e4a00 R100"
+                field = field[field.rfind(' ') + 1:]
+                self.entry = [field]
+                self.entry_size = field[0] in 'RC' and 3 or 2
+                self.entry_cb = self._add_action_from_entry
+            elif '\t' in field:
+                # --numstat: "1\t0\tpath", or "1\t0\t" followed by
+                # the old and new paths for renames and copies
+                self.entry = field.split('\t', 2)
+                self.entry_size = self.entry[2] and 3 or 5
+                self.entry_cb = self._add_lines_from_entry
+            elif len(field) >= 40:
+                # Status letters are short, commit hashes aren't
+                self.fields = [field]
+                return
+            else:
+                # --name-status: "M"
+                self.entry = [field]
+                self.entry_size = field[0] in 'RC' and 3 or 2
+                self.entry_cb = self._add_action_from_entry
+        else:
+            self.entry.append(field)
+
+        if len(self.entry) < self.entry_size:
+            return
+
+        if self.commit is not None:
+            self.entry_cb()
+        self.entry = None
+
+    def feed_buffer(self, data):
+        if self.n_line == 0:
+            self._begin()
+
+        fields = (self.incomplete_field + data).split('\0')
+        self.incomplete_field = fields.pop()
+        self.n_line += len(fields) or 1
+
+        for field in fields:
+            self._parse_field(field)
+
+    # Fields are NUL terminated, line boundaries don't matter
+    feed = feed_buffer
+
+    def feed_lines(self, lines):
+        self.feed_buffer("\n".join(lines) + "\n")
+
+    def end(self):
+        if self.incomplete_field.strip('\n'):
+            self._parse_field(self.incomplete_field)
+        self.incomplete_field = ""
+
+        GitParser.end(self)
+
+
+class GitLogChunkParser(GitMachineParser):
+    """Parses a chunk of a git log without assigning branches.
+
+    Commits are collected along with their parents and decorations
+    so that a GitParser can assign branches and tags afterwards,
+    going through the chunks in log order.
+    """
+
+    def __init__(self):
+        GitMachineParser.__init__(self)
+
+        self.records = []
+
+    def _add_commit(self, commit, parents, decorate):
+        self.records.append((commit, parents, decorate))
+
+        if parents and len(parents) > 1:
+            #Skip merge commits
+            self.commit = None
+        else:
+            self.commit = commit
+
+
+def _parse_log_chunk(args):
+    path, revs, numstat = args
+
+    if numstat:
+        options = GitMachineParser.NUMSTAT_LOG_OPTIONS
+    else:
+        options = GitMachineParser.LOG_OPTIONS
+
+    parser = GitLogChunkParser()
+    # --no-walk=unsorted shows the revisions read from stdin in the
+    # given order, so the chunk is exactly a slice of the whole log
+    cmd = Command(['git', 'log', '--no-walk=unsorted', '--stdin'] + \
+                  options, path)
+    cmd.run("\n".join(revs) + "\n", parser_out_func=parser.feed_buffer)
+
+    # Commits are sent back to the parent process encoded, it's
+    # much cheaper than pickling the objects
+    return parser.n_line, [(encode_commit(commit), parents, decorate) \
+                           for commit, parents, decorate in parser.records]
+
+
+# git options producing the log GitParser reads, as
+# repositoryhandler's GitRepository.log runs them
+FULLER_LOG_OPTIONS = ['--topo-order', '--parents', '--name-status',
+                      '--pretty=fuller', '--decorate=full', '-M', '-C']
+
+
+def _make_reference_repository(path):
+    """Creates in path a git repository with a multi-line message,
+    a rename, a tag, a branch, a removal and a merge"""
+    env = {'GIT_AUTHOR_NAME': 'Ann Author',
+           'GIT_AUTHOR_EMAIL': 'ann@example.com',
+           'GIT_COMMITTER_NAME': 'Carl Committer',
+           'GIT_COMMITTER_EMAIL': 'carl@example.com'}
+
+    def git(*args):
+        Command(['git'] + list(args), path, env).run()
+
+    def commit(n, message):
+        env['GIT_AUTHOR_DATE'] = '2011-03-12 23:06:40 -0800 +%d hours' % n
+        env['GIT_COMMITTER_DATE'] = '2011-03-13 08:07:40 +0100 +%d hours' % n
+        git('commit', '-q', '-m', message)
+
+    def write(name, data):
+        f = open(os.path.join(path, name), 'a')
+        f.write(data)
+        f.close()
+        git('add', name)
+
+    git('init', '-q')
+    write('one.c', 'one\n')
+    write('two.c', 'two\n')
+    commit(0, 'Initial import')
+    write('one.c', 'fix\n')
+    commit(1, 'Fix one\n\n\tTabbed details\nand more')
+    git('mv', 'two.c', 'three.c')
+    commit(2, 'Rename two')
+    git('tag', 'v1')
+    git('checkout', '-q', '-b', 'side')
+    write('side.c', 'side\n')
+    commit(3, 'Side work')
+    git('checkout', '-q', 'master')
+    git('rm', '-q', 'one.c')
+    commit(4, 'Remove one')
+    env['GIT_COMMITTER_DATE'] = '2011-03-13 08:07:40 +0100 +5 hours'
+    git('merge', '-q', '--no-ff', '-m', 'Merge side', 'side')
+
+
+def _compare_log_formats(path):
+    """Parses the log of the git repository in path out of the
+    --pretty=fuller output with GitParser and out of the -z output
+    with GitMachineParser, the way parse_repository_parallel runs it.
+    Returns the commits of both as lists of comparable tuples.
+
+    >>> import tempfile, shutil
+    >>> path = tempfile.mkdtemp()
+    >>> _make_reference_repository(path)
+    >>> fuller, machine = _compare_log_formats(path)
+    >>> len(fuller), fuller == machine
+    (5, True)
+    >>> [(c[0], c[-2], c[-1]) for c in fuller] #doctest: +NORMALIZE_WHITESPACE
+    [('Side work', 'master', []), ('Remove one', 'master', []),
+     ('Rename two', 'master', ['v1']), ('Fix one', 'master', []),
+     ('Initial import', 'master', [])]
+    >>> shutil.rmtree(path)
+    """
+    class Handler(ContentHandler):
+        def __init__(self):
+            ContentHandler.__init__(self)
+            self.commits = []
+
+        def commit(self, commit):
+            self.commits.append(
+                (commit.message.split('\n')[0].strip(), commit.revision, commit.date,
+                 commit.author.name, commit.author.email,
+                 commit.committer.name, commit.committer.email,
+                 commit.message,
+                 [(a.type, a.f1, a.f2) for a in commit.actions],
+                 commit.branch, commit.tags or []))
+
+    fuller = Handler()
+    parser = GitParser()
+    parser.set_content_handler(fuller)
+    out = Command(['git', 'log'] + FULLER_LOG_OPTIONS + ['--all'], path).run()
+    parser.feed_lines(out.splitlines())
+    parser.end()
+
+    machine = Handler()
+    parser = GitParser()
+    parser.set_content_handler(machine)
+    parser.parse_repository_parallel(path, 1)
+    parser.end()
+
+    return fuller.commits, machine.commits
@@ -17,10 +17,12 @@
 # Authors :
 #       Carlos Garcia Campos <carlosgc@gsyc.escet.urjc.es>
 
+import os
+import mmap
 import threading
 from repositoryhandler.backends.watchers import LOG
-from AsyncQueue import AsyncQueue, TimeOut
-from utils import printerr
+from AsyncQueue import AsyncQueue
+from utils import printerr, open_logfile, logfile_compression
 
 
 class RepoOrLogfileRequired(Exception):
@@ -29,6 +31,14 @@ class RepoOrLogfileRequired(Exception):
 
 class LogReader(object):
 
+    # Size of the chunks handed to the callback by start_buffered()
+    BUFFER_SIZE = 4 * 1024 * 1024
+
+    # Lines read from the repository waiting to be parsed,
+    # and lines moved through the queue at once
+    QUEUE_SIZE = 64 * 1024
+    BATCH_SIZE = 1024
+
     def __init__(self):
         self.logfile = None
         self.repo = None
@@ -48,7 +58,7 @@ class LogReader(object):
 
     def _read_from_logfile(self, new_line_cb, user_data):
         try:
-            f = open(self.logfile, 'r')
+            f = open_logfile(self.logfile)
         except IOError, e:
             printerr(str(e))
             return
@@ -60,33 +70,71 @@ class LogReader(object):
 
         f.close()
 
+    def _read_buffers_from_logfile(self, new_buffer_cb, user_data):
+        try:
+            if logfile_compression(self.logfile) is not None:
+                f = open_logfile(self.logfile)
+                data = f.read(self.BUFFER_SIZE)
+                while data:
+                    new_buffer_cb(data, user_data)
+                    data = f.read(self.BUFFER_SIZE)
+                f.close()
+                return
+
+            f = open(self.logfile, 'rb')
+        except IOError, e:
+            printerr(str(e))
+            return
+
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            f.close()
+            return
+
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        for offset in xrange(0, size, self.BUFFER_SIZE):
+            new_buffer_cb(mm[offset:offset + self.BUFFER_SIZE], user_data)
+
+        mm.close()
+        f.close()
+
     def _logreader(self, repo, queue):
+        lines = []
+
         def new_line(data, user_data=None):
-            queue.put(data)
+            lines.append(data)
+            if len(lines) >= self.BATCH_SIZE:
+                queue.put_many(lines)
+                del lines[:]
 
         repo.add_watch(LOG, new_line)
-        repo.log(self.uri or repo.get_uri(), branch=self.branch)
+        try:
+            repo.log(self.uri or repo.get_uri(), branch=self.branch)
+        finally:
+            queue.put_many(lines)
+            queue.close()
         
     def _read_from_repository(self, new_line_cb, user_data):
-        queue = AsyncQueue()
+        queue = AsyncQueue(self.QUEUE_SIZE)
         logreader_thread = threading.Thread(target=self._logreader,
                                              args=(self.repo, queue))
         logreader_thread.setDaemon(True)
         logreader_thread.start()
 
-        # Use the queue with mutexes while the
-        # thread is alive
-        while logreader_thread.isAlive():
-            try:
-                line = queue.get(1)
-            except TimeOut:
-                continue
-            new_line_cb(line, user_data)
-
-        # No threads now, we don't need locks
-        while not queue.empty_unlocked():
-            line = queue.get_unlocked()
-            new_line_cb(line, user_data)
+        # The queue is closed when the log is over
+        try:
+            lines = queue.get_many(self.BATCH_SIZE)
+            while lines:
+                for line in lines:
+                    new_line_cb(line, user_data)
+                lines = queue.get_many(self.BATCH_SIZE)
+        finally:
+            # If the callback failed, drain the queue so that the
+            # reader thread isn't blocked on it forever and the log
+            # command runs to the end and is reaped
+            while queue.get_many(self.BATCH_SIZE):
+                pass
+            logreader_thread.join()
         
     def start(self, new_line_cb, user_data=None):
         if self.logfile is not None:
@@ -100,24 +148,47 @@ class LogReader(object):
             raise RepoOrLogfileRequired("In order to start the log reader " + \
                     "a repository or a logfile has to be provided")
 
+    def start_buffered(self, new_buffer_cb, user_data=None):
+        """Like start(), but the callback receives chunks of the log
+        that don't necessarily end at a line boundary (see
+        Parser.feed_buffer()). Logfiles are memory mapped and handed
+        over in chunks of BUFFER_SIZE bytes.
+        """
+        if self.logfile is not None:
+            try:
+                self._read_buffers_from_logfile(new_buffer_cb, user_data)
+            except IOError, e:
+                printerr(str(e))
+        elif self.repo is not None:
+            self._read_from_repository(new_buffer_cb, user_data)
+        else:
+            raise RepoOrLogfileRequired("In order to start the log reader " + \
+                    "a repository or a logfile has to be provided")
+
 
 class LogWriter(object):
+    """Saves the log to filename, compressed with gzip, bzip2 or xz
+    if it ends in .gz, .bz2 or .xz
+    """
 
-    CHUNK_SIZE = 1024
+    CHUNK_SIZE = 64 * 1024
         
     def __init__(self, filename):
-        self.fd = open(filename, "w")
-        self.buffer = ""
+        self.fd = open_logfile(filename, "w")
+        self.buffer = []
+        self.buffer_size = 0
 
     def add_line(self, line):
-        self.buffer += line
-        if len(self.buffer) >= self.CHUNK_SIZE:
-            self.fd.write(self.buffer)
-            self.buffer = ""
+        self.buffer.append(line)
+        self.buffer_size += len(line)
+        if self.buffer_size >= self.CHUNK_SIZE:
+            self.fd.write("".join(self.buffer))
+            self.buffer = []
+            self.buffer_size = 0
 
     def close(self):
         if self.buffer:
-            self.fd.write(self.buffer)
+            self.fd.write("".join(self.buffer))
         self.fd.close()
         
 
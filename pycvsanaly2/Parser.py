@@ -32,6 +32,8 @@ class Parser(object):
         self.repo_uri = None
         
         self.n_line = 0
+        # Last line of the data given to feed_buffer() if incomplete
+        self.incomplete_line = ""
 
     def set_content_handler(self, handler):
         self.handler = handler
@@ -45,18 +47,47 @@ class Parser(object):
     def _parse_line(self):
         raise NotImplementedError
 
+    def _begin(self):
+        self.handler.begin(self.CONTENT_ORDER)
+
+        if self.repo_uri is not None:
+            self.handler.repository(self.repo_uri)
+
     def feed(self, data):
+        self.feed_lines(data.splitlines())
+
+    def feed_lines(self, lines):
+        """Feeds a list of lines, without their line terminators"""
         if self.n_line == 0:
-            self.handler.begin(self.CONTENT_ORDER)
+            self._begin()
 
-            if self.repo_uri is not None:
-                self.handler.repository(self.repo_uri)
-            
-        for line in data.splitlines():
+        # n_line is the number of the line being parsed,
+        # so that warnings point to it
+        parse_line = self._parse_line
+        for line in lines:
             self.n_line += 1
-            self._parse_line(line)
+            parse_line(line)
+
+    def feed_buffer(self, data):
+        """Feeds a chunk of the log of any size.
+
+        Unlike feed(), data doesn't need to end at a line boundary,
+        an incomplete last line is kept until the next buffer comes.
+        """
+        end = data.rfind('\n') + 1
+        if end == 0:
+            self.incomplete_line += data
+            return
+
+        lines = (self.incomplete_line + data[:end]).splitlines()
+        self.incomplete_line = data[end:]
+        self.feed_lines(lines)
 
     def end(self):
+        if self.incomplete_line:
+            self.feed_lines([self.incomplete_line])
+            self.incomplete_line = ""
+
         if self.n_line <= 0:
             return
         self.flush()
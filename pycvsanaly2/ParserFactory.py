@@ -22,10 +22,12 @@ import re
 
 from CVSParser import CVSParser
 from SVNParser import SVNParser
-from GitParser import GitParser
+from SVNXMLParser import SVNXMLParser
+from GitParser import GitParser, GitMachineParser
 from BzrParser import BzrParser
+from ContentHandler import ContentHandler
 
-from utils import printerr
+from utils import printerr, open_logfile
 
 
 def create_parser_from_logfile(uri):
@@ -33,7 +35,7 @@ def create_parser_from_logfile(uri):
         retval = False
 
         try:
-            f = open(logfile, 'r')
+            f = open_logfile(logfile)
         except IOError, e:
             printerr(str(e))
             return False
@@ -55,7 +57,7 @@ def create_parser_from_logfile(uri):
         retval = False
 
         try:
-            f = open(logfile, 'r')
+            f = open_logfile(logfile)
         except IOError, e:
             printerr(str(e))
             return False
@@ -73,11 +75,71 @@ def create_parser_from_logfile(uri):
 
         return retval
 
+    def svn_logfile_is_ascending(logfile):
+        # svn log -r 1:HEAD lists the oldest revision first
+        try:
+            f = open_logfile(logfile)
+        except IOError, e:
+            printerr(str(e))
+            return False
+
+        patt = re.compile("^r(\d+) \| (.*) \| (.*) \| (.*)$")
+
+        revs = []
+        line = f.readline()
+        while line and len(revs) < 2:
+            match = patt.match(line)
+            if match is not None:
+                revs.append(int(match.group(1)))
+            line = f.readline()
+
+        f.close()
+
+        return len(revs) == 2 and revs[0] < revs[1]
+
+    def logfile_is_svn_xml(logfile):
+        try:
+            f = open_logfile(logfile)
+        except IOError, e:
+            printerr(str(e))
+            return False
+
+        # svn log --xml starts with the XML declaration, if any,
+        # followed by the log element
+        line = f.readline().strip()
+        if line.startswith("<?xml"):
+            line = f.readline().strip()
+
+        f.close()
+
+        return line == "<log>"
+
+    def svn_xml_logfile_is_ascending(logfile):
+        try:
+            f = open_logfile(logfile)
+        except IOError, e:
+            printerr(str(e))
+            return False
+
+        patt = re.compile("^ *revision=\"(\d+)\">$")
+
+        revs = []
+        line = f.readline()
+        while line and len(revs) < 2:
+            match = patt.match(line)
+            if match is not None:
+                revs.append(int(match.group(1)))
+            line = f.readline()
+
+        f.close()
+
+        return len(revs) == 2 and revs[0] < revs[1]
+
     def log_file_is_git(logfile):
         retval = False
 
         try:
-            f = open(logfile, 'r')
+            f = open_logfile(logfile)
         except IOError, e:
             printerr(str(e))
             return False
@@ -95,11 +157,25 @@ def create_parser_from_logfile(uri):
 
         return retval
 
+    def log_file_is_git_machine(logfile):
+        try:
+            f = open_logfile(logfile)
+        except IOError, e:
+            printerr(str(e))
+            return False
+
+        # The log starts with a commit hash followed by the parents
+        # or the NUL field terminator (see GitMachineParser.LOG_FORMAT)
+        data = f.read(41)
+        f.close()
+
+        return re.match("^[0-9a-f]{40}[ \0]$", data) is not None
+
     def log_file_is_bzr(logfile):
         retval = False
 
         try:
-            f = open(logfile, 'r')
+            f = open_logfile(logfile)
         except IOError, e:
             printerr(str(e))
             return False
@@ -118,8 +194,16 @@ def create_parser_from_logfile(uri):
         return retval        
     
     if os.path.isfile(uri):
-        if logfile_is_svn(uri):
+        if log_file_is_git_machine(uri):
+            p = GitMachineParser()
+        elif logfile_is_svn_xml(uri):
+            p = SVNXMLParser()
+            if svn_xml_logfile_is_ascending(uri):
+                p.CONTENT_ORDER = ContentHandler.ORDER_REVISION_ASC
+        elif logfile_is_svn(uri):
             p = SVNParser()
+            if svn_logfile_is_ascending(uri):
+                p.CONTENT_ORDER = ContentHandler.ORDER_REVISION_ASC
         elif logfile_is_cvs(uri):
             p = CVSParser()
         elif log_file_is_git(uri):
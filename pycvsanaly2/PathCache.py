@@ -0,0 +1,218 @@
+# Copyright (C) 2008 LibreSoft
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors :
+#       Carlos Garcia Campos <carlosgc@gsyc.escet.urjc.es>
+
+
+class _Node(object):
+
+    __slots__ = ('value', 'children')
+
+    def __init__(self):
+        self.value = None
+        self.children = None
+
+
+class PathCache(object):
+    """A mapping of paths to values stored as a trie of path components.
+
+    Paths are split at every '/', and the names of the components are
+    interned, so the same names are shared by all the paths. Looking up
+    a path costs O(depth), and the paths under a directory or its
+    parents can be found without going through the whole cache. None
+    can't be stored as a value. If watch is set, it's called with every
+    change made to the cache: watch(op, path, value).
+
+    >>> cache = PathCache()
+    >>> cache['1://trunk/src'] = (1, -1)
+    >>> cache['1://trunk/src/foo.c'] = (2, 1)
+    >>> cache['1://trunk/src/bar.c'] = (3, 1)
+    >>> len(cache), '1://trunk/src/foo.c' in cache, '1://trunk' in cache
+    (3, True, False)
+    >>> sorted(cache.pop_subtree('1://trunk/src'))
+    [('1://trunk/src/bar.c', (3, 1)), ('1://trunk/src/foo.c', (2, 1))]
+    >>> cache.items()
+    [('1://trunk/src', (1, -1))]
+    >>> cache['1://trunk'] = (4, -1)
+    >>> cache.ancestors('1://trunk/src/foo.c')
+    [('1://trunk/src', (1, -1)), ('1://trunk', (4, -1))]
+    """
+
+    watch = None
+
+    def __init__(self, items=None):
+        self.root = _Node()
+        self.n_items = 0
+
+        if items is not None:
+            for path, value in items.iteritems():
+                self[path] = value
+
+    def __find(self, path):
+        node = self.root
+        for name in path.split('/'):
+            if node.children is None:
+                return None
+            node = node.children.get(name)
+            if node is None:
+                return None
+
+        return node
+
+    def __walk(self, node, path):
+        stack = [(node, path)]
+        while stack:
+            node, path = stack.pop()
+            if node.children is None:
+                continue
+
+            for name, child in node.children.iteritems():
+                child_path = path + '/' + name
+                if child.value is not None:
+                    yield child_path, child.value
+                stack.append((child, child_path))
+
+    def __prune(self, path):
+        # Remove the nodes of path that don't lead to any value
+        nodes = [self.root]
+        names = path.split('/')
+        for name in names:
+            if nodes[-1].children is None or name not in nodes[-1].children:
+                return
+            nodes.append(nodes[-1].children[name])
+
+        for name in reversed(names):
+            node = nodes.pop()
+            if node.value is not None or node.children:
+                break
+
+            parent = nodes[-1]
+            del parent.children[name]
+            if not parent.children:
+                parent.children = None
+
+    def __getstate__(self):
+        return {'root': self.root, 'n_items': self.n_items}
+
+    def __len__(self):
+        return self.n_items
+
+    def __contains__(self, path):
+        node = self.__find(path)
+        return node is not None and node.value is not None
+
+    def __getitem__(self, path):
+        node = self.__find(path)
+        if node is None or node.value is None:
+            raise KeyError(path)
+
+        return node.value
+
+    def __setitem__(self, path, value):
+        assert value is not None
+
+        node = self.root
+        for name in path.split('/'):
+            if node.children is None:
+                node.children = {}
+
+            child = node.children.get(name)
+            if child is None:
+                child = _Node()
+                node.children[intern(name)] = child
+            node = child
+
+        if node.value is None:
+            self.n_items += 1
+        node.value = value
+
+        if self.watch is not None:
+            self.watch('set', path, value)
+
+    def __delitem__(self, path):
+        node = self.__find(path)
+        if node is None or node.value is None:
+            raise KeyError(path)
+
+        node.value = None
+        self.n_items -= 1
+        self.__prune(path)
+
+        if self.watch is not None:
+            self.watch('del', path, None)
+
+    def get(self, path, default=None):
+        node = self.__find(path)
+        if node is None or node.value is None:
+            return default
+
+        return node.value
+
+    def items(self):
+        return list(self.iteritems())
+
+    def iteritems(self):
+        if self.root.children is None:
+            return
+
+        for name, node in self.root.children.iteritems():
+            if node.value is not None:
+                yield name, node.value
+            for item in self.__walk(node, name):
+                yield item
+
+    def keys(self):
+        return [path for path, value in self.iteritems()]
+
+    def pop_subtree(self, path):
+        """Removes the paths under the directory path, not including
+        path itself, and returns them as a list of (path, value)
+        """
+        node = self.__find(path)
+        if node is None or node.children is None:
+            return []
+
+        items = list(self.__walk(node, path))
+        node.children = None
+        self.n_items -= len(items)
+        self.__prune(path)
+
+        if self.watch is not None:
+            self.watch('pop_subtree', path, None)
+
+        return items
+
+    def ancestors(self, path):
+        """Returns a list of (path, value) for path and all of its
+        parent directories found in the cache, deepest first
+        """
+        retval = []
+
+        node = self.root
+        names = path.split('/')
+        for i, name in enumerate(names):
+            if node.children is None:
+                break
+            node = node.children.get(name)
+            if node is None:
+                break
+            if node.value is not None:
+                retval.append(('/'.join(names[:i + 1]), node.value))
+
+        retval.reverse()
+
+        return retval
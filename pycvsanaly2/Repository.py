@@ -17,31 +17,29 @@
 
 
 class Commit(object):
-    def __init__(self):
-        self.__dict__ = {'revision': None,
-                         'committer': None,
-                         'author': None,
-                         'date': None,
-                         'actions': [],
-                         'branch': None,
-                         'tags': None,
-                         'message': "",
-                         'composed_rev': False}
-
-    def __getinitargs__(self):
-        return()
 
-    def __getstate__(self):
-        return self.__dict__
+    __slots__ = ('revision', 'committer', 'author', 'date', 'actions',
+                 'branch', 'tags', 'message', 'composed_rev')
 
-    def __setstate__(self, dict):
-        self.__dict__.update(dict)
+    def __init__(self):
+        self.revision = None
+        self.committer = None
+        self.author = None
+        self.date = None
+        self.actions = []
+        self.branch = None
+        self.tags = None
+        self.message = ""
+        self.composed_rev = False
 
-    def __getattr__(self, name):
-        return self.__dict__[name]
+    def __getstate__(self):
+        return dict([(name, getattr(self, name)) for name in self.__slots__])
 
-    def __setattr__(self, name, value):
-        object.__setattr__(self, name, value)
+    def __setstate__(self, state):
+        # Also used for commits pickled when the state was a dict
+        self.__init__()
+        for name, value in state.iteritems():
+            setattr(self, name, value)
 
     def __eq__(self, other):
         return isinstance(other, Commit) and self.revision == other.revision
@@ -50,7 +48,7 @@ class Commit(object):
         return not isinstance(other, Commit) or self.revision != other.revision
 
     def __repr__(self):
-        return str(self.__dict__)
+        return str(self.__getstate__())
 
     def __str__(self):
         return self.__repr__()
@@ -64,28 +62,27 @@ class Commit(object):
 # C Copied
 # R Replaced
 class Action(object):
-    def __init__(self):
-        self.__dict__ = {'type': None,
-                         'branch_f1': None,
-                         'branch_f2': None,
-                         'f1': None,
-                         'f2': None,
-                         'rev': None}
-
-    def __getinitargs__(self):
-        return()
 
-    def __getstate__(self):
-        return self.__dict__
+    __slots__ = ('type', 'branch_f1', 'branch_f2', 'f1', 'f2', 'rev',
+                 'added', 'removed')
 
-    def __setstate__(self, dict):
-        self.__dict__.update(dict)
+    def __init__(self):
+        self.type = None
+        self.branch_f1 = None
+        self.branch_f2 = None
+        self.f1 = None
+        self.f2 = None
+        self.rev = None
+        self.added = None
+        self.removed = None
 
-    def __getattr__(self, name):
-        return self.__dict__[name]
+    def __getstate__(self):
+        return dict([(name, getattr(self, name)) for name in self.__slots__])
 
-    def __setattr__(self, name, value):
-        object.__setattr__(self, name, value)
+    def __setstate__(self, state):
+        self.__init__()
+        for name, value in state.iteritems():
+            setattr(self, name, value)
 
     def __eq__(self, other):
         return isinstance(other, Action) and \
@@ -106,31 +103,27 @@ class Action(object):
             self.rev != other.rev
 
     def __repr__(self):
-        return str(self.__dict__)
+        return str(self.__getstate__())
 
     def __str__(self):
         return str(self.__repr__())
 
 
 class Person(object):
-    def __init__(self):
-        self.__dict__ = {'name': None,
-                         'email': None}
 
-    def __getinitargs__(self):
-        return()
+    __slots__ = ('name', 'email')
 
-    def __getstate__(self):
-        return self.__dict__
-
-    def __setstate__(self, dict):
-        self.__dict__.update(dict)
+    def __init__(self):
+        self.name = None
+        self.email = None
 
-    def __getattr__(self, name):
-        return self.__dict__[name]
+    def __getstate__(self):
+        return {'name': self.name, 'email': self.email}
 
-    def __setattr__(self, name, value):
-        object.__setattr__(self, name, value)
+    def __setstate__(self, state):
+        self.__init__()
+        for name, value in state.iteritems():
+            setattr(self, name, value)
 
     def __eq__(self, other):
         return isinstance(other, Person) and self.name == other.name
@@ -139,7 +132,7 @@ class Person(object):
         return not isinstance(other, Person) or self.name != other.name
 
     def __repr__(self):
-        return str(self.__dict__)
+        return str(self.__getstate__())
 
     def __str__(self):
         return self.__repr__()
@@ -157,7 +150,7 @@ if __name__ == '__main__':
     for i in range(5):
         a = Action()
         a.type = 'M'
-        a.branch = 'trunk'
+        a.branch_f1 = 'trunk'
         a.f1 = '/trunk/foo-%d' % (i + 1)
         a.rev = '25'
 
@@ -181,8 +174,8 @@ if __name__ == '__main__':
         print "%s %s " % (action.type, action.f1)
         if action.f2 is not None:
             print "(%s: %s) on branch %s" % (action.f2, action.rev,
-                                             commit.branch or action.branch)
+                                             commit.branch or action.branch_f1)
         else:
-            print "on branch %s" % (commit.branch or action.branch)
+            print "on branch %s" % (commit.branch or action.branch_f1)
     print "Message"
     print commit.message
@@ -0,0 +1,206 @@
+# Copyright (C) 2008 LibreSoft
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors :
+#       Carlos Garcia Campos <carlosgc@gsyc.escet.urjc.es>
+
+import zlib
+from array import array
+from binascii import hexlify, unhexlify
+
+_EMPTY = -1
+_DELETED = -1
+
+
+def _encode(rev):
+    # Git hashes are stored as 20 bytes, any other revision as it is
+    if isinstance(rev, unicode):
+        rev = rev.encode('utf-8')
+
+    if len(rev) == 40:
+        try:
+            sha = unhexlify(rev)
+        except TypeError:
+            pass
+        else:
+            # Upper case hashes are not git hashes
+            if hexlify(sha) == rev:
+                return '\x01' + sha
+
+    return '\x00' + rev
+
+
+def _decode(key):
+    if key[0] == '\x01':
+        return hexlify(key[1:])
+
+    return key[1:]
+
+
+class RevisionIndex(object):
+    """A compact mapping of revisions to commit ids.
+
+    All the revisions are stored one after the other in a single byte
+    array, git hashes in binary form, and the commit ids in an array of
+    integers. Revisions are found with an open addressing hash table of
+    entry numbers, so a lookup costs O(1). Commit ids can't be negative.
+    If watch is set, it's called with every change made to the index:
+    watch(op, revision, commit_id).
+
+    >>> index = RevisionIndex()
+    >>> index['ec2e3c6d5bb8a3a6ccbbf8bd5c1e8a6ea1b2b0c9'] = 1
+    >>> index['1.2|src/foo.c'] = 2
+    >>> index['ec2e3c6d5bb8a3a6ccbbf8bd5c1e8a6ea1b2b0c9'], len(index)
+    (1, 2)
+    >>> '1.2|src/foo.c' in index, index.get('1.3|src/foo.c')
+    (True, None)
+    >>> del index['1.2|src/foo.c']
+    >>> index.items()
+    [('ec2e3c6d5bb8a3a6ccbbf8bd5c1e8a6ea1b2b0c9', 1)]
+    """
+
+    watch = None
+
+    def __init__(self, items=None):
+        self.data = bytearray()
+        self.offsets = array('I', [0])
+        self.values = array('i')
+        self.slots = array('i', [_EMPTY]) * 8
+        self.n_items = 0
+
+        if items is not None:
+            for rev, commit_id in items.iteritems():
+                self[rev] = commit_id
+
+    def __key(self, entry):
+        return str(self.data[self.offsets[entry]:self.offsets[entry + 1]])
+
+    def __find(self, key):
+        """Returns the slot of key and its entry number, or _EMPTY
+        if the key is not in the index"""
+        slots = self.slots
+        mask = len(slots) - 1
+        data = self.data
+        offsets = self.offsets
+
+        size = len(key)
+
+        i = zlib.crc32(key) & mask
+        while True:
+            entry = slots[i]
+            if entry == _EMPTY:
+                return i, entry
+            start = offsets[entry]
+            if offsets[entry + 1] - start == size and \
+               data.startswith(key, start):
+                return i, entry
+            i = (i + 1) & mask
+
+    def __resize(self):
+        size = len(self.slots) * 2
+        mask = size - 1
+        slots = array('i', [_EMPTY]) * size
+        for entry in xrange(len(self.values)):
+            i = zlib.crc32(self.__key(entry)) & mask
+            while slots[i] != _EMPTY:
+                i = (i + 1) & mask
+            slots[i] = entry
+
+        self.slots = slots
+
+    def __getstate__(self):
+        return {'data': str(self.data),
+                'offsets': self.offsets.tostring(),
+                'values': self.values.tostring(),
+                'slots': self.slots.tostring(),
+                'n_items': self.n_items}
+
+    def __setstate__(self, state):
+        self.data = bytearray(state['data'])
+        self.offsets = array('I')
+        self.offsets.fromstring(state['offsets'])
+        self.values = array('i')
+        self.values.fromstring(state['values'])
+        self.slots = array('i')
+        self.slots.fromstring(state['slots'])
+        self.n_items = state['n_items']
+
+    def __len__(self):
+        return self.n_items
+
+    def __contains__(self, rev):
+        entry = self.__find(_encode(rev))[1]
+        return entry != _EMPTY and self.values[entry] != _DELETED
+
+    def __getitem__(self, rev):
+        entry = self.__find(_encode(rev))[1]
+        if entry == _EMPTY or self.values[entry] == _DELETED:
+            raise KeyError(rev)
+
+        return self.values[entry]
+
+    def __setitem__(self, rev, commit_id):
+        assert commit_id >= 0
+
+        key = _encode(rev)
+        i, entry = self.__find(key)
+        if entry == _EMPTY:
+            self.slots[i] = len(self.values)
+            self.data.extend(key)
+            self.offsets.append(len(self.data))
+            self.values.append(commit_id)
+            self.n_items += 1
+
+            # Keep the table at most 2/3 full
+            if len(self.values) * 3 >= len(self.slots) * 2:
+                self.__resize()
+        else:
+            if self.values[entry] == _DELETED:
+                self.n_items += 1
+            self.values[entry] = commit_id
+
+        if self.watch is not None:
+            self.watch('set', rev, commit_id)
+
+    def __delitem__(self, rev):
+        entry = self.__find(_encode(rev))[1]
+        if entry == _EMPTY or self.values[entry] == _DELETED:
+            raise KeyError(rev)
+
+        # The entry is kept, it's reused if rev is added again
+        self.values[entry] = _DELETED
+        self.n_items -= 1
+
+        if self.watch is not None:
+            self.watch('del', rev, None)
+
+    def get(self, rev, default=None):
+        entry = self.__find(_encode(rev))[1]
+        if entry == _EMPTY or self.values[entry] == _DELETED:
+            return default
+
+        return self.values[entry]
+
+    def items(self):
+        return list(self.iteritems())
+
+    def iteritems(self):
+        for entry, commit_id in enumerate(self.values):
+            if commit_id != _DELETED:
+                yield _decode(self.__key(entry)), commit_id
+
+    def keys(self):
+        return [rev for rev, commit_id in self.iteritems()]
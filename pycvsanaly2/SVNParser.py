@@ -54,6 +54,14 @@ class SVNParser(Parser):
     <_sre.SRE_Match object...>
     >>> move = "A /subversion/trunk/subversion/libsvn_fs_fs/temp_serializer.c "
     >>> re.match(p.patterns['file-moved'], move) #doctest: +ELLIPSIS
+
+    Warnings point to the line where the problem is found
+    >>> p.feed_lines(["-" * 72,
+    ...     "r3 | dsandler | 2006-01-12 14:16:11 -0600 " +
+    ...     "(Thu, 12 Jan 2006) | 1 line",
+    ...     "Bogus", "Changed paths:", "   M /trunk/foo.c", "", "Fix",
+    ...     "-" * 72])
+    Warning(3): parsing svn log, unexpected line Bogus
     """
 
     (COMMIT, FILES, MESSAGE) = range(3)
@@ -87,7 +95,7 @@ class SVNParser(Parser):
 
         self.root_path = uri.replace(repo.get_uri(), '')
 
-    def __convert_commit_actions(self, commit):
+    def _convert_commit_actions(self, commit):
         # We detect here files that have been moved or
         # copied. Files moved are converted into a
         # single action of type 'V'. For copied files
@@ -121,7 +129,7 @@ class SVNParser(Parser):
 
                         # Try to guess if it was a tag
                         # Yes, with svn we are always guessing :-/
-                        tag = self.__guess_tag_from_path(action.f1)
+                        tag = self._guess_tag_from_path(action.f1)
                         if tag is not None:
                             if commit.tags is None:
                                 commit.tags = []
@@ -139,7 +147,7 @@ class SVNParser(Parser):
                      (action.type, action.f1))
             commit.actions.remove(action)
 
-    def __guess_branch_from_path(self, path):
+    def _guess_branch_from_path(self, path):
         path = path[len(self.root_path):]
 
         if path.startswith("/branches"):
@@ -152,7 +160,7 @@ class SVNParser(Parser):
 
         return branch
 
-    def __guess_tag_from_path(self, path):
+    def _guess_tag_from_path(self, path):
         path = path[len(self.root_path):]
         
         if not path.startswith("/tags"):
@@ -215,7 +223,7 @@ class SVNParser(Parser):
                     printout("Warning (%d): parsing svn log, missing " + \
                              "lines in commit message!", (self.n_line,))
                 
-                self.__convert_commit_actions(self.commit)
+                self._convert_commit_actions(self.commit)
                 self.handler.commit(self.commit)
                 self.state = SVNParser.COMMIT
                 self.commit = None
@@ -280,8 +288,8 @@ class SVNParser(Parser):
             action.f2 = match.group(3)
             action.rev = match.group(4)
 
-            action.branch_f1 = self.__guess_branch_from_path(action.f1)
-            action.branch_f2 = self.__guess_branch_from_path(action.f2)
+            action.branch_f1 = self._guess_branch_from_path(action.f1)
+            action.branch_f2 = self._guess_branch_from_path(action.f2)
 
             self.commit.actions.append(action)
             self.handler.file(action.f1)
@@ -306,7 +314,7 @@ class SVNParser(Parser):
                 action.type = match.group(1)
                 action.f1 = path
 
-                action.branch_f1 = self.__guess_branch_from_path(path)
+                action.branch_f1 = self._guess_branch_from_path(path)
 
                 self.commit.actions.append(action)
                 self.handler.file(path)
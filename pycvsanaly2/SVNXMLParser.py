@@ -0,0 +1,189 @@
+# Copyright (C) 2006 Libresoft
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors :
+#       Carlos Garcia Campos <carlosgc@gsyc.escet.urjc.es>
+
+import time
+import calendar
+import datetime
+from xml.etree.cElementTree import XMLParser
+
+from SVNParser import SVNParser
+from Repository import Commit, Action, Person
+from utils import printdbg
+
+
+def _to_str(text):
+    if isinstance(text, unicode):
+        return text.encode('utf-8')
+
+    return text
+
+
+class _LogTarget(object):
+    """Builds commits out of the events of the XML parser.
+
+    No tree is built at all, only the text of the current element is
+    kept, so memory doesn't grow with the size of the log.
+    """
+
+    def __init__(self, parser):
+        self.parser = parser
+
+        self.commit = None
+        self.path_attrs = None
+        self.text = []
+
+    def start(self, tag, attrib):
+        self.text = []
+
+        if tag == 'logentry':
+            self.commit = Commit()
+            self.commit.revision = _to_str(attrib.get('revision'))
+        elif tag == 'path':
+            self.path_attrs = attrib
+
+    def data(self, data):
+        self.text.append(data)
+
+    def end(self, tag):
+        text = _to_str("".join(self.text))
+        self.text = []
+
+        commit = self.commit
+        if commit is None:
+            return
+
+        if tag == 'author':
+            commit.committer = Person()
+            commit.committer.name = text
+        elif tag == 'date':
+            # Dates are in UTC: 2006-01-12T20:16:11.123456Z, but svn log
+            # prints them in local time, and that's what SVNParser stores
+            utc = calendar.timegm(time.strptime(text[:19],
+                                                "%Y-%m-%dT%H:%M:%S"))
+            commit.date = datetime.datetime(*time.localtime(utc)[0:6])
+        elif tag == 'path':
+            self.parser._add_path(commit, text, self.path_attrs)
+            self.path_attrs = None
+        elif tag == 'msg':
+            commit.message = text + '\n'
+        elif tag == 'logentry':
+            self.parser._add_commit(commit)
+            self.commit = None
+
+    def close(self):
+        pass
+
+
+class SVNXMLParser(SVNParser):
+    """A parser for the XML output of svn log --xml -v.
+
+    Data is handed to an incremental XML parser as it comes, there's
+    no need to split it in lines. Dates are stored in local time, like
+    SVNParser does for the same log.
+
+    >>> import os
+    >>> from ContentHandler import ContentHandler
+    >>> class Dates(ContentHandler):
+    ...     def __init__(self):
+    ...         self.dates = []
+    ...     def commit(self, commit):
+    ...         self.dates.append(commit.date)
+    >>> tz = os.environ.get('TZ')
+    >>> os.environ['TZ'] = 'America/Chicago'
+    >>> time.tzset()
+    >>> text = SVNParser()
+    >>> text.set_content_handler(Dates())
+    >>> text.feed_lines(["-" * 72,
+    ...     "r3 | dsandler | 2006-01-12 14:16:11 -0600 " +
+    ...     "(Thu, 12 Jan 2006) | 1 line",
+    ...     "Changed paths:", "   M /trunk/foo.c", "", "Fix", "-" * 72])
+    >>> xml = SVNXMLParser()
+    >>> xml.set_content_handler(Dates())
+    >>> xml.feed('<?xml version="1.0"?><log><logentry revision="3">' +
+    ...     '<author>dsandler</author>' +
+    ...     '<date>2006-01-12T20:16:11.123456Z</date><paths>' +
+    ...     '<path action="M">/trunk/foo.c</path></paths>' +
+    ...     '<msg>Fix</msg></logentry></log>')
+    >>> xml.flush()
+    >>> text.handler.dates == xml.handler.dates
+    True
+    >>> xml.handler.dates
+    [datetime.datetime(2006, 1, 12, 14, 16, 11)]
+    >>> if tz is None:
+    ...     del os.environ['TZ']
+    ... else:
+    ...     os.environ['TZ'] = tz
+    >>> time.tzset()
+    """
+
+    def __init__(self):
+        SVNParser.__init__(self)
+
+        self.xml_parser = XMLParser(target=_LogTarget(self))
+
+    def _add_path(self, commit, path, attrs):
+        action = Action()
+        action.type = _to_str(attrs.get('action'))
+        action.f1 = path
+        action.branch_f1 = self._guess_branch_from_path(path)
+
+        copyfrom = attrs.get('copyfrom-path')
+        if copyfrom is not None:
+            action.f2 = _to_str(copyfrom)
+            action.rev = _to_str(attrs.get('copyfrom-rev'))
+            action.branch_f2 = self._guess_branch_from_path(action.f2)
+        elif path == '/':
+            # path == '/' is probably a properties change in /
+            # not interesting for us, ignoring
+            return
+
+        commit.actions.append(action)
+        self.handler.file(path)
+
+    def _add_commit(self, commit):
+        # Invalid commit. Some svn repos like asterisk have commits
+        # without author, date nor changed paths, just ignore them
+        if commit.date is None:
+            printdbg("SVN XML Parser: skipping invalid commit: %s",
+                     (commit.revision,))
+            return
+
+        if commit.committer is None:
+            commit.committer = Person()
+            commit.committer.name = "(no author)"
+        self.handler.committer(commit.committer)
+
+        self._convert_commit_actions(commit)
+        self.handler.commit(commit)
+
+    def feed(self, data):
+        if self.n_line == 0:
+            self._begin()
+
+        self.n_line += data.count('\n') or 1
+        self.xml_parser.feed(data)
+
+    # The XML parser doesn't care about line boundaries
+    feed_buffer = feed
+
+    def feed_lines(self, lines):
+        self.feed("\n".join(lines) + "\n")
+
+    def flush(self):
+        self.xml_parser.close()
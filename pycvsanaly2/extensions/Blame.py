@@ -18,13 +18,13 @@
 #       Carlos Garcia Campos  <carlosgc@gsyc.escet.urjc.es>
 
 from pycvsanaly2.Database import (SqliteDatabase, MysqlDatabase, 
-    TableAlreadyExists, statement, ICursor)
+    TableAlreadyExists, statement, new_id)
 from pycvsanaly2.extensions import (Extension, register_extension, 
     ExtensionRunError)
 from pycvsanaly2.profile import profiler_start, profiler_stop
 from pycvsanaly2.utils import printdbg, printerr, uri_to_filename
 from FileRevs import FileRevs
-from Jobs import JobPool, Job
+from Jobs import JobPool, Job, get_job_processes
 from repositoryhandler.backends import RepositoryCommandError
 from repositoryhandler.backends.watchers import BLAME
 from guilty.parser import create_parser
@@ -119,6 +119,7 @@ class Blame(Extension):
     __insert__ = """INSERT INTO blame (id, file_id, commit_id, author_id, 
                                        n_lines)
                  'VALUES (?,?,?,?,?)"""
+    __table__ = "blame"
     MAX_BLAMES = 10
 
     def __init__(self):
@@ -195,7 +196,6 @@ class Blame(Extension):
             if not job.failed:
                 a = self.populate_insert_args(job)
                 args.extend(a)
-                self.id_counter += len(a)
             processed_jobs += 1
             if unlocked:
                 job = job_pool.get_next_done_unlocked()
@@ -203,17 +203,33 @@ class Blame(Extension):
                 job = job_pool.get_next_done(0)
 
         if len(args) > 0:
-            write_cursor.executemany(statement(self.__insert__, 
-                                               self.db.place_holder), args)
+            self.db.insert_many(write_cursor, self.__insert__, args)
             del args
         return processed_jobs
 
+    def __add_blame(self, job):
+        if not job.failed:
+            self.blame_args.extend(self.populate_insert_args(job))
+        self.n_blames += 1
+
+        if self.n_blames >= self.MAX_BLAMES:
+            self.__insert_blames()
+
+    def __insert_blames(self):
+        if self.blame_args:
+            self.db.insert_many(self.write_cursor, self.__insert__,
+                                self.blame_args)
+        self.blame_args = []
+        self.n_blames = 0
+
     def populate_insert_args(self, job):
         authors = job.get_authors()
         file_id = job.get_file_id()
         commit_id = job.get_commit_id()
 
-        return [(self.id_counter + i, file_id, commit_id, \
+        first_id = new_id(self, len(authors))
+
+        return [(first_id + i, file_id, commit_id, \
                  self.authors[key], authors[key]) \
                  for i, key in enumerate(authors.keys())]
 
@@ -249,23 +265,20 @@ class Blame(Extension):
         try:
             self.__create_table(cnn)
         except TableAlreadyExists:
-            cursor = cnn.cursor()
-            cursor.execute(statement("SELECT max(id) from blame", 
-                                     db.place_holder))
-            id = cursor.fetchone()[0]
-            if id is not None:
-                self.id_counter = id + 1
-
-            cursor.close()
+            blames = self.__get_blames(read_cursor, repoid)
         except Exception, e:
             raise ExtensionRunError(str(e))
 
         self.__get_authors(read_cursor)
 
-        if self.id_counter > 1:
-            blames = self.__get_blames(read_cursor, repoid)
+        # Blames are written as their jobs are done
+        self.blame_args = []
+        self.n_blames = 0
+        self.write_cursor = write_cursor
 
-        job_pool = JobPool(repo, path or repo.get_uri(), queuesize=100)
+        job_pool = JobPool(repo, path or repo.get_uri(), queuesize=100,
+                           processes=get_job_processes("Blame"),
+                           on_done=self.__add_blame)
 
         # Get code files
         query = "select f.id from file_types ft, files f " + \
@@ -275,7 +288,6 @@ class Blame(Extension):
         read_cursor.execute(statement(query, db.place_holder), (repoid,))
         code_files = [item[0] for item in read_cursor.fetchall()]
 
-        n_blames = 0
         fr = FileRevs(db, cnn, read_cursor, repoid)
         for revision, commit_id, file_id, action_type, composed in fr:
             if file_id not in code_files:
@@ -300,15 +312,12 @@ class Blame(Extension):
 
             job = BlameJob(file_id, commit_id, relative_path, rev)
             job_pool.push(job)
-            n_blames += 1
 
-            if n_blames >= self.MAX_BLAMES:
-                job_pool.join()
-                self.process_finished_jobs(job_pool, write_cursor)
-                n_blames = 0
-        job_pool.join()
-        self.process_finished_jobs(job_pool, write_cursor, True)
+        job_pool.finish()
+        self.__insert_blames()
+        job_pool.close()
 
+        fr.close()
         read_cursor.close()
         write_cursor.close()
         cnn.close()
@@ -20,7 +20,7 @@
 from pycvsanaly2.extensions import Extension, register_extension, \
         ExtensionRunError, ExtensionBackoutError
 from pycvsanaly2.Database import SqliteDatabase, MysqlDatabase, \
-        TableAlreadyExists, statement, execute_statement, get_repo_id
+        TableAlreadyExists, statement, execute_many, get_repo_id
 from pycvsanaly2.utils import printdbg, printerr, printout, \
         remove_directory, uri_to_filename, get_repo_uri
 from pycvsanaly2.profile import profiler_start, profiler_stop
@@ -29,6 +29,15 @@ import re
 
 
 class BugFixMessage(Extension):
+
+    # Commits updated at once
+    MAX_UPDATES = 1000
+
+    def __update(self, update, rows, write_cursor):
+        execute_many(update, rows, write_cursor, self.db,
+                     "Couldn't update scmlog",
+                     exception=ExtensionRunError)
+
     def __prepare_table(self, connection):
         cursor = connection.cursor()
 
@@ -227,26 +236,26 @@ class BugFixMessage(Extension):
 
         self.__prepare_table(connection)
 
+        update = """update scmlog
+                    set is_bug_fix = ?
+                    where id = ?"""
+        rows = []
+
         for row in read_cursor:
             row_id = row[0]
             commit_message = row[1]
 
-            update = """update scmlog
-                        set is_bug_fix = ?
-                        where id = ?"""
-
             if self.fixes_bug(commit_message):
                 is_bug_fix = 1
             else:
                 is_bug_fix = 0
 
-            execute_statement(statement(update, db.place_holder),
-                              (is_bug_fix, row_id),
-                              write_cursor,
-                              db,
-                              "Couldn't update scmlog",
-                              exception=ExtensionRunError)
+            rows.append((is_bug_fix, row_id))
+            if len(rows) >= self.MAX_UPDATES:
+                self.__update(update, rows, write_cursor)
+                rows = []
 
+        self.__update(update, rows, write_cursor)
         read_cursor.close()
         connection.commit()
         connection.close()
@@ -23,11 +23,11 @@ from subprocess import Popen, PIPE
 from repositoryhandler.backends.watchers import DIFF
 
 from pycvsanaly2.Database import (SqliteDatabase, MysqlDatabase, 
-                                  TableAlreadyExists, statement)
+                                  TableAlreadyExists, statement, new_id)
 from pycvsanaly2.Log import LogReader
 from pycvsanaly2.extensions import (Extension, register_extension, 
                                     ExtensionRunError)
-from pycvsanaly2.utils import to_utf8, printerr, uri_to_filename
+from pycvsanaly2.utils import to_utf8, printerr, printdbg, uri_to_filename
 from pycvsanaly2.FindProgram import find_program
 from pycvsanaly2.Command import Command, CommandError
 
@@ -35,14 +35,14 @@ from pycvsanaly2.Command import Command, CommandError
 class DBCommitLines(object):
 
     id_counter = 1
+    __table__ = "commits_lines"
 
     __insert__ = """INSERT INTO commits_lines (id, commit_id, added, removed) 
                     values (?, ?, ?, ?)"""
 
     def __init__(self, id, commit_id, added, removed):
         if id is None:
-            self.id = DBCommitLines.id_counter
-            DBCommitLines.id_counter += 1
+            self.id = new_id(DBCommitLines)
         else:
             self.id = id
 
@@ -72,8 +72,8 @@ class CVSLineCounter(LineCounter):
         p = CVSParser()
         p.set_repository(repo, uri)
         
-        def new_line(line, parser):
-            parser.feed(line)
+        def new_buffer(data, parser):
+            parser.feed_buffer(data)
         
         reader = LogReader()
         reader.set_repo(repo, uri)
@@ -81,7 +81,8 @@ class CVSLineCounter(LineCounter):
         if logfile is not None:
             reader.set_logfile(logfile)
 
-        reader.start(new_line, p)
+        reader.start_buffered(new_buffer, p)
+        p.end()
 
         self.lines = p.get_added_removed_lines()
     
@@ -193,6 +194,26 @@ class GitLineCounter(LineCounter):
     def get_lines_for_revision(self, revision):
         return self.lines.get(revision, (0, 0))
 
+class ActionLinesCounter(LineCounter):
+    """Adds up the lines of every action stored while parsing the log
+    (--action-lines option), so the history is not walked again.
+    """
+
+    def __init__(self, repo, uri, db, cursor, repo_id):
+        LineCounter.__init__(self, repo, uri)
+
+        query = """SELECT s.rev, sum(al.added), sum(al.removed)
+                   FROM action_lines al, actions a, scmlog s
+                   WHERE al.action_id = a.id AND a.commit_id = s.id
+                   AND s.repository_id = ?
+                   GROUP BY s.rev"""
+        cursor.execute(statement(query, db.place_holder), (repo_id,))
+        self.lines = dict([(rev, (int(added), int(removed))) \
+                           for rev, added, removed in cursor.fetchall()])
+
+    def get_lines_for_revision(self, revision):
+        return self.lines.get(revision, (0, 0))
+
 _counters = {'cvs': CVSLineCounter, 'svn': SVNLineCounter, 
              'git': GitLineCounter}
 
@@ -284,17 +305,23 @@ class CommitsLOC(Extension):
         try:
             self.__create_table(cnn)
         except TableAlreadyExists:
-            cursor.execute(statement("SELECT max(id) from commits_lines", 
-                                     db.place_holder))
-            id = cursor.fetchone()[0]
-            if id is not None:
-                DBCommitLines.id_counter = id + 1
-
             commits = self.__get_commits_lines_for_repository(repo_id, cursor)
         except Exception, e:
             raise ExtensionRunError(str(e))
 
-        counter = create_line_counter_for_repository(repo, uri)
+        counter = None
+        if repo.get_type() == 'git':
+            try:
+                counter = ActionLinesCounter(repo, uri, db, cursor, repo_id)
+            except Exception, e:
+                # Databases created before the action_lines table existed
+                printdbg("Action lines not available: %s", (str(e),))
+            else:
+                if not counter.lines:
+                    counter = None
+
+        if counter is None:
+            counter = create_line_counter_for_repository(repo, uri)
         
         cursor.execute(statement("""SELECT id, rev, composed_rev from scmlog 
             where repository_id = ?""", db.place_holder), (repo_id,))
@@ -319,8 +346,8 @@ class CommitsLOC(Extension):
             if commit_list:
                 commits_lines = [(commit.id, commit.commit_id, commit.added, \
                                   commit.removed) for commit in commit_list]
-                write_cursor.executemany(statement(DBCommitLines.__insert__, 
-                                        self.db.place_holder), commits_lines)
+                self.db.insert_many(write_cursor, DBCommitLines.__insert__,
+                                    commits_lines)
 
             rs = cursor.fetchmany()
             
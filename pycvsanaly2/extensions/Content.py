@@ -20,14 +20,14 @@
 from pycvsanaly2.extensions import Extension, register_extension, \
         ExtensionRunError
 from pycvsanaly2.Database import SqliteDatabase, MysqlDatabase, statement, \
-    execute_statement
+    execute_insert_many
 from pycvsanaly2.Config import Config
 from pycvsanaly2.utils import printdbg, printerr, uri_to_filename, to_utf8
 from pycvsanaly2.profile import profiler_start, profiler_stop
 from FileRevs import FileRevs
 from repositoryhandler.backends import RepositoryCommandError
 from repositoryhandler.backends.watchers import CAT, SIZE
-from Jobs import JobPool, Job
+from Jobs import JobPool, Job, get_job_processes
 from io import BytesIO
 import os
 
@@ -280,28 +280,33 @@ class Content(Extension):
         # documentation advocates tablename_id as the reference,
         # but in the source, these are referred to as commit IDs.
         # Don't ask me why!
+        rows = []
         while finished_job is not None:
+            if finished_job.failed:
+                processed_jobs += 1
+                finished_job = job_pool.get_next_done(0)
+                continue
+
             file_contents = None
                         
             if not Config().no_content:
                 file_contents = str(finished_job.file_contents)
             
-            query = """
-                insert into content(commit_id, file_id, content, loc, size) 
-                    values(?,?,?,?,?)"""
-            insert_statement = statement(query, db.place_holder)
-            parameters = (finished_job.commit_id,
-                          finished_job.file_id,
-                          file_contents,
-                          finished_job.file_number_of_lines,
-                          finished_job.file_size)
-                                
-            execute_statement(insert_statement, parameters, write_cursor, db,
-                       "Couldn't insert, duplicate record?", 
-                       exception=ExtensionRunError)
+            rows.append((finished_job.commit_id,
+                         finished_job.file_id,
+                         file_contents,
+                         finished_job.file_number_of_lines,
+                         finished_job.file_size))
             
             processed_jobs += 1
             finished_job = job_pool.get_next_done(0)
+
+        query = """
+            insert into content(commit_id, file_id, content, loc, size) 
+                values(?,?,?,?,?)"""
+        execute_insert_many(query, rows, write_cursor, db,
+                            "Couldn't insert, duplicate record?", 
+                            exception=ExtensionRunError)
             
         return processed_jobs
 
@@ -349,7 +354,8 @@ class Content(Extension):
         printdbg("Setting queuesize to " + str(queuesize))
 
         # This is where the threading stuff comes in, I expect
-        job_pool = JobPool(repo, path or repo.get_uri(), queuesize=queuesize)
+        job_pool = JobPool(repo, path or repo.get_uri(), queuesize=queuesize,
+                           processes=get_job_processes("Content"))
 
         # This filters files if they're not source files.
         # I'm pretty sure "unknown" is returning binary files too, but
@@ -414,12 +420,14 @@ class Content(Extension):
 
         job_pool.join()
         self.__process_finished_jobs(job_pool, write_cursor, db)
+        job_pool.close()
                 
         profiler_start("Inserting results in db")
         #self.__insert_many(write_cursor)
         connection.commit()
         profiler_stop("Inserting results in db")
 
+        fr.close()
         read_cursor.close()
         write_cursor.close()
         connection.close()
@@ -20,14 +20,14 @@
 from pycvsanaly2.extensions import Extension, register_extension, \
         ExtensionRunError
 from pycvsanaly2.Database import SqliteDatabase, MysqlDatabase, \
-        TableAlreadyExists, statement, execute_statement
+        TableAlreadyExists, statement, execute_many
 from pycvsanaly2.utils import printdbg, printerr, printout, \
         remove_directory, uri_to_filename
 from pycvsanaly2.profile import profiler_start, profiler_stop
 from pycvsanaly2.Config import Config
 from pycvsanaly2.extensions.file_types import guess_file_type
 from repositoryhandler.backends.watchers import LS
-from Jobs import JobPool, Job
+from Jobs import JobPool, Job, get_job_processes
 from repositoryhandler.backends import RepositoryCommandError
 import re
 from io import BytesIO
@@ -154,22 +154,23 @@ class FileCount(Extension):
     def __process_finished_jobs(self, job_pool, write_cursor, db):
         finished_job = job_pool.get_next_done(0)
         processed_jobs = 0
+        rows = []
 
         while finished_job is not None:
-            query = """update scmlog
-                        set file_count = ?
-                        where id = ?"""
-            insert_statement = statement(query, db.place_holder)
-            parameters = (finished_job.ls_line_count, finished_job.row_id)
-                                
-            execute_statement(insert_statement, parameters, write_cursor, db,
-                       "Couldn't update scmlog with ls line count", 
-                       exception=ExtensionRunError)
-            
+            if not finished_job.failed:
+                rows.append((finished_job.ls_line_count, finished_job.row_id))
+
             processed_jobs += 1
             finished_job = job_pool.get_next_done(0)
             # print "Before return: %s"%(datetime.now()-start)
-            
+
+        query = """update scmlog
+                    set file_count = ?
+                    where id = ?"""
+        execute_many(query, rows, write_cursor, db,
+                     "Couldn't update scmlog with ls line count",
+                     exception=ExtensionRunError)
+
         return processed_jobs
     
     def run(self, repo, uri, db):            
@@ -206,7 +207,8 @@ class FileCount(Extension):
         queuesize = Config().max_threads
 
         job_pool = JobPool(repo, path or repo.get_uri(), 
-                           queuesize=queuesize)
+                           queuesize=queuesize,
+                           processes=get_job_processes("FileCount"))
             
         # Get the commits from this repository
         query = """select s.id, s.rev from scmlog s
@@ -241,6 +243,7 @@ class FileCount(Extension):
         
         job_pool.join()
         self.__process_finished_jobs(job_pool, write_cursor, db)
+        job_pool.close()
         read_cursor.close()
         connection.commit()
         connection.close()
@@ -159,7 +159,7 @@ class FilePaths(object):
                             commit_id %d", (file_id, commit_id))
         
         db = self.__dict__['db']
-        cnn = db.connect()
+        cnn = db.get_connection()
         
         cursor = cnn.cursor()
         query = """SELECT file_path from file_paths
@@ -172,7 +172,7 @@ class FilePaths(object):
             file_path = None
         
         cursor.close()
-        cnn.close()
+        db.release_connection(cnn)
         
         printdbg("get_path_from_database:\
                   Path for file_id %d at commit_id %d: %s",
@@ -194,12 +194,12 @@ class FilePaths(object):
             self.__dict__['adj'] = adj
             self.__dict__['rev'] = commit_id
         else:
-            cnn = self.__dict__['db'].connect()
+            db = self.__dict__['db']
+            cnn = db.get_connection()
             cursor = cnn.cursor()
             self.update_for_revision(cursor, commit_id, repo_id)
             cursor.close()
-            cnn.commit()
-            cnn.close()
+            db.release_connection(cnn)
             adj = self.__dict__['adj']
             self.__dict__['cached_adj'][str(commit_id)] = deepcopy(adj)
         path = self.__build_path(file_id, adj)
@@ -222,7 +222,7 @@ class FilePaths(object):
                             (file_path, commit_id))
         
         db = self.__dict__['db']
-        cnn = db.connect()
+        cnn = db.get_connection()
         cursor = cnn.cursor()
         query = """SELECT file_id from file_paths
                    WHERE file_path = ? AND commit_id <= ?
@@ -235,7 +235,7 @@ class FilePaths(object):
             file_id = None
         
         cursor.close()
-        cnn.close()
+        db.release_connection(cnn)
         
         if config.debug:
             profiler_stop("Getting file id for file_path %s and commit_id %d",
@@ -17,7 +17,7 @@
 # Authors :
 #       Carlos Garcia Campos  <carlosgc@libresoft.es>
 
-from pycvsanaly2.Database import statement, ICursor
+from pycvsanaly2.Database import statement
 from FilePaths import FilePaths
 
 if __name__ == '__main__':
@@ -39,10 +39,10 @@ class FileRevs(object):
         self.cnn = cnn
         self.repoid = repoid
 
-        self.icursor = ICursor(cursor, self.INTERVAL_SIZE)
+        self.icursor = db.icursor(cnn, self.INTERVAL_SIZE)
         self.icursor.execute(statement(self.__query__, db.place_holder), 
                              (repoid,))
-        self.rs = iter(self.icursor.fetchmany())
+        self.rs = iter(self.icursor)
         self.prev_commit = -1
         self.current = None
 
@@ -51,23 +51,9 @@ class FileRevs(object):
     def __iter__(self):
         return self
 
-    def __get_next(self):
-        try:
-            t = self.rs.next()
-        except StopIteration:
-            self.rs = iter(self.icursor.fetchmany())
-            if not self.rs:
-                raise StopIteration
-            t = self.rs.next()
-
-        return t
-
     def next(self):
-        if not self.rs:
-            raise StopIteration
-
         while True:
-            self.current = self.__get_next()
+            self.current = self.rs.next()
             revision, commit_id, file_id, action_type, composed = self.current
 
             # Should not need to update_for_revision anymore, delete if OK
@@ -121,6 +107,9 @@ class FileRevs(object):
 
         return relative_path
 
+    def close(self):
+        self.icursor.close()
+
 if __name__ == '__main__':
     import sys
     from pycvsanaly2.Database import create_database
@@ -137,5 +126,6 @@ if __name__ == '__main__':
     for revision, commit_id, file_id, action_type, composed in fr:
         print revision, commit_id, action_type, fr.get_path()
 
+    fr.close()
     cursor.close()
     cnn.close()
@@ -18,7 +18,7 @@
 #       Carlos Garcia Campos <carlosgc@gsyc.escet.urjc.es>
 
 from pycvsanaly2.Database import (SqliteDatabase, MysqlDatabase, 
-    TableAlreadyExists, statement)
+    TableAlreadyExists, statement, new_id)
 from pycvsanaly2.extensions import (Extension, register_extension, 
     ExtensionRunError)
 from pycvsanaly2.extensions.file_types import guess_file_type
@@ -28,14 +28,14 @@ from pycvsanaly2.utils import to_utf8, uri_to_filename
 class DBFileType(object):
 
     id_counter = 1
+    __table__ = "file_types"
 
     __insert__ = """INSERT INTO file_types (id, file_id, type) 
                     values (?, ?, ?)"""
 
     def __init__(self, id, type, file_id):
         if id is None:
-            self.id = DBFileType.id_counter
-            DBFileType.id_counter += 1
+            self.id = new_id(DBFileType)
         else:
             self.id = id
 
@@ -115,12 +115,6 @@ class FileTypes(Extension):
         try:
             self.__create_table(cnn)
         except TableAlreadyExists:
-            cursor.execute(statement("SELECT max(id) from file_types", 
-                                     db.place_holder))
-            id = cursor.fetchone()[0]
-            if id is not None:
-                DBFileType.id_counter = id + 1
-
             files = self.__get_files_for_repository(repo_id, cursor)
         except Exception, e:
             raise ExtensionRunError(str(e))
@@ -148,9 +142,8 @@ class FileTypes(Extension):
             if types:
                 file_types = [(type.id, type.file_id, type.type) \
                               for type in types]
-                write_cursor.executemany(statement(DBFileType.__insert__, 
-                                                   self.db.place_holder), 
-                                                   file_types)
+                self.db.insert_many(write_cursor, DBFileType.__insert__,
+                                    file_types)
 
             rs = cursor.fetchmany()
             
@@ -23,10 +23,11 @@ from pycvsanaly2.profile import profiler_start, profiler_stop
 from pycvsanaly2.utils import printdbg, printerr, uri_to_filename
 from pycvsanaly2.Database import (SqliteDatabase, MysqlDatabase, 
     TableAlreadyExists, statement)
+from pycvsanaly2.RevisionIndex import RevisionIndex
 from repositoryhandler.backends import RepositoryCommandError
 from repositoryhandler.backends.watchers import BLAME
 from guilty.parser import create_parser
-from Jobs import JobPool, Job
+from Jobs import JobPool, Job, get_job_processes
 from FilePaths import FilePaths
 import os
 import sys
@@ -243,11 +244,23 @@ class HunkBlame(Blame):
             where f.repository_id=?"""
         cursor.execute(statement(query, self.db.place_holder), (repoid,))
         return [h[0] for h in cursor.fetchall()]
+
+    def __get_revisions(self, cursor, repoid):
+        query = "select rev, id from scmlog where repository_id = ?"
+        cursor.execute(statement(query, self.db.place_holder), (repoid,))
+        revisions = RevisionIndex()
+        rs = cursor.fetchmany(1000)
+        while rs:
+            for rev, commit_id in rs:
+                revisions[rev] = commit_id
+            rs = cursor.fetchmany(1000)
+
+        return revisions
     
     # It is also possible to get previous commit by modifying
     # PatchParser.iter_file_patch
     def __find_previous_commit(self, repo, file_id, commit_id, repoid):
-        cnn = self.db.connect()
+        cnn = self.db.get_connection()
         cursor = cnn.cursor()
         
         # calculate commit_rev and file_path of current commit
@@ -270,16 +283,13 @@ class HunkBlame(Blame):
         except:
             pre_rev = None
         
-        pre_commit_query = """SELECT id FROM scmlog WHERE rev = ?"""
-        try:
-            cursor.execute(statement(pre_commit_query, self.db.place_holder),
-                           (pre_rev,))
-            pre_commit_id = cursor.fetchone()[0]
-        except:
+        if pre_rev is not None:
+            pre_commit_id = self.revisions.get(pre_rev)
+        else:
             pre_commit_id = None
         
         cursor.close()
-        cnn.close()
+        self.db.release_connection(cnn)
         
         # Make sure pre_rev and pre_commit_id are not None
         if pre_commit_id is None or pre_rev is None:
@@ -289,23 +299,14 @@ class HunkBlame(Blame):
 
     def populate_insert_args(self, job):
         bug_revs = job.get_bug_revs()
-        cnn = self.db.connect()
-        cursor = cnn.cursor()
         args = []
         for hunk_id in bug_revs:
             for rev in bug_revs[hunk_id]:
                 printdbg("Find id for rev %s" % rev)
-                query = "select id from scmlog where rev = ?"
-                cursor.execute(statement(query, self.db.place_holder),
-                               (rev,))
-                
-                fetched_row = cursor.fetchone()
-                
-                if fetched_row is not None:
-                    args.append((hunk_id, fetched_row[0]))
+                commit_id = self.revisions.get(rev)
+                if commit_id is not None:
+                    args.append((hunk_id, commit_id))
                     
-        cursor.close()
-        cnn.close()
         return args
         
     def run(self, repo, uri, db):
@@ -350,8 +351,10 @@ class HunkBlame(Blame):
             raise ExtensionRunError(str(e))
         
         blames = self.__get_hunk_blames(read_cursor, repoid)
+        self.revisions = self.__get_revisions(read_cursor, repoid)
 
-        job_pool = JobPool(repo, path or repo.get_uri(), queuesize=100)
+        job_pool = JobPool(repo, path or repo.get_uri(), queuesize=100,
+                           processes=get_job_processes("HunkBlame"))
         
         outer_query = """select distinct h.file_id, h.commit_id
             from hunks h, scmlog s
@@ -427,6 +430,7 @@ class HunkBlame(Blame):
 
         job_pool.join()
         self.process_finished_jobs(job_pool, write_cursor, True)
+        job_pool.close()
 
         try:
             self.__drop_cache(cnn)
@@ -21,7 +21,7 @@ from pycvsanaly2.extensions import Extension, register_extension, \
         ExtensionRunError
 from pycvsanaly2.extensions.FilePaths import FilePaths
 from pycvsanaly2.Database import SqliteDatabase, MysqlDatabase, statement, \
-    ICursor, execute_statement
+    execute_insert_many
 from pycvsanaly2.utils import printdbg, printerr, printout, uri_to_filename
 from pycvsanaly2.profile import profiler_start, profiler_stop
 from pycvsanaly2.PatchParser import parse_patches, RemoveLine, InsertLine, \
@@ -267,7 +267,7 @@ class Hunks(Extension):
                     (repo.get_uri(), str(e)))
         
         profiler_start("Hunks: fetch all patches")
-        icursor = ICursor(read_cursor, self.INTERVAL_SIZE)
+        icursor = db.icursor(connection, self.INTERVAL_SIZE)
         # Get the patches from this repository
         query = """select p.commit_id, p.patch, s.rev 
                     from patches p, scmlog s 
@@ -281,7 +281,13 @@ class Hunks(Extension):
         fp = FilePaths(db)
         rs = icursor.fetchmany()
 
+        insert = """insert into hunks(file_id, commit_id,
+                    old_start_line, old_end_line, new_start_line, 
+                    new_end_line)
+                    values(?,?,?,?,?,?)"""
+
         while rs:
+            hunks = []
             for commit_id, patch_content, rev in rs:  
                 for hunk in self.get_commit_data(patch_content):
                     # Get the file ID from the database for linking
@@ -301,25 +307,19 @@ class Hunks(Extension):
                                      hunk_file_name + \
                                      " at commit " + commit_id)
 
-                    insert = """insert into hunks(file_id, commit_id,
-                                old_start_line, old_end_line, new_start_line, 
-                                new_end_line)
-                                values(?,?,?,?,?,?)"""
-
-                    execute_statement(statement(insert, db.place_holder),
-                                      (file_id, commit_id, 
-                                       hunk.old_start_line,
-                                       hunk.old_end_line, 
-                                       hunk.new_start_line,
-                                       hunk.new_end_line),
-                                       write_cursor,
-                                       db,
-                                       "Couldn't insert hunk, dup record?",
-                                       exception=ExtensionRunError)
-            
+                    hunks.append((file_id, commit_id,
+                                  hunk.old_start_line,
+                                  hunk.old_end_line, 
+                                  hunk.new_start_line,
+                                  hunk.new_end_line))
+
+            execute_insert_many(insert, hunks, write_cursor, db,
+                                "Couldn't insert hunk, dup record?",
+                                exception=ExtensionRunError)
             connection.commit()
             rs = icursor.fetchmany()
 
+        icursor.close()
         read_cursor.close()
         connection.commit()
         connection.close()
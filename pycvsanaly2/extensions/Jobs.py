@@ -22,22 +22,65 @@ if __name__ == '__main__':
     sys.path.insert(0, "../")
 
 from pycvsanaly2.AsyncQueue import AsyncQueue, TimeOut
+from pycvsanaly2.Config import Config
+from pycvsanaly2.utils import printdbg, printerr
 import repositoryhandler.backends as rh
 import threading
+import time
+from multiprocessing import Pool
 
 
 class JobPool(object):
+    """Runs the pushed jobs in poolsize threads, every one with its own
+    copy of repo. If processes is given, the jobs run in that many
+    worker processes instead: they are pickled to the workers, which
+    have their own copy of repo, and the finished jobs are pickled
+    back. The API is the same in both cases.
+
+    Finished jobs can be taken one by one with get_next_done, or
+    streamed with iter_done as they are finished. If on_done is given,
+    push hands it the jobs finished so far before queuing a new one,
+    and finish hands it the rest, so the jobs are written while the
+    workers keep running instead of waiting for every batch to be done.
+    on_done always runs in the thread pushing the jobs, the one owning
+    the database connection. Jobs raising an exception are reported
+    and given back with failed set to True, like the jobs that catch
+    their own errors do.
+    """
 
     POOL_SIZE = 5
 
     def __init__(self, repo, repo_uri, jobs_done=True, poolsize=POOL_SIZE,
-                 queuesize=None):
+                 queuesize=None, processes=0, on_done=None):
         self.jobs_done = jobs_done
+        self.on_done = on_done
 
         self.queue = AsyncQueue(queuesize or 0)
         if self.jobs_done:
             self.done = AsyncQueue()
 
+        # Jobs pushed, given back and failed, and time the
+        # workers spent running jobs
+        self.n_pushed = 0
+        self.n_returned = 0
+        self.n_failed = 0
+        self.busy = 0.0
+        self.started = time.time()
+        self.stats_lock = threading.Lock()
+
+        self.pool = None
+        if processes > 0:
+            self.n_workers = processes
+            self.pool = Pool(processes, _init_worker, (repo, repo_uri))
+            # Every thread waits for the jobs it hands to the pool
+            for i in range(processes):
+                thread = threading.Thread(target=self._job_thread,
+                                          args=(None, repo_uri))
+                thread.setDaemon(True)
+                thread.start()
+            return
+
+        self.n_workers = poolsize
         for i in range(poolsize):
             rep = repo.copy()
             thread = threading.Thread(target=self._job_thread,
@@ -48,14 +91,38 @@ class JobPool(object):
     def _job_thread(self, repo, repo_uri):
         while True:
             job = self.queue.get()
-            job.run(repo, repo_uri)
-            self.queue.done()
+            start = time.time()
+            failed = False
+            try:
+                if self.pool is not None:
+                    job = self.pool.apply(_run_job, (job,))
+                else:
+                    job.run(repo, repo_uri)
+            except Exception, e:
+                printerr("Error running job %s: %s", (job, str(e)))
+                job.failed = failed = True
 
+            self.stats_lock.acquire()
+            try:
+                self.busy += time.time() - start
+                if failed:
+                    self.n_failed += 1
+            finally:
+                self.stats_lock.release()
+
+            # The job must be in the done queue by the time join()
+            # returns, or the last ones might be missed
             if self.jobs_done:
                 self.done.put(job)
 
+            self.queue.done()
+
     def push(self, job):
+        if self.on_done is not None:
+            self.write_done()
+
         self.queue.put(job)
+        self.n_pushed += 1
 
     # Default timeout is 5 minutes
     def get_next_done(self, timeout=(5 * 60)):
@@ -65,10 +132,12 @@ class JobPool(object):
         try:
             job = self.done.get(timeout)
             self.done.done()
-            return job
         except TimeOut:
             return None
 
+        self.n_returned += 1
+        return job
+
     def get_next_done_unlocked(self):
         if not self.jobs_done:
             return None
@@ -76,19 +145,101 @@ class JobPool(object):
         if self.done.empty_unlocked():
             return None
 
+        self.n_returned += 1
         return self.done.get_unlocked()
 
+    def iter_done(self):
+        """Yields the jobs as they are finished, until all the
+        pushed ones have been given back"""
+        if not self.jobs_done:
+            return
+
+        # Every pushed job ends up in the done queue, failed or not
+        while self.n_returned < self.n_pushed:
+            yield self.get_next_done(None)
+
+    def write_done(self):
+        """Hands the jobs finished so far to on_done"""
+        job = self.get_next_done(0)
+        while job is not None:
+            self.on_done(job)
+            job = self.get_next_done(0)
+
+    def finish(self):
+        """Hands the jobs to on_done as they are finished, until all
+        the pushed ones are done"""
+        for job in self.iter_done():
+            self.on_done(job)
+
     def join(self):
         self.queue.join()
 
+    def utilization(self):
+        """Returns the fraction of the time since the pool was
+        created that the workers spent running jobs"""
+        elapsed = (time.time() - self.started) * self.n_workers
+        if elapsed <= 0:
+            return 0.0
+
+        return self.busy / elapsed
+
+    def close(self):
+        """Stops the worker processes, if any, once the jobs pushed
+        are done"""
+        printdbg("JobPool: %d jobs, %d failed, workers busy %.1f%% " + \
+                 "of the time", (self.n_pushed, self.n_failed,
+                                 self.utilization() * 100))
+
+        if self.pool is not None:
+            self.join()
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+
+def get_job_processes(extension):
+    """Returns the number of worker processes to use for the jobs
+    of extension, 0 means threads"""
+    processes = Config().job_processes
+
+    return processes.get(extension, processes.get('*', 0))
+
+
+# Repository of the worker process
+_worker_repo = None
+
+
+def _init_worker(repo, repo_uri):
+    global _worker_repo
+
+    _worker_repo = (repo.copy(), repo_uri)
+
+
+def _run_job(job):
+    repo, repo_uri = _worker_repo
+    job.run(repo, repo_uri)
+
+    return job
+
 
 class Job(object):
+    # Set when the job couldn't be run
+    failed = False
+
     def __init__(self):
         self.failed = False
 
     def run(self, repo, repo_uri):
         raise NotImplementedError
 
+    def __getstate__(self):
+        # Jobs keep the repository they run with, but
+        # it's not sent to or from the worker processes
+        state = self.__dict__.copy()
+        state.pop('repo', None)
+
+        return state
+
 
 if __name__ == '__main__':
     class JobLastRev(Job):
@@ -25,7 +25,7 @@
 #
 
 from pycvsanaly2.Database import (SqliteDatabase, MysqlDatabase, 
-    TableAlreadyExists, statement)
+    TableAlreadyExists, statement, new_id)
 from pycvsanaly2.extensions import (Extension, register_extension, 
     ExtensionRunError)
 from pycvsanaly2.Config import Config
@@ -38,7 +38,7 @@ from repositoryhandler.backends import RepositoryCommandError
 from repositoryhandler.backends.watchers import CAT
 from tempfile import mkdtemp, NamedTemporaryFile
 from FileRevs import FileRevs
-from Jobs import JobPool, Job
+from Jobs import JobPool, Job, get_job_processes
 from xml.sax import handler as xmlhandler, make_parser
 from signal import SIGTERM
 import os
@@ -546,13 +546,14 @@ def create_file_metrics(path):
 
 class MetricsJob(Job):
 
-    def __init__(self, id_counter, file_id, commit_id, path, rev, failed):
+    def __init__(self, id_counter, file_id, commit_id, path, rev, retry):
         self.id_counter = id_counter
         self.file_id = file_id
         self.commit_id = commit_id
         self.path = path
         self.rev = rev
-        self.failed = failed
+        # The metrics were already in the database, but failed
+        self.retry = retry
 
     def __measure_file(self, fm, measures, checkout_path, rev):
         printdbg("Measuring %s @ %s", (checkout_path, rev))
@@ -718,8 +719,8 @@ class MetricsJob(Job):
     def get_commit_id(self):
         return self.commit_id
 
-    def is_failed(self):
-        return self.failed
+    def is_retry(self):
+        return self.retry
 
 
 class Metrics(Extension):
@@ -732,6 +733,8 @@ class Metrics(Extension):
                     mccabe_min, mccabe_sum, mccabe_mean, mccabe_median, 
                     halstead_length, halstead_vol, halstead_level, halstead_md)
                     VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)"""
+    __table__ = "metrics"
+    id_counter = 1
     MAX_METRICS = 100
     INTERVAL_SIZE = 1000
 
@@ -835,75 +838,71 @@ class Metrics(Extension):
         if not self.metrics:
             return
         
-        cursor.executemany(statement(self.__insert__, self.db.place_holder), 
-                           self.metrics)
+        self.db.insert_many(cursor, self.__insert__, self.metrics)
         self.metrics = []
 
-    def __process_finished_jobs(self, job_pool, write_cursor, 
-                                unlocked=False):
-        if unlocked:
-            job = job_pool.get_next_done_unlocked()
+    def __add_metrics(self, job):
+        if job.failed:
+            return
+
+        id_counter = job.get_id()
+        measures = job.get_measures()
+        file_id = job.get_file_id()
+        commit_id = job.get_commit_id()
+
+        if job.is_retry():
+            query = """update metrics set lang=?, sloc=?, loc=?,
+                       ncomment=?, lcomment=?, lblank=?, nfunctions=?,
+                       mccabe_max=?, mccabe_min=?, mccabe_sum=?, 
+                       mccabe_mean=?, mccabe_median=?,
+                       halstead_length=?, halstead_vol=?, halstead_level=?, 
+                       halstead_md=?
+                       where file_id = ? and commit_id = ?"""
+                
+            self.write_cursor.execute(statement(query, self.db.place_holder),
+                                      (measures.lang, 
+                                       measures.sloc, 
+                                       measures.loc,
+                                       measures.ncomment, 
+                                       measures.lcomment, 
+                                       measures.lblank, 
+                                       measures.nfunctions,
+                                       measures.mccabe_max, 
+                                       measures.mccabe_min, 
+                                       measures.mccabe_sum, 
+                                       measures.mccabe_mean,
+                                       measures.mccabe_median, 
+                                       measures.halstead_length, 
+                                       measures.halstead_vol,
+                                       measures.halstead_level, 
+                                       measures.halstead_md, 
+                                       file_id, 
+                                       commit_id))
         else:
-            job = job_pool.get_next_done(0.5)
-            
-        while job is not None:
-            id_counter = job.get_id()
-            measures = job.get_measures()
-            file_id = job.get_file_id()
-            commit_id = job.get_commit_id()
-
-            if job.is_failed():
-                query = """update metrics set lang=?, sloc=?, loc=?,
-                           ncomment=?, lcomment=?, lblank=?, nfunctions=?,
-                           mccabe_max=?, mccabe_min=?, mccabe_sum=?, 
-                           mccabe_mean=?, mccabe_median=?,
-                           halstead_length=?, halstead_vol=?, halstead_level=?, 
-                           halstead_md=?
-                           where file_id = ? and commit_id = ?"""
-                    
-                write_cursor.execute(statement(query, self.db.place_holder),
-                                     (measures.lang, 
-                                      measures.sloc, 
-                                      measures.loc,
-                                      measures.ncomment, 
-                                      measures.lcomment, 
-                                      measures.lblank, 
-                                      measures.nfunctions,
-                                      measures.mccabe_max, 
-                                      measures.mccabe_min, 
-                                      measures.mccabe_sum, 
-                                      measures.mccabe_mean,
-                                      measures.mccabe_median, 
-                                      measures.halstead_length, 
-                                      measures.halstead_vol,
-                                      measures.halstead_level, 
-                                      measures.halstead_md, 
-                                      file_id, 
-                                      commit_id))
-            else:
-                self.metrics.append((id_counter, 
-                                     file_id, 
-                                     commit_id, 
-                                     measures.lang, 
-                                     measures.sloc, 
-                                     measures.loc,
-                                     measures.ncomment, 
-                                     measures.lcomment, 
-                                     measures.lblank, 
-                                     measures.nfunctions,
-                                     measures.mccabe_max, 
-                                     measures.mccabe_min, 
-                                     measures.mccabe_sum, 
-                                     measures.mccabe_mean,
-                                     measures.mccabe_median, 
-                                     measures.halstead_length, 
-                                     measures.halstead_vol,
-                                     measures.halstead_level, 
-                                     measures.halstead_md))
-            if unlocked:
-                job = job_pool.get_next_done_unlocked()
-            else:
-                job = job_pool.get_next_done(0.5)
+            self.metrics.append((id_counter, 
+                                 file_id, 
+                                 commit_id, 
+                                 measures.lang, 
+                                 measures.sloc, 
+                                 measures.loc,
+                                 measures.ncomment, 
+                                 measures.lcomment, 
+                                 measures.lblank, 
+                                 measures.nfunctions,
+                                 measures.mccabe_max, 
+                                 measures.mccabe_min, 
+                                 measures.mccabe_sum, 
+                                 measures.mccabe_mean,
+                                 measures.mccabe_median, 
+                                 measures.halstead_length, 
+                                 measures.halstead_vol,
+                                 measures.halstead_level, 
+                                 measures.halstead_md))
+
+        if len(self.metrics) >= self.MAX_METRICS:
+            profiler_start("Inserting results in db")
+            self.__insert_many(self.write_cursor)
+            profiler_stop("Inserting results in db")
 
     def run(self, repo, uri, db):
         profiler_start("Running Metrics extension")
@@ -914,7 +913,6 @@ class Metrics(Extension):
         read_cursor = cnn.cursor()
         write_cursor = cnn.cursor()
         
-        id_counter = 1
         metrics = metrics_failed = []
 
         try:
@@ -947,23 +945,21 @@ class Metrics(Extension):
                             f.repository_id = ?"""
                 cursor.execute(statement(query, db.place_holder), (repoid,))
                 cnn.commit()
-                
-            cursor.execute(statement("SELECT max(id) from metrics", 
-                                     db.place_holder))
-            id = cursor.fetchone()[0]
-            if id is not None:
-                id_counter = id + 1
 
             cursor.close()
-        except Exception, e:
-            raise ExtensionRunError(str(e))
 
-        if id_counter > 1:
             metrics = self.__get_metrics(read_cursor, repoid)
             metrics_failed = self.__get_metrics_failed(read_cursor, repoid)
+        except Exception, e:
+            raise ExtensionRunError(str(e))
+
+        # Metrics are written as their jobs are done
+        self.write_cursor = write_cursor
 
         job_pool = JobPool(repo, path or repo.get_uri(), 
-                           queuesize=self.MAX_METRICS)
+                           queuesize=self.MAX_METRICS,
+                           processes=get_job_processes("Metrics"),
+                           on_done=self.__add_metrics)
 
         # Get code files to discard all other files in case of metrics-all
         query = "select f.id from file_types ft, files f " + \
@@ -980,12 +976,12 @@ class Metrics(Extension):
             if file_id not in code_files:
                 continue
 
-            failed = False
+            retry = False
 
             if (file_id, commit_id) in metrics_failed:
                 printdbg("%d@%d is already in the database, " + \
                          "but it failed, try again", (file_id, commit_id))
-                failed = True
+                retry = True
             elif(file_id, commit_id) in metrics:
                 printdbg("%d@%d is already in the database, skip it", 
                          (file_id, commit_id))
@@ -1011,28 +1007,24 @@ class Metrics(Extension):
                 printdbg("Skipping file %s", (relative_path,))
                 continue
 
-            job = MetricsJob(id_counter, file_id, commit_id, relative_path, 
-                             rev, failed)
+            job = MetricsJob(new_id(self), file_id, commit_id, relative_path, 
+                             rev, retry)
             job_pool.push(job)
-            id_counter += 1
             n_metrics += 1
 
             if n_metrics >= self.MAX_METRICS:
-                self.__process_finished_jobs(job_pool, write_cursor)
-                profiler_start("Inserting results in db")
-                self.__insert_many(write_cursor)
                 cnn.commit()
-                profiler_stop("Inserting results in db")
                 n_metrics = 0
 
-        job_pool.join()
-        self.__process_finished_jobs(job_pool, write_cursor, True)
+        job_pool.finish()
+        job_pool.close()
                 
         profiler_start("Inserting results in db")
         self.__insert_many(write_cursor)
         cnn.commit()
         profiler_stop("Inserting results in db")
 
+        fr.close()
         read_cursor.close()
         write_cursor.close()
         cnn.close()
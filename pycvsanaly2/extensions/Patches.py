@@ -20,13 +20,13 @@
 from repositoryhandler.backends.watchers import DIFF
 from repositoryhandler.Command import CommandError, CommandRunningError
 from pycvsanaly2.Database import (SqliteDatabase, MysqlDatabase, 
-        TableAlreadyExists, statement, ICursor, execute_statement)
+        TableAlreadyExists, statement, execute_insert_many, new_id)
 from pycvsanaly2.Config import Config
 from pycvsanaly2.extensions import (Extension, register_extension, 
     ExtensionRunError)
 from pycvsanaly2.utils import to_utf8, printerr, printdbg, uri_to_filename
 from io import BytesIO
-from Jobs import JobPool, Job
+from Jobs import JobPool, Job, get_job_processes
 
 
 class PatchJob(Job):
@@ -76,13 +76,13 @@ class PatchJob(Job):
 class DBPatch(object):
 
     id_counter = 1
+    __table__ = "patches"
 
     __insert__ = "INSERT INTO patches (id, commit_id, patch) values (?, ?, ?)"
 
     def __init__(self, id, commit_id, data):
         if id is None:
-            self.id = DBPatch.id_counter
-            DBPatch.id_counter += 1
+            self.id = new_id(DBPatch)
         else:
             self.id = id
 
@@ -149,25 +149,26 @@ class Patches(Extension):
 
         return commits
 
-    def __process_finished_jobs(self, job_pool, write_cursor, db):
-        finished_job = job_pool.get_next_done(0)
+    def __add_patch(self, job):
+        if job.failed:
+            return
 
         # scmlog_id is the commit ID. For some reason, the 
         # documentation advocates tablename_id as the reference,
         # but in the source, these are referred to as commit IDs.
         # Don't ask me why!
-        while finished_job is not None:
-            p = DBPatch(None, finished_job.commit_id, finished_job.data)
-
-            execute_statement(statement(DBPatch.__insert__, 
-                                        self.db.place_holder),
-                              (p.id, p.commit_id, p.patch),
-                              write_cursor,
-                              db,
-                              "Couldn't insert, duplicate patch?",
-                              exception=ExtensionRunError)
-            
-            finished_job = job_pool.get_next_done(0)
+        p = DBPatch(None, job.commit_id, job.data)
+        self.patches.append((p.id, p.commit_id, p.patch))
+
+        if len(self.patches) >= self.INTERVAL_SIZE:
+            self.__insert_patches()
+
+    def __insert_patches(self):
+        execute_insert_many(DBPatch.__insert__, self.patches,
+                            self.write_cursor, self.db,
+                            "Couldn't insert, duplicate patch?",
+                            exception=ExtensionRunError)
+        self.patches = []
 
     def run(self, repo, uri, db):
         self.db = db
@@ -197,23 +198,21 @@ class Patches(Extension):
             printdbg("Creating patches table")
             self.__create_table(cnn)
         except TableAlreadyExists:
-            printdbg("Patches table exists already, getting max ID")
-            cursor.execute(statement("SELECT max(id) from patches", 
-                                     db.place_holder))
-            id = cursor.fetchone()[0]
-            if id is not None:
-                DBPatch.id_counter = id + 1
-
+            printdbg("Patches table exists already")
             commits = self.__get_patches_for_repository(repo_id, cursor)
         except Exception, e:
             raise ExtensionRunError(str(e))
 
+        # Patches are written as their jobs are done
+        self.patches = []
+        self.write_cursor = cnn.cursor()
+
         queuesize = Config().max_threads
-        job_pool = JobPool(repo, path or repo.get_uri(), queuesize=queuesize)        
-        i = 0
+        job_pool = JobPool(repo, path or repo.get_uri(), queuesize=queuesize,
+                           processes=get_job_processes("Patches"),
+                           on_done=self.__add_patch)
 
-        write_cursor = cnn.cursor()
-        icursor = ICursor(cursor, self.INTERVAL_SIZE)
+        icursor = db.icursor(cnn, self.INTERVAL_SIZE)
         icursor.execute(statement("SELECT id, rev, composed_rev " + \
                                   "from scmlog where repository_id = ?",
                                     db.place_holder), (repo_id,))
@@ -232,21 +231,15 @@ class Patches(Extension):
                 job = PatchJob(rev, commit_id)
                 job_pool.push(job)
 
-                i = i + 1
-                if i >= queuesize:
-                    printdbg("Queue is now at %d, flushing to database", (i,))
-                    job_pool.join()
-                    self.__process_finished_jobs(job_pool, write_cursor, db)
-                    cnn.commit()
-                    i = 0
-
             rs = icursor.fetchmany()
             cnn.commit()
 
-        job_pool.join()
-        self.__process_finished_jobs(job_pool, write_cursor, db)
+        job_pool.finish()
+        self.__insert_patches()
+        job_pool.close()
         cnn.commit()
-        write_cursor.close()
+        icursor.close()
+        self.write_cursor.close()
         cursor.close()
         cnn.close()
         
@@ -29,7 +29,11 @@ Main funcion of cvsanaly. Fun starts here!
 """
 
 import os
+import sys
+import time
 import getopt
+from Queue import Empty
+from multiprocessing import Process, Queue
 from repositoryhandler.Command import Command, CommandTimeOut
 from repositoryhandler.backends import (create_repository,
     create_repository_from_path, RepositoryUnknownError)
@@ -37,7 +41,7 @@ from ParserFactory import (create_parser_from_logfile,
     create_parser_from_repository)
 from Database import (create_database, TableAlreadyExists, AccessDenied,
     DatabaseNotFound, DatabaseDriverNotSupported, DBRepository, statement,
-    initialize_ids, DatabaseException)
+    initialize_ids, release_ids, DatabaseException, SqliteDatabase)
 from DBProxyContentHandler import DBProxyContentHandler
 from Log import LogReader, LogWriter
 from extensions import get_all_extensions
@@ -53,11 +57,13 @@ def usage():
     print "%s %s - %s" % (PACKAGE, VERSION, DESCRIPTION)
     print COPYRIGHT
     print
-    print "Usage: cvsanaly2 [options] [URI]"
+    print "Usage: cvsanaly2 [options] [URI...]"
     print """
 Analyze the given URI. An URI can be a checked out directory,
 or a remote URL pointing to a repository. If URI is omitted,
 the current working directory will be used as a checked out directory.
+When several URIs are given, every repository is analyzed by its own
+process and all of them are stored in the same database.
 
 Options:
 
@@ -72,6 +78,18 @@ Options:
   -s, --save-logfile[=path]      Save the repository log to the given path
   -n, --no-parse                 Skip the parsing process. It only makes sense
                                  in conjunction with --extensions
+      --repos-file=path          Analyze the repositories listed in the given
+                                 file, one URI per line
+  -j, --jobs=N                   Number of repositories analyzed at the same
+                                 time when several URIs are given (1)
+      --parse-jobs=N             Number of processes used to parse the log
+                                 (only works for Git and CVS right now)
+      --job-processes=N|ext:N,...
+                                 Run the jobs of the extensions in N worker
+                                 processes instead of threads, for all of
+                                 them or only for the given ones
+      --action-lines             Store the number of lines added and removed
+                                 by every action (only works for Git right now)
       --extensions=ext1,ext2,    List of extensions to run
       --hard-order               Execute extensions in exactly the order given.
                                  Won't follow extension dependencies.
@@ -126,18 +144,30 @@ def _parse_log(uri, repo, parser, reader, config, db):
     # Start the parsing process
     printout("Parsing log for %s (%s)", (uri, repo.get_type()))
 
-    def new_line(line, user_data):
+    def new_buffer(data, user_data):
         parser, writer = user_data
 
-        parser.feed(line)
-        writer and writer.add_line(line)
+        parser.feed_buffer(data)
+        writer and writer.add_line(data)
 
     writer = None
     if config.save_logfile is not None:
         writer = LogWriter(config.save_logfile)
 
     parser.set_content_handler(DBProxyContentHandler(db))
-    reader.start(new_line, (parser, writer))
+    # Live git repositories are always read in the NUL delimited
+    # format, which is faster to parse than the --pretty=fuller one.
+    # The saved log files keep the format repositoryhandler writes
+    if writer is None and config.repo_logfile is None and \
+       repo.get_type() == 'git':
+        parser.parse_repository_parallel(uri, config.parse_jobs,
+                                         config.branch, config.action_lines)
+    else:
+        if config.action_lines and repo.get_type() == 'git' and \
+           config.repo_logfile is None:
+            printout("Warning: lines added and removed are not stored " + \
+                     "when the log is saved to a file")
+        reader.start_buffered(new_buffer, (parser, writer))
     parser.end()
     writer and writer.close()
 
@@ -198,16 +228,356 @@ def _get_extensions_manager(extensions, hard_order=False):
     sys.exit(1)
 
 
+def _create_database(config):
+    """Returns the database given in config, or None if it can't be
+    used"""
+    try:
+        printdbg("Creating database")
+        return create_database(config.db_driver,
+                               config.db_database,
+                               config.db_user,
+                               config.db_password,
+                               config.db_hostname)
+    except AccessDenied, e:
+        printerr("Error creating database: %s", (e.message,))
+    except DatabaseNotFound:
+        printerr("Database %s doesn't exist. It must be created before " + \
+                 "running cvsanaly", (config.db_database,))
+    except DatabaseDriverNotSupported:
+        printerr("Database driver %s is not supported by cvsanaly",
+                 (config.db_driver,))
+
+    return None
+
+def _read_repos_file(filename):
+    """Returns the URIs listed in filename, one per line. Empty lines
+    and lines starting with # are skipped."""
+    f = open(filename, "r")
+    uris = [line.strip() for line in f]
+    f.close()
+
+    return [uri for uri in uris if uri and not uri.startswith('#')]
+
+def _analyze_repository(uri, config, backout=False, in_bulk_load=False,
+                        run_extensions=True):
+    """Parses the log of the repository and runs the extensions,
+    returning the exit status.
+
+    Args:
+      uri: The URI of the repository
+      config: The Config object that specifies the current config
+      backout: Remove the repository from the database instead
+      in_bulk_load: The database is being bulk loaded by the caller,
+        which ends the bulk load when it's done
+      run_extensions: Run the extensions after parsing the log
+    """
+    path = uri_to_filename(uri)
+    (uri, repo) = _get_uri_and_repo(path)
+
+    if not config.no_parse:
+        printdbg("Preparing logging")
+        # Create reader
+        reader = LogReader()
+        reader.set_repo(repo, path or uri)
+        reader.set_branch(config.branch)
+
+        # Create parser
+        if config.repo_logfile is not None:
+            parser = create_parser_from_logfile(config.repo_logfile)
+            reader.set_logfile(config.repo_logfile)
+        else:
+            parser = _get_parser_from_repository(repo)
+
+        parser.set_repository(repo, uri)
+
+        if parser is None:
+            printerr("Failed to create parser")
+            return 1
+
+        # TODO: check parser type == logfile type
+
+    db_exists = False
+
+    db = _create_database(config)
+    if db is None:
+        return 1
+
+    emg = _get_extensions_manager(config.extensions, config.hard_order)
+
+    cnn = db.connect()
+
+    if backout:
+        # Run extensions
+        #printout(str(get_all_extensions()))
+        printout("Backing out all extensions")
+        emg.backout_extensions(repo, path or uri, db)
+        printout("Backing out repo from database")
+        backout_handler = DBDeletionHandler(db, repo, uri, cnn)
+        backout_handler.begin()
+
+        # Final commit just in case
+        cnn.commit()
+        cnn.close()
+        return 1
+
+    cursor = cnn.cursor()
+
+    if in_bulk_load or not config.no_parse:
+        # Until we know whether the database is new
+        db.begin_bulk_load()
+
+    try:
+        printdbg("Creating tables")
+        db.create_tables(cursor)
+        cnn.commit()
+    except TableAlreadyExists:
+        printdbg("Tables not created, database already exists")
+        db_exists = True
+    except DatabaseException, e:
+        printerr("Database error: %s", (e.message,))
+        return 1
+
+    if db_exists and config.action_lines:
+        # Databases created before the action_lines table existed
+        try:
+            db.create_action_lines_table(cursor)
+            cnn.commit()
+        except TableAlreadyExists:
+            pass
+        except DatabaseException, e:
+            printerr("Database error: %s", (e.message,))
+            return 1
+
+    if config.no_parse and not db_exists:
+        printerr("The option --no-parse must be used with an already " + \
+                 "filled database")
+        return 1
+
+    # Add repository to Database
+    if db_exists:
+        printdbg("Database exists, so looking for existing repository")
+        cursor.execute(statement("SELECT id from repositories where uri = ?",
+                                 db.place_holder), (uri,))
+        rep = cursor.fetchone()
+        cursor.close()
+
+    # Ids of the new rows are reserved in the database, other
+    # processes might be writing to it too
+    initialize_ids(db)
+
+    if config.no_parse and rep is None:
+        printerr("The option --no-parse must be used with an already " + \
+                 "filled database")
+        return 1
+
+    if not db_exists or rep is None:
+        # We consider the name of the repo as the last item of the root path
+        name = uri.rstrip("/").split("/")[-1].strip()
+        cursor = cnn.cursor()
+        rep = DBRepository(None, uri, name, repo.get_type())
+        cursor.execute(statement(DBRepository.__insert__, db.place_holder),
+                       (rep.id, rep.uri, rep.name, rep.type))
+        cursor.close()
+        cnn.commit()
+
+    cnn.close()
+
+    if db_exists and not in_bulk_load:
+        # Only new databases are bulk loaded. This only creates the
+        # indexes if a previous bulk load was interrupted
+        db.end_bulk_load()
+
+    if not config.no_parse:
+        try:
+            _parse_log(path or uri, repo, parser, reader, config, db)
+        finally:
+            if db.bulk_load and not in_bulk_load:
+                db.end_bulk_load()
+
+    if run_extensions:
+        printout("Executing extensions")
+        emg.run_extensions(repo, path or uri, db)
+
+    release_ids()
+
+    db.close_connections()
+    printdbg("%d database connections opened", (db.n_connections,))
+
+    return 0
+
+def _repository_worker(uri, config, backout, in_bulk_load, phase, results):
+    """Analyzes the repository in a process of its own, and puts
+    its (uri, status, time) on the results queue. phase is PARSE to
+    only parse the log, EXTENSIONS to only run the extensions, or None
+    to do both"""
+    if phase == EXTENSIONS:
+        config.no_parse = True
+
+    start = time.time()
+    try:
+        status = _analyze_repository(uri, config, backout, in_bulk_load,
+                                     phase != PARSE)
+    except SystemExit, e:
+        status = e.code
+    except Exception, e:
+        printerr("Error analyzing %s: %s", (uri, str(e)))
+        status = 1
+
+    results.put((uri, status or 0, time.time() - start))
+
+def _count_commits(db):
+    cnn = db.connect()
+    cursor = cnn.cursor()
+    cursor.execute(statement("SELECT count(*) from scmlog", db.place_holder))
+    n_commits = cursor.fetchone()[0]
+    cursor.close()
+    cnn.close()
+
+    return n_commits
+
+# Phases of the repository workers
+PARSE = "parse"
+EXTENSIONS = "extensions"
+
+def _run_workers(uris, config, backout, in_bulk_load, phase, jobs):
+    """Runs _repository_worker for every repository, up to jobs of
+    them at the same time, and returns their (uri, status, time),
+    time is None for those that crashed"""
+    results = Queue()
+    pending = list(uris)
+    running = {}
+    summary = []
+    while pending or running:
+        while pending and len(running) < jobs:
+            uri = pending.pop(0)
+            process = Process(target=_repository_worker,
+                              args=(uri, config, backout, in_bulk_load,
+                                    phase, results))
+            process.start()
+            running[uri] = process
+
+        try:
+            uri, status, elapsed = results.get(True, 1)
+        except Empty:
+            # A process that died without reporting crashed
+            for uri, process in running.items():
+                if not process.is_alive() and process.exitcode != 0:
+                    printerr("Process analyzing %s died (exit code %d)",
+                             (uri, process.exitcode))
+                    running.pop(uri).join()
+                    summary.append((uri, 1, None))
+            continue
+
+        running.pop(uri).join()
+        summary.append((uri, status, elapsed))
+
+    return summary
+
+def _analyze_repositories(uris, config, backout=False):
+    """Analyzes every repository in a process of its own, running up to
+    config.jobs of them at the same time, and prints a summary. The
+    processes share the database: ids are reserved in blocks by each
+    of them, and the temporary logs and caches are private to every
+    repository. Returns the exit status, 1 if any repository failed.
+    """
+    db = _create_database(config)
+    if db is None:
+        return 1
+
+    # Tables are created before starting the workers,
+    # so they don't race to create them
+    db_exists = False
+    cnn = db.connect()
+    cursor = cnn.cursor()
+    if not (config.no_parse or backout):
+        db.begin_bulk_load()
+    try:
+        printdbg("Creating tables")
+        db.create_tables(cursor)
+        cnn.commit()
+    except TableAlreadyExists:
+        printdbg("Tables not created, database already exists")
+        db_exists = True
+    except DatabaseException, e:
+        printerr("Database error: %s", (e.message,))
+        return 1
+
+    if not backout:
+        # Names claimed by the processes of a previous run are
+        # either in the database already or lost
+        db.create_names_table(cursor)
+        cnn.commit()
+    cursor.close()
+    cnn.close()
+
+    if db_exists:
+        # Only new databases are bulk loaded
+        db.end_bulk_load()
+
+    n_commits = _count_commits(db)
+
+    printout("Analyzing %d repositories with %d processes",
+             (len(uris), config.jobs))
+    start = time.time()
+    if backout:
+        summary = _run_workers(uris, config, backout, False, None,
+                               config.jobs)
+    else:
+        # The extensions run once the logs of all the repositories
+        # are in the database, and the indexes are created
+        summary = []
+        if not config.no_parse:
+            summary = _run_workers(uris, config, backout, db.bulk_load,
+                                   PARSE, config.jobs)
+            if db.bulk_load:
+                db.end_bulk_load()
+
+        if config.extensions:
+            # SQLite allows a single writer, extensions reading and
+            # writing at the same time would find the database locked
+            jobs = config.jobs
+            if isinstance(db, SqliteDatabase):
+                jobs = 1
+
+            times = dict([(uri, elapsed) for uri, status, elapsed in summary])
+            summary = [entry for entry in summary if entry[1]]
+            failed = set([uri for uri, status, elapsed in summary])
+            parsed = [uri for uri in uris if uri not in failed]
+            printout("Executing extensions for %d repositories",
+                     (len(parsed),))
+            for uri, status, elapsed in _run_workers(parsed, config, backout,
+                                                     False, EXTENSIONS, jobs):
+                if elapsed is not None:
+                    elapsed += times.get(uri, 0)
+                summary.append((uri, status, elapsed))
+
+    n_failed = len([status for uri, status, elapsed in summary if status])
+
+    printout("Summary:")
+    for uri, status, elapsed in summary:
+        if elapsed is None:
+            printout("  %s: crashed", (uri,))
+        else:
+            printout("  %s: %s (%.2fs)",
+                     (uri, status and "failed" or "ok", elapsed))
+    printout("%d repositories analyzed in %.2fs, %d failed, %d new commits",
+             (len(summary), time.time() - start, n_failed,
+              _count_commits(db) - n_commits))
+
+    return n_failed and 1 or 0
+
+
 def main(argv):
     # Short (one letter) options. Those requiring argument followed by :
-    short_opts = "hVgqbnf:l:s:u:p:d:H:"
+    short_opts = "hVgqbnf:l:s:u:p:d:H:j:"
     # Long options (all started by --). Those requiring argument followed by =
     long_opts = ["help", "version", "debug", "quiet", "profile",
                  "config-file=", "repo-logfile=", "save-logfile=",
                  "no-parse", "db-user=", "db-password=", "db-hostname=",
                  "db-database=", "db-driver=", "extensions=", "hard-order",
                  "metrics-all", "metrics-noerr", "no-content", "branch=",
-                 "backout", "low-memory", "count-types="]
+                 "backout", "low-memory", "count-types=", "parse-jobs=",
+                 "action-lines", "repos-file=", "jobs=", "job-processes="]
 
     # Default options
     debug = None
@@ -231,6 +601,11 @@ def main(argv):
     branch = None
     backout = None
     count_types = None
+    parse_jobs = None
+    action_lines = None
+    repos_file = None
+    jobs = None
+    job_processes = None
 
     try:
         opts, args = getopt.getopt(argv, short_opts, long_opts)
@@ -287,11 +662,46 @@ def main(argv):
             no_content = True
         elif opt in ("-b", "--backout"):
             backout = True
+        elif opt in ("--parse-jobs", ):
+            try:
+                parse_jobs = int(value)
+            except ValueError:
+                printerr("Invalid number of parse jobs: %s", (value,))
+                return 1
+        elif opt in ("--action-lines", ):
+            action_lines = True
+        elif opt in ("--repos-file", ):
+            repos_file = value
+        elif opt in ("-j", "--jobs"):
+            try:
+                jobs = int(value)
+            except ValueError:
+                printerr("Invalid number of jobs: %s", (value,))
+                return 1
+        elif opt in ("--job-processes", ):
+            job_processes = {}
+            for item in value.split(','):
+                name, sep, n = item.rpartition(':')
+                try:
+                    job_processes[name or '*'] = int(n)
+                except ValueError:
+                    printerr("Invalid number of job processes: %s", (item,))
+                    return 1
+
+    uris = args
+    if repos_file is not None:
+        try:
+            uris = uris + _read_repos_file(repos_file)
+        except IOError, e:
+            printerr("Error reading repositories file %s: %s",
+                     (repos_file, e.strerror))
+            return 1
+    if not uris:
+        uris = [os.getcwd()]
 
-    if len(args) <= 0:
-        uri = os.getcwd()
-    else:
-        uri = args[0]
+    # Every repository is analyzed once, their caches are per URI
+    seen = set()
+    uris = [uri for uri in uris if not (uri in seen or seen.add(uri))]
 
     config = Config()
     try:
@@ -345,6 +755,14 @@ def main(argv):
         config.no_content = no_content
     if backout is not None:
         config.extensions = get_all_extensions()
+    if parse_jobs is not None:
+        config.parse_jobs = parse_jobs
+    if action_lines is not None:
+        config.action_lines = action_lines
+    if jobs is not None:
+        config.jobs = jobs
+    if job_processes is not None:
+        config.job_processes = job_processes
 
     if not config.extensions and config.no_parse:
         # Do nothing!!!
@@ -354,118 +772,16 @@ def main(argv):
         import repositoryhandler.backends
         repositoryhandler.backends.DEBUG = True
 
-    path = uri_to_filename(uri)
-    (uri, repo) = _get_uri_and_repo(path)
-
-    if not config.no_parse:
-        printdbg("Preparing logging")
-        # Create reader
-        reader = LogReader()
-        reader.set_repo(repo, path or uri)
-        reader.set_branch(config.branch)
-
-        # Create parser
-        if config.repo_logfile is not None:
-            parser = create_parser_from_logfile(config.repo_logfile)
-            reader.set_logfile(config.repo_logfile)
-        else:
-            parser = _get_parser_from_repository(repo)
-
-        parser.set_repository(repo, uri)
-
-        if parser is None:
-            printerr("Failed to create parser")
-            return 1
-
-        # TODO: check parser type == logfile type
-
-    db_exists = False
-
-    try:
-        printdbg("Creating database")
-        db = create_database(config.db_driver,
-                             config.db_database,
-                             config.db_user,
-                             config.db_password,
-                             config.db_hostname)
-    except AccessDenied, e:
-        printerr("Error creating database: %s", (e.message,))
-        return 1
-    except DatabaseNotFound:
-        printerr("Database %s doesn't exist. It must be created before " + \
-                 "running cvsanaly", (config.db_database,))
-        return 1
-    except DatabaseDriverNotSupported:
-        printerr("Database driver %s is not supported by cvsanaly",
-                 (config.db_driver,))
-        return 1
-
-    emg = _get_extensions_manager(config.extensions, config.hard_order)
-
-    cnn = db.connect()
-
-    if backout:
-        # Run extensions
-        #printout(str(get_all_extensions()))
-        printout("Backing out all extensions")
-        emg.backout_extensions(repo, path or uri, db)
-        printout("Backing out repo from database")
-        backout_handler = DBDeletionHandler(db, repo, uri, cnn)
-        backout_handler.begin()
-
-        # Final commit just in case
-        cnn.commit()
-        cnn.close()
-        return 1
-
-    cursor = cnn.cursor()
-
-    try:
-        printdbg("Creating tables")
-        db.create_tables(cursor)
-        cnn.commit()
-    except TableAlreadyExists:
-        printdbg("Tables not created, database already exists")
-        db_exists = True
-    except DatabaseException, e:
-        printerr("Database error: %s", (e.message,))
-        return 1
-
-    if config.no_parse and not db_exists:
-        printerr("The option --no-parse must be used with an already " + \
-                 "filled database")
-        return 1
+    # No more processes than repositories
+    config.jobs = min(config.jobs, len(uris))
 
-    # Add repository to Database
-    if db_exists:
-        printdbg("Database exists, so looking for existing repository")
-        cursor.execute(statement("SELECT id from repositories where uri = ?",
-                                 db.place_holder), (uri,))
-        rep = cursor.fetchone()
-        initialize_ids(db, cursor)
-        cursor.close()
+    if len(uris) == 1:
+        return _analyze_repository(uris[0], config, backout)
 
-    if config.no_parse and rep is None:
-        printerr("The option --no-parse must be used with an already " + \
-                 "filled database")
+    if config.repo_logfile is not None or config.save_logfile is not None:
+        printerr("The options --repo-logfile and --save-logfile can't be " + \
+                 "used with several repositories")
         return 1
 
-    if not db_exists or rep is None:
-        # We consider the name of the repo as the last item of the root path
-        name = uri.rstrip("/").split("/")[-1].strip()
-        cursor = cnn.cursor()
-        rep = DBRepository(None, uri, name, repo.get_type())
-        cursor.execute(statement(DBRepository.__insert__, db.place_holder),
-                       (rep.id, rep.uri, rep.name, rep.type))
-        cursor.close()
-        cnn.commit()
-
-    cnn.close()
-
-    if not config.no_parse:
-        _parse_log(path or uri, repo, parser, reader, config, db)
-
-    # Run extensions
-    printout("Executing extensions")
-    emg.run_extensions(repo, path or uri, db)
+    return _analyze_repositories(uris, config, backout)
 
@@ -87,6 +87,69 @@ def get_repo_uri(uri, repo):
         return uri
 
 
+# Compressed log files are detected by their magic number
+# when reading and by their extension when writing
+_compression_formats = [('gzip', '\x1f\x8b', '.gz'),
+                        ('bz2', 'BZh', '.bz2'),
+                        ('xz', '\xfd7zXZ\x00', '.xz')]
+
+
+def logfile_compression(filename, mode='r'):
+    """Returns the compression format of the given log file
+    (gzip, bz2 or xz) or None if it's not compressed.
+    """
+    if mode.startswith('r'):
+        f = open(filename, 'rb')
+        magic = f.read(6)
+        f.close()
+
+        for format, format_magic, ext in _compression_formats:
+            if magic.startswith(format_magic):
+                return format
+    else:
+        for format, format_magic, ext in _compression_formats:
+            if filename.endswith(ext):
+                return format
+
+    return None
+
+
+def open_logfile(filename, mode='r'):
+    """Opens a log file, transparently (de)compressing it if needed.
+
+    >>> import tempfile, gzip
+    >>> path = tempfile.mktemp(suffix='.gz')
+    >>> f = open_logfile(path, 'w')
+    >>> f.writelines(["commit 1\\n"])
+    >>> f.close()
+    >>> gzip.open(path).read()
+    'commit 1\\n'
+    >>> open_logfile(path).readline()
+    'commit 1\\n'
+    >>> os.remove(path)
+    """
+    format = logfile_compression(filename, mode)
+
+    if format == 'gzip':
+        import gzip
+        return gzip.open(filename, mode + 'b')
+    elif format == 'bz2':
+        import bz2
+        return bz2.BZ2File(filename, mode)
+    elif format == 'xz':
+        try:
+            import lzma
+        except ImportError:
+            try:
+                from backports import lzma
+            except ImportError:
+                raise IOError("Module lzma is required to handle xz " + \
+                              "compressed log file %s" % (filename,))
+        return lzma.LZMAFile(filename, mode)
+
+    return open(filename, mode)
+
+
 def printout(str='\n', args=None):
     if config.quiet:
         return